@@ -0,0 +1,209 @@
+"""
+Anti-Flood Module for Telegram Moderation Bot
+
+This module watches the message rate of every group and reacts on its own:
+- Sliding-window counters per (chat, user) and per chat, O(1) per message
+- Bounded memory: idle counters are evicted, and there is a hard key cap
+- A user over FLOOD_USER_MAX messages per window is muted for a while
+- A chat over FLOOD_CHAT_MAX messages per window gets slow mode for a while
+
+Counting runs synchronously inside the router's single message handler and
+only starts a task when a threshold is crossed, so command handling is not
+delayed. Restrictions go through moderation.auto_moderate (i.e. the same
+moderate_target/EditBannedRequest path admins use) and are audited.
+
+Author: Divyansh Shakya
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+from telethon.tl.functions.channels import ToggleSlowModeRequest
+from utils import logger, ExpiringSet, start_rpc_count, set_log_context, format_duration
+from metrics import antiflood_triggers
+from moderation import auto_moderate
+from security import get_bot_user, check_user_admin_status
+from audit import log_moderation_action
+from expiry import expiry_scheduler
+from outbox import send_request, send_message
+from catchup import event_age
+from config import (
+    FLOOD_WINDOW, FLOOD_USER_MAX, FLOOD_CHAT_MAX, FLOOD_MAX_KEYS, FLOOD_MUTE_SECONDS,
+    FLOOD_SLOWMODE_SECONDS, FLOOD_SLOWMODE_DURATION, FLOOD_ACTION_COOLDOWN, MUTE_RIGHTS
+)
+
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding-window event counts keyed by arbitrary hashable keys.
+
+    Each key keeps only the counts of the current and the previous fixed
+    window; the sliding count weights the previous window by how much of it
+    still overlaps. That is O(1) time and memory per key with an error that
+    only matters at the window edge. Counters are kept in least-recently-used
+    order: one untouched for two windows counts nothing and is dropped, and
+    the oldest are evicted once `max_keys` is exceeded.
+
+    Args:
+        window (float): Window length in seconds
+        max_keys (int): Hard cap on tracked keys
+    """
+
+    def __init__(self, window, max_keys):
+        self.window = window
+        self.max_keys = max_keys
+        self._counts = OrderedDict()  # key -> (window_index, previous_count, current_count)
+
+    def hit(self, key, now):
+        """
+        Count one event for key.
+
+        Returns:
+            float: Events for key in the last `window` seconds, this one included
+        """
+        position = now / self.window
+        index = int(position)
+        counts = self._counts
+        entry = counts.get(key)
+        if entry is None:
+            previous, current = 0, 1
+        elif entry[0] == index:
+            previous, current = entry[1], entry[2] + 1
+        else:
+            previous, current = (entry[2] if entry[0] == index - 1 else 0), 1
+        # Tuples of ints are untracked by the garbage collector, lists are not
+        counts[key] = (index, previous, current)
+        counts.move_to_end(key)
+        self._evict(index)
+        return previous * (1 - (position - index)) + current
+
+    def _evict(self, index):
+        counts = self._counts
+        while counts:
+            entry = counts[next(iter(counts))]
+            if len(counts) <= self.max_keys and entry[0] >= index - 1:
+                break
+            counts.popitem(last=False)
+
+    def dump(self):
+        """
+        Counters for a snapshot, with window indexes relative to the current one.
+
+        Returns:
+            list: (key, window offset, previous count, current count), least recent first
+        """
+        index = int(time.monotonic() / self.window)
+        return [(key, entry[0] - index, entry[1], entry[2]) for key, entry in self._counts.items()]
+
+    def load(self, entries, elapsed=0.0):
+        """
+        Restore counters saved by dump(), shifted by the time passed since.
+
+        Args:
+            entries (list): Output of dump()
+            elapsed (float): Seconds since the snapshot was taken
+        """
+        now = time.monotonic()
+        index = int((now - elapsed) / self.window)
+        for key, offset, previous, current in entries:
+            self._counts[key] = (index + offset, previous, current)
+            self._counts.move_to_end(key)
+        self._evict(int(now / self.window))
+
+    def __len__(self):
+        return len(self._counts)
+
+
+# Message rate per (chat, user) and per chat
+user_message_rates = SlidingWindowCounter(FLOOD_WINDOW, FLOOD_MAX_KEYS)
+chat_message_rates = SlidingWindowCounter(FLOOD_WINDOW, FLOOD_MAX_KEYS)
+
+# Chats/users recently acted on, so a flood triggers one action, not one per message
+recent_flood_actions = ExpiringSet(FLOOD_ACTION_COOLDOWN, FLOOD_MAX_KEYS)
+
+flood_stats = {'messages': 0, 'user_floods': 0, 'chat_floods': 0}
+
+
+def watch_message(client, event):
+    """
+    Count one message and start a restriction if a threshold is crossed.
+
+    Called by the router for every incoming message; must stay cheap.
+
+    Args:
+        client: Telethon client instance
+        event: NewMessage event
+    """
+    if event.is_private or not event.sender_id:
+        return
+    # Late messages (the backlog after downtime) arrive in a burst that is not a flood
+    if event_age(event) > FLOOD_WINDOW:
+        return
+    flood_stats['messages'] += 1
+    now = time.monotonic()
+    chat_id = event.chat_id
+
+    if (FLOOD_USER_MAX and user_message_rates.hit((chat_id, event.sender_id), now) > FLOOD_USER_MAX
+            and recent_flood_actions.add(('user', chat_id, event.sender_id))):
+        flood_stats['user_floods'] += 1
+        antiflood_triggers.inc('user')
+        asyncio.create_task(mute_flooder(client, event))
+
+    if (FLOOD_CHAT_MAX and chat_message_rates.hit(chat_id, now) > FLOOD_CHAT_MAX
+            and recent_flood_actions.add(('chat', chat_id))):
+        flood_stats['chat_floods'] += 1
+        antiflood_triggers.inc('chat')
+        asyncio.create_task(slow_down_chat(client, chat_id))
+
+
+async def mute_flooder(client, event):
+    """Mute a user who exceeded the per-user message rate."""
+    start_rpc_count()
+    set_log_context(chat_id=event.chat_id, user_id=event.sender_id, command='antiflood')
+    try:
+        # Admins are never muted; skip them quietly rather than audit a refusal
+        if await check_user_admin_status(client, event.chat_id, event.sender_id):
+            return
+        user = await event.get_sender() or await client.get_entity(event.sender_id)
+        await auto_moderate(client, event.chat_id, user, "muted", MUTE_RIGHTS, FLOOD_MUTE_SECONDS, "message flood")
+    except Exception as e:
+        logger.error(f"Anti-flood mute failed for {event.sender_id} in {event.chat_id}: {e}")
+
+
+async def slow_down_chat(client, chat_id):
+    """Turn on slow mode in a chat whose overall message rate is too high."""
+    if not FLOOD_SLOWMODE_SECONDS:
+        return
+    start_rpc_count()
+    set_log_context(chat_id=chat_id, command='antiflood')
+    try:
+        me = await get_bot_user(client)
+        await send_request(client, chat_id, ToggleSlowModeRequest(chat_id, FLOOD_SLOWMODE_SECONDS))
+        expiry_scheduler.schedule(chat_id, 0, 'slowmode', time.time() + FLOOD_SLOWMODE_DURATION)
+        log_moderation_action(me.id, 'antiflood', f"slow mode on for {format_duration(FLOOD_SLOWMODE_DURATION)}",
+                              None, 'the chat', chat_id)
+        await send_message(
+            client, chat_id,
+            f"🐢 Slow mode is on for {format_duration(FLOOD_SLOWMODE_DURATION)} - too many messages at once."
+        )
+    except Exception as e:
+        logger.error(f"Anti-flood slow mode failed in {chat_id}: {e}")
+
+
+def get_flood_stats():
+    """
+    Get anti-flood counters and how many counters are held.
+
+    Returns:
+        dict: messages seen, floods acted on, tracked user/chat counters
+    """
+    return {
+        **flood_stats,
+        'user_counters': len(user_message_rates),
+        'chat_counters': len(chat_message_rates)
+    }
+
+
+def register_antiflood(client, router):
+    """Have the router pass every message to the flood detector."""
+    router.watch(lambda event: watch_message(client, event))
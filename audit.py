@@ -0,0 +1,258 @@
+"""
+Moderation Audit Module for Telegram Moderation Bot
+
+This module keeps the permanent audit trail of moderation actions:
+- Append-only SQLite store (WAL mode) indexed by chat, admin, target and time
+- Writes are buffered and flushed in batches off the event loop
+- A small in-memory tail per chat serves the common /logs request
+- Per-chat, paginated log queries for the /logs command, also run off the
+  event loop
+
+Author: Divyansh Shakya
+"""
+
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import defaultdict, deque
+from utils import logger
+from config import AUDIT_DB, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_TAIL_SIZE
+
+COLUMNS = ('timestamp', 'chat_id', 'admin_id', 'admin_name', 'action', 'target_id', 'target_name', 'success')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS moderation_log (
+    id          INTEGER PRIMARY KEY,
+    timestamp   REAL    NOT NULL,
+    chat_id     INTEGER NOT NULL,
+    admin_id    INTEGER,
+    admin_name  TEXT,
+    action      TEXT    NOT NULL,
+    target_id   INTEGER,
+    target_name TEXT,
+    success     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_chat   ON moderation_log (chat_id, id);
+CREATE INDEX IF NOT EXISTS idx_log_admin  ON moderation_log (admin_id, id);
+CREATE INDEX IF NOT EXISTS idx_log_target ON moderation_log (target_id, id);
+CREATE INDEX IF NOT EXISTS idx_log_time   ON moderation_log (timestamp);
+"""
+
+
+class ModerationAuditStore:
+    """
+    Append-only, indexed on-disk store for moderation actions.
+
+    Entries are buffered in memory and written in one transaction per batch
+    from a worker thread, either when AUDIT_BATCH_SIZE entries are pending
+    (the background flusher is woken) or every AUDIT_FLUSH_INTERVAL seconds.
+    The most recent entries of each chat are also kept in memory so /logs
+    rarely needs to touch the disk.
+
+    Args:
+        path (str): SQLite database file
+        batch_size (int): Pending entries that trigger a flush
+        tail_size (int): Entries kept in memory per chat
+    """
+
+    def __init__(self, path, batch_size, tail_size):
+        self.path = path
+        self.batch_size = batch_size
+        self.tail_size = tail_size
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._tails = defaultdict(lambda: deque(maxlen=self.tail_size))
+        self._flusher = None
+        self._batch_full = asyncio.Event()
+        self._write_order = asyncio.Lock()  # Batches reach the disk in the order they were taken
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def append(self, entry):
+        """Record one entry (a dict with the COLUMNS keys)."""
+        self._pending.append(entry)
+        self._tails[entry['chat_id']].append(entry)
+        if len(self._pending) >= self.batch_size:
+            if self._flusher is not None:
+                self._batch_full.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """Write all pending entries in a single transaction, blocking."""
+        batch, self._pending = self._pending, []
+        if batch and not self._write(batch):
+            # Keep the entries for the next attempt rather than losing them
+            self._pending = batch + self._pending
+
+    def _write(self, batch):
+        rows = [tuple(entry[column] for column in COLUMNS) for entry in batch]
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO moderation_log ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                        rows
+                    )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to write moderation audit batch: {e}")
+            return False
+
+    async def flush_async(self):
+        """Write all pending entries from a worker thread."""
+        async with self._write_order:
+            # Take the batch on the loop thread, write it on a worker thread
+            batch, self._pending = self._pending, []
+            if batch and not await asyncio.to_thread(self._write, batch):
+                self._pending = batch + self._pending
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), AUDIT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            await self.flush_async()
+
+    def start(self):
+        """Start the background flusher (call from the running event loop)."""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    def close(self):
+        """Stop the flusher, write what is pending and close the database."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def query(self, chat_id=None, admin_id=None, target_id=None, since=None, limit=5, offset=0):
+        """
+        Fetch entries newest first, filtered by any combination of fields.
+
+        Pending entries are written and the database is read from a worker
+        thread.
+
+        Returns:
+            list: Entry dictionaries
+        """
+        # Serve the first page of a chat straight from memory when possible
+        tail = self._tails.get(chat_id) if chat_id is not None else None
+        if (tail is not None and admin_id is None and target_id is None and since is None
+                and offset + limit <= len(tail)):
+            return list(reversed(tail))[offset:offset + limit]
+
+        await self.flush_async()
+        return await asyncio.to_thread(self._select, chat_id, admin_id, target_id, since, limit, offset)
+
+    def _select(self, chat_id, admin_id, target_id, since, limit, offset):
+        clauses, params = [], []
+        for column, value in (('chat_id', chat_id), ('admin_id', admin_id), ('target_id', target_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            cursor = self._connect().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM moderation_log {where} "
+                f"ORDER BY id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            )
+            rows = cursor.fetchall()
+        return [dict(zip(COLUMNS, row), success=bool(row[-1])) for row in rows]
+
+
+# Shared audit store
+audit_store = ModerationAuditStore(AUDIT_DB, AUDIT_BATCH_SIZE, AUDIT_TAIL_SIZE)
+
+
+def log_moderation_action(admin_id, admin_name, action, target_id, target_name, chat_id, success=True):
+    """
+    Log all moderation actions for audit trail.
+
+    Records every moderation action (ban, mute, kick, etc.) with details
+    including who performed it, on whom, and whether it succeeded.
+
+    Args:
+        admin_id (int): ID of admin who performed the action
+        admin_name (str): Username or name of the admin
+        action (str): Type of action (banned, muted, kicked, etc.)
+        target_id (int): ID of user who was moderated
+        target_name (str): Username or name of target user
+        chat_id (int): Group/chat where action was performed
+        success (bool): Whether the action succeeded (default: True)
+    """
+    log_entry = {
+        'timestamp': time.time(),
+        'admin_id': admin_id,
+        'admin_name': admin_name,
+        'action': action,
+        'target_id': target_id,
+        'target_name': target_name,
+        'chat_id': chat_id,
+        'success': success
+    }
+    audit_store.append(log_entry)
+    status = 'SUCCESS' if success else 'FAILED'
+    logger.info(f"MODERATION: {admin_name} ({admin_id}) {action} {target_name} ({target_id}) in {chat_id} - {status}")
+
+async def get_recent_logs(chat_id, count=5, page=1):
+    """
+    Get recent moderation logs for one chat.
+
+    Used by the /logs command to display recent activity, newest first.
+
+    Args:
+        chat_id (int): Chat whose actions to return
+        count (int): Entries per page (default: 5)
+        page (int): 1-based page number (default: 1)
+
+    Returns:
+        list: List of log entries (dictionaries)
+    """
+    return await audit_store.query(chat_id=chat_id, limit=count, offset=(page - 1) * count)
+
+def format_log_text(logs, page=1):
+    """
+    Format logs for display in Telegram.
+
+    Converts log entries into a formatted string suitable for
+    sending as a message in Telegram.
+
+    Args:
+        logs (list): List of log entry dictionaries
+        page (int): Page number shown in the header
+
+    Returns:
+        str: Formatted log text with emojis and timestamps
+    """
+    if not logs:
+        return "📋 No moderation actions logged yet." if page == 1 else f"📋 No moderation actions on page {page}."
+
+    log_text = "📋 **Recent Moderation Actions:**\n\n" if page == 1 else f"📋 **Moderation Actions (page {page}):**\n\n"
+    for log in logs:
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(log['timestamp']))
+        status = "✅" if log['success'] else "❌"
+        log_text += f"{status} `{timestamp}` - {log['admin_name']} {log['action']} {log['target_name']}\n"
+
+    return log_text
@@ -0,0 +1,543 @@
+"""
+Offline Benchmarks for Telegram Moderation Bot
+
+Drives synthetic workloads through the real handlers (register_handlers,
+the command router, the ChatAction pipeline, the outbox) using the fake
+client in fake_client.py, and reports:
+- Events per second and the time to drain everything queued for sending
+- End-to-end latency percentiles per command / event kind
+- RPCs per handler call (from the profiling samples) and RPCs by method
+- Peak memory (RSS, plus the Python heap with --tracemalloc)
+
+Workloads:
+- firehose: ordinary chat messages across all chats (the router's fast path)
+- raid: a join wave into a few chats, with replayed duplicates, then leaves
+- commands: a burst of moderation and info commands from admins and members
+- flood: normal chatter with spammers bursting in a few chats (anti-flood)
+- spamwave: normal chatter with bots posting mutated copies of a few spam
+  texts across all chats (duplicate spam detection)
+- backlog: the updates missed during an hour offline, delivered at once on
+  reconnect (joins, leaves, commands and chatter dated across the hour)
+
+Each workload runs in a fresh interpreter inside a temporary directory, so
+module-level caches start cold and bot.log / the audit database never touch
+the repository. Runs are seeded; save them with --json and compare a later
+commit against them with --baseline.
+
+Usage:
+    python benchmarks/bench.py
+    python benchmarks/bench.py --workload commands --latency 0.05
+    python benchmarks/bench.py --json before.json
+    python benchmarks/bench.py --baseline before.json
+
+Author: Divyansh Shakya
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+DEFAULT_SIZES = {'firehose': 20000, 'raid': 2000, 'commands': 500, 'flood': 5000, 'spamwave': 20000, 'backlog': 5000}
+
+# Weighted command mix for the commands workload
+COMMAND_MIX = (
+    ('ban', 15), ('mute', 15), ('unmute', 10), ('unban', 10), ('kick', 10),
+    ('uinfo', 15), ('help', 10), ('status', 5), ('logs', 5), ('welcome', 5),
+)
+TARGETED = {'ban', 'mute', 'unmute', 'unban', 'kick', 'uinfo', 'welcome'}
+
+# Options forwarded from the parent to each workload process
+SHARED_OPTIONS = (
+    'size', 'chats', 'users', 'admins', 'latency', 'flood_rate', 'flood_seconds',
+    'seed', 'rate', 'welcome_window', 'real_pacing', 'log_level', 'tracemalloc', 'workers',
+    'state',
+)
+
+
+# --- Workloads: each returns a list of (label, event) ---
+
+def firehose_workload(client, world, rng, size):
+    """Plain chat messages, with a few unknown /commands mixed in."""
+    from fake_client import FakeMessageEvent
+    workload = []
+    for n in range(size):
+        chat_id = world.chat_id(rng.randrange(world.chat_count))
+        sender = world.regular_user(rng.randrange(world.user_count))
+        if rng.random() < 0.03:
+            workload.append(('unknown_command', FakeMessageEvent(client, chat_id, sender, f"/notacommand {n}")))
+        else:
+            workload.append(('message', FakeMessageEvent(client, chat_id, sender, f"hello everyone, message {n}")))
+    return workload
+
+
+def raid_workload(client, world, rng, size):
+    """A join wave into a few chats (10% replayed duplicates), then some leaves."""
+    from fake_client import FakeChatActionEvent
+    raided = [world.chat_id(k) for k in range(min(5, world.chat_count))]
+    workload = []
+    joins = []
+    for n in range(size):
+        if joins and rng.random() < 0.1:
+            chat_id, user_id = rng.choice(joins)
+        else:
+            chat_id, user_id = rng.choice(raided), world.regular_user(n)
+            joins.append((chat_id, user_id))
+        workload.append(('join', FakeChatActionEvent(client, chat_id, [user_id], joined=True)))
+    for chat_id, user_id in rng.sample(joins, min(len(joins), size // 10)):
+        workload.append(('leave', FakeChatActionEvent(client, chat_id, [user_id], joined=False)))
+    return workload
+
+
+def commands_workload(client, world, rng, size):
+    """A burst of commands; mostly from admins, some denied, some bad targets."""
+    from fake_client import FakeMessageEvent
+    names, weights = zip(*COMMAND_MIX)
+    workload = []
+    for n in range(size):
+        k = rng.randrange(world.chat_count)
+        chat_id = world.chat_id(k)
+        admins = world.admins_of(k)
+        name = rng.choices(names, weights)[0]
+        sender = rng.choice(admins) if rng.random() < 0.9 else world.regular_user(rng.randrange(world.user_count))
+
+        text, reply_to_sender = f"/{name}", None
+        if name in TARGETED:
+            roll = rng.random()
+            if roll < 0.05:
+                target = f"@ghost{n}"
+            elif roll < 0.10:
+                target = f"@user{rng.choice(admins)}"
+            else:
+                target = f"@user{world.regular_user(rng.randrange(world.user_count))}"
+            if name in ('welcome', 'uinfo') or rng.random() < 0.7:
+                text = f"/{name} {target}"
+            else:
+                reply_to_sender = world.regular_user(rng.randrange(world.user_count))
+        workload.append((name, FakeMessageEvent(client, chat_id, sender, text, reply_to_sender)))
+    return workload
+
+
+def flood_workload(client, world, rng, size):
+    """Chatter across all chats; a fifth of the messages come from 20 spammers in 5 chats."""
+    from fake_client import FakeMessageEvent
+    spammers = [(world.chat_id(k % min(5, world.chat_count)), world.regular_user(k)) for k in range(20)]
+    workload = []
+    for n in range(size):
+        if rng.random() < 0.2:
+            chat_id, sender = rng.choice(spammers)
+            workload.append(('spam', FakeMessageEvent(client, chat_id, sender, f"BUY NOW {n}")))
+        else:
+            chat_id = world.chat_id(rng.randrange(world.chat_count))
+            sender = world.regular_user(20 + rng.randrange(world.user_count - 20))
+            workload.append(('message', FakeMessageEvent(client, chat_id, sender, f"hello everyone, message {n}")))
+    return workload
+
+
+SPAM_TEMPLATES = (
+    "Earn {n}$ per day from home with our crypto signals, join now before the offer ends",
+    "Hot singles in your area are waiting for you, click the link in my profile {n}",
+    "Free airdrop for the first {n} members, connect your wallet on our official site today",
+)
+CHAT_WORDS = (
+    'the', 'meeting', 'tomorrow', 'anyone', 'know', 'how', 'to', 'fix', 'this', 'error', 'thanks',
+    'great', 'idea', 'release', 'today', 'check', 'docs', 'please', 'works', 'for', 'me', 'now',
+)
+
+
+def spamwave_workload(client, world, rng, size):
+    """Varied chatter across all chats; a tenth of the messages are mutated spam from 30 bots."""
+    from fake_client import FakeMessageEvent
+    bots = [world.regular_user(k) for k in range(30)]
+    workload = []
+    for n in range(size):
+        chat_id = world.chat_id(rng.randrange(world.chat_count))
+        if rng.random() < 0.1:
+            text = rng.choice(SPAM_TEMPLATES).format(n=rng.randrange(1000))
+            if rng.random() < 0.5:
+                text = text.upper() + rng.choice(('', ' 🔥', '!!', ' ✅✅'))
+            workload.append(('spam', FakeMessageEvent(client, chat_id, rng.choice(bots), text)))
+        else:
+            sender = world.regular_user(30 + rng.randrange(world.user_count - 30))
+            text = ' '.join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(3, 20)))
+            workload.append(('message', FakeMessageEvent(client, chat_id, sender, text)))
+    return workload
+
+
+def backlog_workload(client, world, rng, size):
+    """An hour of missed updates: joins, leaves, commands and chatter, oldest first."""
+    from fake_client import FakeMessageEvent, FakeChatActionEvent
+    now = datetime.now(timezone.utc)
+    ages = sorted((rng.uniform(0, 3600) for _ in range(size)), reverse=True)
+    workload = []
+    for n, age in enumerate(ages):
+        date = now - timedelta(seconds=age)
+        k = rng.randrange(world.chat_count)
+        chat_id = world.chat_id(k)
+        roll = rng.random()
+        if roll < 0.4:
+            workload.append(('join', FakeChatActionEvent(client, chat_id, [world.regular_user(n)], True, date)))
+        elif roll < 0.45:
+            user_id = world.regular_user(rng.randrange(world.user_count))
+            workload.append(('leave', FakeChatActionEvent(client, chat_id, [user_id], False, date)))
+        elif roll < 0.5:
+            text = rng.choice(('/help', '/status', f"/uinfo @user{world.regular_user(rng.randrange(world.user_count))}"))
+            workload.append(('command', FakeMessageEvent(client, chat_id, rng.choice(world.admins_of(k)), text, date=date)))
+        else:
+            sender = world.regular_user(rng.randrange(world.user_count))
+            workload.append(('message', FakeMessageEvent(client, chat_id, sender, f"hello everyone, message {n}", date=date)))
+    return workload
+
+
+WORKLOADS = {
+    'firehose': firehose_workload,
+    'raid': raid_workload,
+    'commands': commands_workload,
+    'flood': flood_workload,
+    'spamwave': spamwave_workload,
+    'backlog': backlog_workload,
+}
+
+
+# --- Measurement helpers ---
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(values):
+    """Count and p50/p95/p99/max of a list of seconds, in milliseconds."""
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50) * 1000,
+        'p95': percentile(values, 0.95) * 1000,
+        'p99': percentile(values, 0.99) * 1000,
+        'max': (values[-1] if values else 0.0) * 1000,
+    }
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+async def wait_until_drained(client, timeout=120):
+    """Wait until nothing is queued, batched or in flight, and stays that way."""
+    import welcome
+    from outbox import outbox
+    from pipeline import analysis_pipeline
+    deadline = time.monotonic() + timeout
+    quiet = 0
+    while quiet < 3 and time.monotonic() < deadline:
+        stats = outbox.get_stats()
+        if stats['chats'] or welcome.pending_welcomes or client.in_flight or analysis_pipeline.pending:
+            quiet = 0
+        else:
+            quiet += 1
+        await asyncio.sleep(0.01)
+
+
+# --- Workload process ---
+
+def run_workload(args):
+    """Run one workload in this process and write its results to args.out."""
+    os.environ.setdefault('API_ID', '0')
+    os.environ.setdefault('API_HASH', 'bench')
+    os.environ.setdefault('BOT_TOKEN', 'bench')
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+
+    import utils
+    import welcome
+    import profiling
+    from outbox import outbox
+    from audit import audit_store
+    from commands import register_handlers
+    from security import get_rate_limit_stats
+    from antiflood import get_flood_stats
+    from duplicates import get_duplicate_stats
+    from usercache import user_cache
+    from coalesce import coalesce_client, get_coalesce_stats
+    from pipeline import analysis_pipeline
+    from catchup import catch_up
+    import state
+    from fake_client import FakeWorld, FakeClient
+
+    utils.logger.setLevel(args.log_level)
+    profiling.PERF_SAMPLE_SIZE = 10 ** 6
+    welcome.WELCOME_IMAGE = os.path.join(REPO_ROOT, 'Welc.jpeg')
+    welcome.WELCOME_COALESCE_WINDOW = args.welcome_window
+    welcome.WELCOME_MIN_INTERVAL = args.welcome_window
+    analysis_pipeline.workers = args.workers
+    analysis_pipeline.start()
+    if not args.real_pacing:
+        # Measure the bot, not the pacing configured to keep Telegram happy
+        outbox.chat_interval = 0
+        outbox.global_interval = 0
+
+    async def main():
+        rng = random.Random(args.seed)
+        world = FakeWorld(args.chats, args.users, args.admins)
+        client = FakeClient(world, args.latency, args.flood_rate, args.flood_seconds, args.seed)
+        utils.instrument_client(client)
+        coalesce_client(client)
+        if args.state == 'redis':
+            # The Redis-protocol stand-in, served from this same event loop
+            from fake_redis import serve
+            redis_server, _, port = await serve()
+            state.use_backend(state.RedisBackend(f"redis://127.0.0.1:{port}/0", state.STATE_KEY_PREFIX))
+        elif args.state != 'memory':
+            state.use_backend(state.create_backend(args.state))
+        await register_handlers(client)
+        audit_store.start()
+        catch_up.start()
+
+        workload = WORKLOADS[args.child](client, world, rng, args.size)
+        latencies = defaultdict(list)
+        tasks = []
+
+        def record(label, event, task):
+            latencies[label].append(time.perf_counter() - event.received)
+
+        started = time.perf_counter()
+        for index, (label, event) in enumerate(workload):
+            if args.rate:
+                delay = started + index / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif index % 200 == 0:
+                await asyncio.sleep(0)
+            for task in client.feed(event):
+                task.add_done_callback(lambda task, label=label, event=event: record(label, event, task))
+                tasks.append(task)
+        await asyncio.gather(*tasks)
+        handled = time.perf_counter() - started
+        await wait_until_drained(client)
+        drained = time.perf_counter() - started
+        audit_store.close()
+        user_cache.close()
+        analysis_pipeline.close()
+        catch_up.close()
+        await state.get_state().close()
+        if args.state == 'redis':
+            redis_server.close()
+
+        handlers = {}
+        for name, samples in profiling.handler_samples.items():
+            summary = summarize([sample[0] for sample in samples])
+            summary['rpcs_per_call'] = sum(sample[1] for sample in samples) / len(samples) if samples else 0.0
+            handlers[name] = summary
+
+        return {
+            'events': len(workload),
+            'handled_seconds': handled,
+            'drained_seconds': drained,
+            'events_per_sec': len(workload) / handled if handled else 0.0,
+            'latency_ms': {label: summarize(values) for label, values in sorted(latencies.items())},
+            'handlers_ms': dict(sorted(handlers.items())),
+            'rpcs': dict(sorted(client.calls.items())),
+            'rpcs_total': sum(client.calls.values()),
+            'outbox': outbox.get_stats(),
+            'rate_limit': get_rate_limit_stats(),
+            'antiflood': get_flood_stats(),
+            'duplicates': get_duplicate_stats(),
+            'user_cache': user_cache.get_stats(),
+            'coalesce': get_coalesce_stats(),
+            'pipeline': analysis_pipeline.get_stats(),
+            'catch_up': catch_up.get_stats(),
+        }
+
+    result = asyncio.run(main())
+    result['peak_rss_kb'] = peak_rss_kb()
+    if args.tracemalloc:
+        result['tracemalloc_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+    utils.stop_logging()
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- Parent process: run workloads and report ---
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _delta(value, old):
+    if old is None or not old:
+        return ''
+    return f" ({(value - old) / old * 100:+.1f}%)"
+
+
+def print_report(results, baseline=None):
+    print(f"commit {results['commit']}  python {results['python']}  params {json.dumps(results['params'])}")
+    if baseline:
+        print(f"baseline: commit {baseline.get('commit')}")
+
+    for name, result in results['workloads'].items():
+        old = (baseline or {}).get('workloads', {}).get(name, {})
+        rss = result['peak_rss_kb']
+        print(f"\n== {name}: {result['events']} events in {result['handled_seconds']:.3f}s, "
+              f"{result['events_per_sec']:.1f} events/s{_delta(result['events_per_sec'], old.get('events_per_sec'))}, "
+              f"drained in {result['drained_seconds']:.3f}s")
+        memory = f"   peak RSS {rss / 1024:.1f} MB" if rss is not None else "   peak RSS n/a"
+        if 'tracemalloc_peak_kb' in result:
+            memory += f", Python heap peak {result['tracemalloc_peak_kb'] / 1024:.1f} MB"
+        print(memory)
+
+        print(f"   {'latency (ms)':<16}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        old_latency = old.get('latency_ms', {})
+        for label, stats in result['latency_ms'].items():
+            p95_delta = _delta(stats['p95'], old_latency.get(label, {}).get('p95'))
+            print(f"   {label:<16}{stats['count']:>7}{stats['p50']:>9.2f}{stats['p95']:>9.2f}"
+                  f"{stats['p99']:>9.2f}{stats['max']:>9.2f}{p95_delta}")
+
+        if result['handlers_ms']:
+            old_handlers = old.get('handlers_ms', {})
+            per_call = ', '.join(
+                f"{handler} {stats['rpcs_per_call']:.2f}"
+                f"{_delta(stats['rpcs_per_call'], old_handlers.get(handler, {}).get('rpcs_per_call'))}"
+                for handler, stats in result['handlers_ms'].items()
+            )
+            print(f"   RPCs per call: {per_call}")
+        methods = ', '.join(f"{method} {count}" for method, count in result['rpcs'].items())
+        print(f"   RPCs total {result['rpcs_total']}{_delta(result['rpcs_total'], old.get('rpcs_total'))}: {methods or 'none'}")
+        outbox = result['outbox']
+        print(f"   outbox sent {outbox['sent']}, merged {outbox['merged']}, dropped {outbox['dropped']}, "
+              f"flood waits {outbox['flood_waits']}; rate-limit denials "
+              f"{result['rate_limit']['denied_user'] + result['rate_limit']['denied_chat']}")
+        flood = result.get('antiflood')
+        if flood:
+            print(f"   anti-flood: {flood['user_floods']} user flood(s), {flood['chat_floods']} chat flood(s), "
+                  f"{flood['user_counters']} user / {flood['chat_counters']} chat counters held")
+        duplicates = result.get('duplicates')
+        if duplicates and duplicates['fingerprinted']:
+            print(f"   duplicates: {duplicates['flagged']} flagged of {duplicates['fingerprinted']} fingerprinted, "
+                  f"{duplicates['fingerprints']} fingerprints held")
+        pipeline = result.get('pipeline')
+        if pipeline and pipeline['pool']:
+            print(f"   analysis workers: {pipeline['pool']} messages in {pipeline['workers']} workers, "
+                  f"{pipeline['loop']} in the loop ({pipeline['saturated']} under backpressure)")
+        coalesce = result.get('coalesce')
+        if coalesce and (coalesce['coalesced'] or coalesce['negative']):
+            print(f"   coalesced lookups: {coalesce['coalesced']} shared an in-flight RPC, "
+                  f"{coalesce['negative']} answered from the non-participant cache")
+        catching_up = result.get('catch_up')
+        if catching_up and catching_up['missed']:
+            print(f"   catch-up: {catching_up['missed']} missed updates, discarded {catching_up['join']} stale joins, "
+                  f"{catching_up['leave']} leaves and {catching_up['command']} commands")
+        usernames = result.get('user_cache')
+        if usernames and (usernames['memory'] or usernames['index'] or usernames['miss']):
+            print(f"   username cache: {usernames['memory']} memory / {usernames['index']} index hits, "
+                  f"{usernames['miss']} misses, {usernames['cached']} usernames held")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the moderation bot")
+    parser.add_argument('--workload', action='append', choices=sorted(WORKLOADS),
+                        help="Workload to run (repeatable; default: all)")
+    parser.add_argument('--size', type=int, help="Events per workload (default depends on the workload)")
+    parser.add_argument('--chats', type=int, default=50, help="Number of groups")
+    parser.add_argument('--users', type=int, default=5000, help="Number of regular members")
+    parser.add_argument('--admins', type=int, default=5, help="Admins per group, including the creator")
+    parser.add_argument('--latency', type=float, default=0.0, help="Mean simulated RPC latency in seconds")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="Probability of a FloodWait per write request")
+    parser.add_argument('--flood-seconds', type=int, default=1, help="Seconds demanded by injected FloodWaits")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for workloads, latency jitter and FloodWaits")
+    parser.add_argument('--rate', type=float, default=0.0, help="Arrival rate in events/s (default: as fast as possible)")
+    parser.add_argument('--welcome-window', type=float, default=0.05,
+                        help="Welcome coalescing window/min interval in seconds (shortened so raids drain quickly)")
+    parser.add_argument('--real-pacing', action='store_true', help="Keep the configured outbox pacing")
+    parser.add_argument('--log-level', default='INFO', help="Bot log level during the run (logs go to a temp dir)")
+    parser.add_argument('--workers', type=int, default=0, help="Message analysis worker processes (0 = in the loop)")
+    parser.add_argument('--state', default='memory', choices=('memory', 'sqlite', 'redis'),
+                        help="State backend for rate limits and join/leave dedupe (redis uses a local stand-in)")
+    parser.add_argument('--tracemalloc', action='store_true', help="Also report the Python heap peak (slower)")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Compare against results saved earlier with --json")
+    parser.add_argument('--verbose', action='store_true', help="Show the bot's console output")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.child:
+        run_workload(args)
+        return
+
+    params = {option: getattr(args, option) for option in SHARED_OPTIONS}
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'params': params,
+        'workloads': {},
+    }
+
+    for name in args.workload or sorted(WORKLOADS):
+        out = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+        command = [sys.executable, os.path.abspath(__file__), '--child', name, '--out', out]
+        for option in SHARED_OPTIONS:
+            value = getattr(args, option)
+            if option == 'size' and value is None:
+                value = DEFAULT_SIZES[name]
+            flag = '--' + option.replace('_', '-')
+            if isinstance(value, bool):
+                command += [flag] if value else []
+            else:
+                command += [flag, str(value)]
+        output = None if args.verbose else subprocess.DEVNULL
+        completed = subprocess.run(command, stdout=output, stderr=None if args.verbose else subprocess.PIPE)
+        if completed.returncode != 0:
+            sys.exit(f"Workload {name} failed:\n{(completed.stderr or b'').decode(errors='replace')}")
+        with open(out, encoding='utf-8') as f:
+            results['workloads'][name] = json.load(f)
+        os.remove(out)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
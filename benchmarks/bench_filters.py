@@ -0,0 +1,194 @@
+"""
+Content Filter Benchmarks for Telegram Moderation Bot
+
+Measures the compiled per-chat blocklist (filters.ChatFilter) against list
+sizes from 10 to 100k patterns, and reports for each size:
+- Build time: compiling the whole list into one matcher (done off the loop)
+- Incremental add: one more pattern through the delta matcher, i.e. what an
+  admin's /filter add costs on the event loop
+- Scan time per message, for clean messages and for messages with a hit
+- A naive loop testing every pattern, for comparison (skipped past 10k)
+- Python heap held by the compiled filter, with --tracemalloc
+
+Words and domains are random and seeded; messages mix ordinary words with
+a few URLs. Save results with --json and compare with --baseline.
+
+Usage:
+    python benchmarks/bench_filters.py
+    python benchmarks/bench_filters.py --sizes 10 1000 100000 --messages 5000
+
+Author: Divyansh Shakya
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import string
+import argparse
+import tempfile
+import platform
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+NAIVE_MAX_SIZE = 10000  # The naive loop is too slow to be worth timing past this
+
+
+def random_word(rng, low=4, high=12):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(low, high)))
+
+
+def make_patterns(rng, size):
+    """Blocklist of `size` patterns: 90% words, 10% domains."""
+    patterns = set()
+    while len(patterns) < size:
+        if rng.random() < 0.9:
+            patterns.add(('word', random_word(rng)))
+        else:
+            patterns.add(('domain', f"{random_word(rng, 3, 10)}.{rng.choice(('com', 'net', 'io', 'xyz'))}"))
+    return sorted(patterns)
+
+
+def make_messages(rng, count, patterns=None):
+    """Chat-like messages; with patterns, each one contains a blocked pattern."""
+    messages = []
+    for _ in range(count):
+        words = [random_word(rng, 2, 9) for _ in range(rng.randint(5, 30))]
+        if rng.random() < 0.1:
+            words.insert(rng.randrange(len(words)), f"https://{random_word(rng, 3, 8)}.org/{random_word(rng)}")
+        if patterns:
+            kind, value = rng.choice(patterns)
+            words.insert(rng.randrange(len(words)), f"https://www.{value}/x" if kind == 'domain' else value.upper())
+        messages.append(' '.join(words))
+    return messages
+
+
+def time_scans(chat_filter, messages):
+    started = time.perf_counter()
+    hits = sum(1 for message in messages if chat_filter.scan(message))
+    return (time.perf_counter() - started) / len(messages) * 1e6, hits
+
+
+def naive_scan_us(patterns, messages):
+    """Per-pattern loop: one substring test per pattern per message."""
+    values = [value for _, value in patterns]
+    started = time.perf_counter()
+    for message in messages:
+        lowered = message.lower()
+        any(value in lowered for value in values)
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+
+def bench_size(ChatFilter, size, args):
+    rng = random.Random(args.seed + size)
+    patterns = make_patterns(rng, size)
+    clean = make_messages(rng, args.messages)
+    dirty = make_messages(rng, max(1, args.messages // 10), patterns)
+
+    started = time.perf_counter()
+    chat_filter = ChatFilter(patterns)
+    build_seconds = time.perf_counter() - started
+
+    heap_kb = None
+    if args.tracemalloc:
+        # A second build, which the scans below then use: tracing would distort the build time above
+        import tracemalloc
+        tracemalloc.start()
+        chat_filter = ChatFilter(patterns)
+        heap_kb = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+
+    clean_us, false_hits = time_scans(chat_filter, clean)
+    dirty_us, hits = time_scans(chat_filter, dirty)
+
+    # One /filter add: the pattern lands in the delta, the next scan compiles it
+    started = time.perf_counter()
+    chat_filter.add('word', 'zzzincremental')
+    chat_filter.scan("nothing to see zzzincremental")
+    add_ms = (time.perf_counter() - started) * 1000
+
+    result = {
+        'patterns': size,
+        'build_seconds': build_seconds,
+        'add_ms': add_ms,
+        'scan_clean_us': clean_us,
+        'scan_hit_us': dirty_us,
+        'hit_rate': hits / len(dirty),
+        'false_hits': false_hits,
+        'naive_scan_us': naive_scan_us(patterns, clean) if size <= NAIVE_MAX_SIZE else None,
+    }
+    if heap_kb is not None:
+        result['heap_kb'] = heap_kb
+    return result
+
+
+def _delta(value, old):
+    if old is None or not old or value is None:
+        return ''
+    return f" ({(value - old) / old * 100:+.1f}%)"
+
+
+def print_report(results, baseline=None):
+    print(f"python {results['python']}  messages {results['messages']}")
+    if baseline:
+        print(f"baseline: python {baseline.get('python')}")
+    old_by_size = {row['patterns']: row for row in (baseline or {}).get('sizes', [])}
+    print(f"{'patterns':>9}{'build s':>10}{'add ms':>9}{'clean us':>10}{'hit us':>9}{'naive us':>10}{'heap MB':>9}")
+    for row in results['sizes']:
+        naive = f"{row['naive_scan_us']:>10.1f}" if row['naive_scan_us'] is not None else f"{'-':>10}"
+        heap = f"{row['heap_kb'] / 1024:>9.1f}" if 'heap_kb' in row else f"{'-':>9}"
+        old = old_by_size.get(row['patterns'], {})
+        print(f"{row['patterns']:>9}{row['build_seconds']:>10.3f}{row['add_ms']:>9.2f}{row['scan_clean_us']:>10.1f}"
+              f"{row['scan_hit_us']:>9.1f}{naive}{heap}{_delta(row['scan_clean_us'], old.get('scan_clean_us'))}")
+        if row['hit_rate'] < 1:
+            print(f"   ⚠️ only {row['hit_rate']:.1%} of messages with a blocked pattern were caught")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Content filter benchmarks for the moderation bot")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Blocklist sizes to test")
+    parser.add_argument('--messages', type=int, default=2000, help="Clean messages scanned per size")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for patterns and messages")
+    parser.add_argument('--tracemalloc', action='store_true', help="Also report the heap held by each filter")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Compare against results saved earlier with --json")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    os.environ.setdefault('API_ID', '0')
+    os.environ.setdefault('API_HASH', 'bench')
+    os.environ.setdefault('BOT_TOKEN', 'bench')
+    # Importing the bot opens bot.log in the working directory
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    import utils
+    from filters import ChatFilter
+
+    results = {'python': platform.python_version(), 'messages': args.messages, 'sizes': []}
+    try:
+        for size in args.sizes:
+            results['sizes'].append(bench_size(ChatFilter, size, args))
+    finally:
+        utils.stop_logging()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Session Storage Benchmarks for Telegram Moderation Bot
+
+Replays a join storm against Telethon's SQLite session and the buffered
+in-memory session (session.BufferedSession), making the same session
+calls the client makes while the bot welcomes new members:
+- Every join: the new user and the chat come back in request results
+  (process_entities) and the update state moves on (set_update_state)
+- Every --checkpoint seconds: Telethon's periodic save of its entity cache
+  and update states, followed by save()
+
+Joins are paced at --rate per second in an asyncio loop, and for each mode
+it reports the time session calls spend on the event loop (per call and
+for the checkpoints), the worst lag of a ticker task sharing the loop,
+disk writes, the time close() takes on disconnect and the time to load
+the session again at the next start.
+
+Usage:
+    python benchmarks/bench_session.py
+    python benchmarks/bench_session.py --joins 50000 --rate 5000 --flush-interval 5
+
+Author: Divyansh Shakya
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import datetime
+import argparse
+import tempfile
+import platform
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+MODES = ('sqlite', 'memory')
+TICK = 0.005  # Ticker period for measuring loop lag
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def make_storm(rng, joins, chats):
+    """Users joining random chats: (user, chat) pairs, all users new."""
+    from telethon.tl.types import User, Channel, ChatPhotoEmpty
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    channels = [Channel(id=1000000 + i, title=f"Group {i}", photo=ChatPhotoEmpty(), date=now,
+                        access_hash=rng.getrandbits(63), megagroup=True, username=f"group{i}")
+                for i in range(chats)]
+    storm = []
+    for i in range(joins):
+        user = User(id=5000000 + i, access_hash=rng.getrandbits(63), first_name=f"User {i}",
+                    username=f"user{i}" if rng.random() < 0.6 else None)
+        storm.append((user, rng.choice(channels)))
+    return channels, storm
+
+
+async def run_storm(session, channels, storm, args):
+    """Push the storm through a session; returns loop-side timings."""
+    from telethon.tl.types.updates import State
+    from telethon.tl.types.contacts import ResolvedPeer
+    from telethon.utils import get_input_peer
+
+    calls = []  # Seconds per join's session calls
+    checkpoints = []  # Seconds per periodic save
+    lags = []
+    stop = False
+
+    async def ticker():
+        while not stop:
+            expected = time.perf_counter() + TICK
+            await asyncio.sleep(TICK)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    ticking = asyncio.create_task(ticker())
+    pts = {channel.id: 1 for channel in channels}
+    recent = []
+    interval = 1 / args.rate
+    started = time.perf_counter()
+    next_checkpoint = started + args.checkpoint
+
+    for i, (user, channel) in enumerate(storm):
+        call_started = time.perf_counter()
+        # Result of looking the user up, then of sending the welcome
+        session.process_entities(ResolvedPeer(peer=None, chats=[channel], users=[user]))
+        session.process_entities(ResolvedPeer(peer=None, chats=[channel], users=[]))
+        pts[channel.id] += 1
+        session.set_update_state(channel.id, State(pts[channel.id], 0, datetime.datetime.now(tz=datetime.timezone.utc),
+                                                   0, 0))
+        calls.append(time.perf_counter() - call_started)
+        recent.append(user)
+
+        now = time.perf_counter()
+        if now >= next_checkpoint:
+            call_started = now
+            # Telethon's periodic save: the entity cache as input peers, every update state, then a commit
+            peers = [get_input_peer(entity) for entity in channels + recent[-args.entity_cache:]]
+            session.process_entities(ResolvedPeer(peer=None, chats=peers, users=[]))
+            for channel_id, value in pts.items():
+                session.set_update_state(channel_id, State(value, 0, datetime.datetime.now(tz=datetime.timezone.utc),
+                                                           0, 0))
+            session.save()
+            checkpoints.append(time.perf_counter() - call_started)
+            next_checkpoint = time.perf_counter() + args.checkpoint
+
+        # Pace the storm; sleep in steps so the ticker gets its turns
+        target = started + (i + 1) * interval
+        delay = target - time.perf_counter()
+        if delay > 0.001:
+            await asyncio.sleep(delay)
+        elif i % 100 == 0:
+            await asyncio.sleep(0)
+
+    storm_seconds = time.perf_counter() - started
+    stop = True
+    await ticking
+    return calls, checkpoints, lags, storm_seconds
+
+
+def bench_mode(mode, channels, storm, workdir, args):
+    from telethon.sessions import SQLiteSession
+    from session import BufferedSession, EXTENSION
+
+    name = os.path.join(workdir, mode)
+    if mode == 'sqlite':
+        session = SQLiteSession(name)
+        path = name + '.session'
+    else:
+        path = name + EXTENSION
+        session = BufferedSession(path, args.flush_interval)
+
+    async def run():
+        if mode == 'memory':
+            session.start()
+        return await run_storm(session, channels, storm, args)
+
+    calls, checkpoints, lags, storm_seconds = asyncio.run(run())
+
+    started = time.perf_counter()
+    session.close()
+    close_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if mode == 'sqlite':
+        reloaded = SQLiteSession(name)
+        entities = reloaded._execute('select count(*) from entities')[0]
+    else:
+        reloaded = BufferedSession(path, args.flush_interval)
+        entities = reloaded.get_stats()['entities']
+    load_ms = (time.perf_counter() - started) * 1000
+    reloaded.close()
+
+    result = {
+        'mode': mode,
+        'storm_seconds': storm_seconds,
+        'call_p50_us': percentile(calls, 0.5) * 1e6,
+        'call_p99_us': percentile(calls, 0.99) * 1e6,
+        'call_max_ms': max(calls) * 1000,
+        'loop_seconds': sum(calls) + sum(checkpoints),
+        'checkpoint_max_ms': max(checkpoints, default=0.0) * 1000,
+        'lag_p99_ms': percentile(lags, 0.99) * 1000,
+        'lag_max_ms': max(lags, default=0.0) * 1000,
+        'close_ms': close_ms,
+        'file_kb': os.path.getsize(path) / 1024,
+        'load_ms': load_ms,
+        'entities': entities,
+    }
+    if mode == 'memory':
+        result['flushes'] = session.get_stats()['flushes']
+    return result
+
+
+def print_report(results):
+    print(f"python {results['python']}  joins {results['joins']} at {results['rate']}/s "
+          f"into {results['chats']} chats  checkpoint every {results['checkpoint']}s")
+    print(f"{'mode':>7}{'call p50 us':>12}{'p99 us':>9}{'max ms':>9}{'loop s':>9}{'ckpt ms':>9}"
+          f"{'lag p99':>9}{'lag max':>9}{'close ms':>10}{'file KB':>9}{'load ms':>9}{'entities':>10}")
+    for row in results['modes']:
+        print(f"{row['mode']:>7}{row['call_p50_us']:>12.1f}{row['call_p99_us']:>9.1f}{row['call_max_ms']:>9.2f}"
+              f"{row['loop_seconds']:>9.3f}{row['checkpoint_max_ms']:>9.2f}{row['lag_p99_ms']:>9.2f}"
+              f"{row['lag_max_ms']:>9.2f}{row['close_ms']:>10.2f}{row['file_kb']:>9.0f}{row['load_ms']:>9.1f}"
+              f"{row['entities']:>10}")
+        if row['storm_seconds'] > results['joins'] / results['rate'] * 1.1:
+            print(f"   ⚠️ fell behind: the storm took {row['storm_seconds']:.1f}s")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Session storage benchmarks for the moderation bot")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help="Session modes to test")
+    parser.add_argument('--joins', type=int, default=20000, help="Joins in the storm")
+    parser.add_argument('--chats', type=int, default=20, help="Chats the users join")
+    parser.add_argument('--rate', type=float, default=2000, help="Joins per second")
+    parser.add_argument('--checkpoint', type=float, default=2.0,
+                        help="Seconds between Telethon's periodic saves (60 in the client, shortened here)")
+    parser.add_argument('--entity-cache', type=int, default=5000, help="Users in each periodic save")
+    parser.add_argument('--flush-interval', type=float, default=1.0, help="Buffered session flush interval")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for users and chats")
+    parser.add_argument('--json', help="Write the results to this file")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    os.environ.setdefault('API_ID', '0')
+    os.environ.setdefault('API_HASH', 'bench')
+    os.environ.setdefault('BOT_TOKEN', 'bench')
+    # Importing the bot opens bot.log in the working directory
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    import utils
+
+    channels, storm = make_storm(random.Random(args.seed), args.joins, args.chats)
+    results = {'python': platform.python_version(), 'joins': args.joins, 'chats': args.chats,
+               'rate': args.rate, 'checkpoint': args.checkpoint, 'modes': []}
+    try:
+        for mode in args.modes:
+            results['modes'].append(bench_mode(mode, channels, storm, workdir, args))
+    finally:
+        utils.stop_logging()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""
+Fake Telethon Client for Offline Benchmarks
+
+An in-process stand-in for TelegramClient so the real handlers can be driven
+without a Telegram account:
+- A synthetic world of megagroups, members, admins and a creator
+- The client methods the bot uses (on, add_event_handler, get_entity, get_me,
+  send_message, send_file, get_permissions, kick_participant, delete_messages,
+  __call__)
+- Every request goes through _call, so utils.instrument_client counts it
+  exactly as it would on a real client
+- Configurable simulated latency and FloodWait injection
+- Message and ChatAction events carrying the attributes the handlers read
+
+Author: Divyansh Shakya
+"""
+
+import time
+import random
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+from telethon import events
+from telethon.tl.types import (
+    User, Channel, InputUser, InputUserSelf, ChatAdminRights,
+    ChannelParticipant, ChannelParticipantAdmin, ChannelParticipantCreator
+)
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.functions.messages import SendMessageRequest, SendMediaRequest
+from telethon.tl.functions.channels import (
+    GetParticipantRequest, GetParticipantsRequest, EditBannedRequest, ToggleSlowModeRequest,
+    DeleteMessagesRequest
+)
+from telethon.errors.rpcerrorlist import FloodWaitError, UserNotParticipantError, UsernameNotOccupiedError
+
+BOT_ID = 42
+BOT_USERNAME = 'BenchBot'
+CHAT_BASE = 1000000  # Raw channel IDs start here
+USER_BASE = 10000  # User IDs start here
+
+# Requests that can be answered with a FloodWait when injection is enabled
+WRITE_REQUESTS = (SendMessageRequest, SendMediaRequest, EditBannedRequest, ToggleSlowModeRequest, DeleteMessagesRequest)
+
+ADMIN_RIGHTS = ChatAdminRights(ban_users=True, delete_messages=True, invite_users=True)
+
+
+class FakeWorld:
+    """
+    Chats, users and roles the fake client answers from.
+
+    Chat k (0-based) has admins_per_chat admins taken from its own ID range;
+    the first of them is the creator and the bot is an admin everywhere.
+    Every other user below user_count is a member of every chat.
+
+    Args:
+        chat_count (int): Number of megagroups
+        user_count (int): Number of regular users
+        admins_per_chat (int): Admins in each chat (including the creator)
+    """
+
+    def __init__(self, chat_count, user_count, admins_per_chat):
+        self.chat_count = chat_count
+        self.user_count = user_count
+        self.admins_per_chat = admins_per_chat
+        self.admin_base = USER_BASE + user_count
+        self.chats = [
+            Channel(id=CHAT_BASE + k, title=f"Bench Group {k}", photo=None, date=None,
+                    megagroup=True, access_hash=k)
+            for k in range(chat_count)
+        ]
+        self._chat_index = {-1000000000000 - chat.id: k for k, chat in enumerate(self.chats)}
+        self._users = {}
+        self.me = User(id=BOT_ID, first_name='Bench', username=BOT_USERNAME, bot=True, access_hash=1)
+
+    def chat_id(self, k):
+        """Marked (-100...) ID of chat k, as seen in event.chat_id."""
+        return -1000000000000 - self.chats[k].id
+
+    def chat_for(self, chat_id):
+        return self.chats[self._chat_index[chat_id]]
+
+    def admins_of(self, k):
+        start = self.admin_base + k * self.admins_per_chat
+        return list(range(start, start + self.admins_per_chat))
+
+    def regular_user(self, n):
+        return USER_BASE + n % self.user_count
+
+    def user(self, user_id):
+        """User entity for an ID, or None if the ID is not part of the world."""
+        if user_id == BOT_ID:
+            return self.me
+        if not USER_BASE <= user_id < self.admin_base + self.chat_count * self.admins_per_chat:
+            return None
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = User(
+                id=user_id, first_name=f"User{user_id}", username=f"user{user_id}", access_hash=user_id
+            )
+        return user
+
+    def user_by_username(self, username):
+        if username.lower() == BOT_USERNAME.lower():
+            return self.me
+        if username.startswith('user') and username[4:].isdigit():
+            return self.user(int(username[4:]))
+        return None
+
+    def participant(self, chat_id, user_id):
+        """Participant record of a user in a chat, or None if not a member."""
+        k = self._chat_index.get(chat_id)
+        if k is None or self.user(user_id) is None:
+            return None
+        admins = self.admins_of(k)
+        if user_id == admins[0]:
+            return ChannelParticipantCreator(user_id=user_id, admin_rights=ADMIN_RIGHTS)
+        if user_id == BOT_ID or user_id in admins:
+            return ChannelParticipantAdmin(user_id=user_id, date=None, admin_rights=ADMIN_RIGHTS,
+                                           rank=None, promoted_by=admins[0])
+        if user_id >= self.admin_base:
+            return None  # Admins of other chats are not members here
+        return ChannelParticipant(user_id=user_id, date=None)
+
+    def admin_participants(self, chat_id):
+        k = self._chat_index[chat_id]
+        return [self.participant(chat_id, user_id) for user_id in (*self.admins_of(k), BOT_ID)]
+
+
+class FakeClient:
+    """
+    Stand-in for TelegramClient backed by a FakeWorld.
+
+    Args:
+        world (FakeWorld): Chats and users to answer from
+        latency (float): Mean simulated RPC latency in seconds (±50% jitter)
+        flood_rate (float): Probability that a write request gets a FloodWait
+        flood_seconds (int): Seconds demanded by injected FloodWaits
+        seed (int): Seed for latency jitter and FloodWait injection
+    """
+
+    def __init__(self, world, latency=0.0, flood_rate=0.0, flood_seconds=1, seed=0):
+        self.world = world
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.flood_sleep_threshold = 0
+        self._random = random.Random(seed)
+        self._sender = None
+        self._handlers = []
+        self._message_ids = 0
+        self.calls = Counter()  # request type -> count
+        self.in_flight = 0
+
+    # --- Event handling ---
+
+    def on(self, event):
+        def decorator(callback):
+            self.add_event_handler(callback, event)
+            return callback
+        return decorator
+
+    def add_event_handler(self, callback, event=None):
+        # Telethon accepts either an event builder instance or its class
+        builder = event if isinstance(event, type) or event is None else type(event)
+        self._handlers.append((callback, builder))
+
+    def feed(self, event):
+        """
+        Deliver an event to every matching handler, each in its own task.
+
+        Returns:
+            list: The handler tasks
+        """
+        if isinstance(event, FakeMessageEvent):
+            wanted = events.NewMessage
+        elif isinstance(event, FakeChatActionEvent):
+            wanted = events.ChatAction
+        else:
+            wanted = events.Raw
+        event.received = time.perf_counter()
+        return [
+            asyncio.create_task(callback(event))
+            for callback, builder in self._handlers
+            if builder is wanted
+        ]
+
+    # --- Requests ---
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        return await self._call(self._sender, request, ordered=ordered)
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.calls[type(request).__name__] += 1
+        self.in_flight += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+            if (self.flood_rate and isinstance(request, WRITE_REQUESTS)
+                    and self._random.random() < self.flood_rate):
+                raise FloodWaitError(request=request, capture=self.flood_seconds)
+            return self._answer(request)
+        finally:
+            self.in_flight -= 1
+
+    def _answer(self, request):
+        world = self.world
+        if isinstance(request, GetParticipantRequest):
+            participant = world.participant(request.channel, request.participant)
+            if participant is None:
+                raise UserNotParticipantError(request=request)
+            return SimpleNamespace(participant=participant, chats=[], users=[])
+        if isinstance(request, GetParticipantsRequest):
+            participants = world.admin_participants(request.channel)
+            return SimpleNamespace(participants=participants, count=len(participants), chats=[], users=[])
+        if isinstance(request, (EditBannedRequest, ToggleSlowModeRequest)):
+            return SimpleNamespace(updates=[], users=[], chats=[])
+        if isinstance(request, DeleteMessagesRequest):
+            return SimpleNamespace(pts=0, pts_count=len(request.id))
+        if isinstance(request, ResolveUsernameRequest):
+            user = world.user_by_username(request.username)
+            if user is None:
+                raise UsernameNotOccupiedError(request=request)
+            return user
+        if isinstance(request, GetUsersRequest):
+            users = (world.me if isinstance(item, InputUserSelf) else world.user(item) for item in request.id)
+            return [user for user in users if user is not None]
+        if isinstance(request, (SendMessageRequest, SendMediaRequest)):
+            self._message_ids += 1
+            photo = None
+            if isinstance(request, SendMediaRequest):
+                photo = SimpleNamespace(id=self._message_ids, access_hash=7, file_reference=b'\x01')
+            return FakeMessage(self, self._message_ids, BOT_ID, request.message, photo=photo)
+        raise NotImplementedError(f"FakeClient cannot answer {type(request).__name__}")
+
+    # --- Client helpers used by the bot ---
+
+    async def get_me(self):
+        users = await self(GetUsersRequest([InputUserSelf()]))
+        return users[0]
+
+    async def get_entity(self, entity):
+        # Like Telethon, IDs (one or a list) are fetched with a single GetUsersRequest
+        if isinstance(entity, list):
+            ids = [item for item in entity if isinstance(item, int)]
+            users = await self(GetUsersRequest(ids)) if ids else []
+            if len(users) < len(ids):
+                raise ValueError("Could not find the input entity for one of the IDs")
+            by_id = {user.id: user for user in users}
+            return [by_id[item] if isinstance(item, int) else await self.get_entity(item) for item in entity]
+        if isinstance(entity, int):
+            return (await self.get_entity([entity]))[0]
+        if isinstance(entity, InputUser):
+            return (await self.get_entity([entity.user_id]))[0]
+        username = entity.lstrip('@')
+        try:
+            return await self(ResolveUsernameRequest(username))
+        except UsernameNotOccupiedError:
+            raise ValueError(f'No user has "{username}" as username')
+
+    async def get_permissions(self, chat, user):
+        chat_id = _marked_id(chat)
+        result = await self(GetParticipantRequest(chat_id, getattr(user, 'id', user)))
+        participant = result.participant
+        return SimpleNamespace(
+            is_admin=isinstance(participant, (ChannelParticipantAdmin, ChannelParticipantCreator)),
+            is_creator=isinstance(participant, ChannelParticipantCreator),
+            participant=participant
+        )
+
+    async def send_message(self, entity, message='', reply_to=None, parse_mode=(), **kwargs):
+        return await self(SendMessageRequest(peer=_marked_id(entity), message=message, reply_to=None))
+
+    async def send_file(self, entity, file, caption=None, reply_to=None, parse_mode=(), **kwargs):
+        return await self(SendMediaRequest(peer=_marked_id(entity), media=None, message=caption or ''))
+
+    async def delete_messages(self, entity, message_ids, revoke=True):
+        return [await self(DeleteMessagesRequest(_marked_id(entity), list(message_ids)))]
+
+    async def kick_participant(self, entity, user):
+        # Telethon kicks from megagroups with a ban followed by an unban
+        chat_id = _marked_id(entity)
+        user_id = getattr(user, 'id', user)
+        await self(EditBannedRequest(chat_id, user_id, None))
+        await self(EditBannedRequest(chat_id, user_id, None))
+
+
+def _marked_id(entity):
+    if isinstance(entity, int):
+        return entity
+    return -1000000000000 - entity.id
+
+
+class FakeMessage:
+    """A sent or received message with the attributes handlers read."""
+
+    def __init__(self, client, message_id, sender_id, text, photo=None, reply_to_msg_id=None, date=None):
+        self._client = client
+        self.id = message_id
+        self.date = date
+        self.sender_id = sender_id
+        self.sender = client.world.user(sender_id)
+        self.raw_text = text
+        self.text = text
+        self.photo = photo
+        self.document = None
+        self.entities = None
+        self.reply_to_msg_id = reply_to_msg_id
+
+    async def get_sender(self):
+        return self._client.world.user(self.sender_id)
+
+
+class FakeMessageEvent:
+    """
+    NewMessage event as seen by the router and command handlers.
+
+    Args:
+        client (FakeClient): Client replies are sent through
+        chat_id (int): Marked chat ID
+        sender_id (int): Author of the message
+        text (str): Message text
+        reply_to_sender (int): If set, the message replies to one from this user
+        date (datetime): When the message was sent (None = no date, i.e. now)
+    """
+
+    def __init__(self, client, chat_id, sender_id, text, reply_to_sender=None, date=None):
+        client._message_ids += 1
+        self._client = client
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.raw_text = text
+        self.text = text
+        self.message = FakeMessage(client, client._message_ids, sender_id, text, date=date)
+        self.id = self.message.id
+        self.pattern_match = None
+        self.is_private = False
+        self.is_group = True
+        self._reply_to_sender = reply_to_sender
+        self.is_reply = reply_to_sender is not None
+        self.reply_to_msg_id = self.id - 1 if self.is_reply else None
+        self.received = None
+
+    async def get_sender(self):
+        return self._client.world.user(self.sender_id)
+
+    async def get_chat(self):
+        return self._client.world.chat_for(self.chat_id)
+
+    async def get_reply_message(self):
+        if not self.is_reply:
+            return None
+        return FakeMessage(self._client, self.reply_to_msg_id, self._reply_to_sender, '')
+
+    async def reply(self, *args, **kwargs):
+        kwargs['reply_to'] = self.id
+        return await self._client.send_message(self.chat_id, *args, **kwargs)
+
+
+class FakeChatActionEvent:
+    """
+    ChatAction event for joins and leaves of one or more users.
+
+    Args:
+        client (FakeClient): Client the event belongs to
+        chat_id (int): Marked chat ID
+        user_ids (list): Users who joined or left
+        joined (bool): True for a join, False for a leave
+        date (datetime): When it happened (None = no date, i.e. now)
+    """
+
+    def __init__(self, client, chat_id, user_ids, joined=True, date=None):
+        self._client = client
+        self.chat_id = chat_id
+        self.user_ids = list(user_ids)
+        self.user_joined = joined
+        self.user_added = False
+        self.user_left = not joined
+        self.user_kicked = False
+        self.action_message = SimpleNamespace(date=date) if date is not None else None
+        self.received = None
+
+    @property
+    def user_id(self):
+        return self.user_ids[0] if self.user_ids else None
+
+    async def get_chat(self):
+        return self._client.world.chat_for(self.chat_id)
+
+    async def get_users(self):
+        return [self._client.world.user(user_id) for user_id in self.user_ids]
+
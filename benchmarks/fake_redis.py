@@ -0,0 +1,172 @@
+"""
+Local Redis-Protocol Stand-in for Offline Benchmarks
+
+A tiny asyncio server that speaks enough of the Redis protocol (RESP) for
+state.RedisBackend, so the shared-state backend can be exercised without a
+Redis install:
+- PING, GET, SET (with NX and PX), DEL, INCRBYFLOAT, PEXPIRE, SELECT
+- MULTI/EXEC: commands are queued and run together (the server is
+  single-threaded, so the block is atomic)
+- Pipelined requests: commands are answered in the order they arrive
+
+Usage:
+    python benchmarks/fake_redis.py --port 6379
+
+Author: Divyansh Shakya
+"""
+
+import time
+import asyncio
+import argparse
+
+
+def _bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    data = value.encode()
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+def _format_float(value):
+    return repr(int(value)) if value.is_integer() else repr(value)
+
+
+class FakeRedis:
+    """In-memory keyspace and command implementations."""
+
+    def __init__(self):
+        self.data = {}  # key -> [value, expires_at or None]
+        self.commands = 0
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def run(self, args):
+        """Run one command; returns the encoded reply."""
+        self.commands += 1
+        name = args[0].upper()
+        handler = getattr(self, 'cmd_' + name.lower(), None)
+        if handler is None:
+            return b'-ERR unknown command ' + name.encode() + b'\r\n'
+        try:
+            return handler(*args[1:])
+        except (TypeError, ValueError) as e:
+            return b'-ERR ' + str(e).encode() + b'\r\n'
+
+    def cmd_ping(self):
+        return b'+PONG\r\n'
+
+    def cmd_select(self, db):
+        return b'+OK\r\n'
+
+    def cmd_get(self, key):
+        entry = self._live(key)
+        return _bulk(entry[0] if entry else None)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        nx = 'NX' in options
+        expires = None
+        if 'PX' in options:
+            expires = time.monotonic() + int(options[options.index('PX') + 1]) / 1000
+        if nx and self._live(key) is not None:
+            return b'$-1\r\n'
+        self.data[key] = [value, expires]
+        return b'+OK\r\n'
+
+    def cmd_del(self, *keys):
+        removed = sum(1 for key in keys if self._live(key) is not None and self.data.pop(key))
+        return b':%d\r\n' % removed
+
+    def cmd_incrbyfloat(self, key, amount):
+        entry = self._live(key)
+        if entry is None:
+            entry = self.data[key] = ['0', None]
+        try:
+            value = float(entry[0]) + float(amount)
+        except ValueError:
+            return b'-ERR value is not a valid float\r\n'
+        entry[0] = _format_float(value)
+        return _bulk(entry[0])
+
+    def cmd_pexpire(self, key, milliseconds):
+        entry = self._live(key)
+        if entry is None:
+            return b':0\r\n'
+        entry[1] = time.monotonic() + int(milliseconds) / 1000
+        return b':1\r\n'
+
+
+async def _read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if line[:1] != b'*':
+        return line.decode().split()  # Inline command (e.g. from telnet)
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2].decode())
+    return args
+
+
+async def serve(host='127.0.0.1', port=0):
+    """
+    Start the stand-in server.
+
+    Returns:
+        tuple: (asyncio.Server, FakeRedis, port actually bound)
+    """
+    store = FakeRedis()
+
+    async def handle(reader, writer):
+        queued = None
+        try:
+            while True:
+                args = await _read_command(reader)
+                if not args:
+                    break
+                name = args[0].upper()
+                if name == 'MULTI':
+                    queued = []
+                    writer.write(b'+OK\r\n')
+                elif name == 'EXEC' and queued is not None:
+                    replies = [store.run(command) for command in queued]
+                    writer.write(b'*%d\r\n' % len(replies) + b''.join(replies))
+                    queued = None
+                elif queued is not None:
+                    queued.append(args)
+                    writer.write(b'+QUEUED\r\n')
+                else:
+                    writer.write(store.run(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    return server, store, server.sockets[0].getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for the moderation bot")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    async def run():
+        server, _, port = await serve(args.host, args.port)
+        print(f"Listening on {args.host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
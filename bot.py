@@ -11,9 +11,22 @@ Repository: https://github.com/divyanshakya966/Simple-tg-bot
 
 import asyncio
 from telethon import TelegramClient
-from config import API_ID, API_HASH, BOT_TOKEN, SESSION_NAME
+from config import (
+    API_ID, API_HASH, BOT_TOKEN, SESSION_NAME, FLOOD_SLEEP_THRESHOLD, METRICS_HOST, METRICS_PORT, CATCH_UP
+)
 from commands import register_handlers
-from utils import logger
+from utils import logger, instrument_client
+from coalesce import coalesce_client
+from audit import audit_store
+from expiry import expiry_scheduler
+from filters import content_filter
+from pipeline import analysis_pipeline
+from state import get_state
+from usercache import user_cache
+from snapshot import state_snapshot, install_shutdown_handler
+from catchup import catch_up
+from session import open_session, BufferedSession
+from metrics import start_metrics_server
 
 async def main():
     """
@@ -23,21 +36,64 @@ async def main():
     1. Creates a Telethon client with API credentials
     2. Registers all command and event handlers
     3. Starts the bot using the bot token
-    4. Keeps the bot running until manually stopped
+    4. Keeps the bot running until stopped; SIGTERM drains in-flight work
+       and snapshots in-memory state before exiting
     
     Raises:
         Exception: If bot initialization or startup fails
     """
     try:
-        # Initialize Telethon client with session name and API credentials
-        client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+        # Fork message analysis workers (if configured) first, while no other thread runs
+        analysis_pipeline.start()
+        
+        # Initialize Telethon client with its session and API credentials;
+        # with catch_up, updates missed while offline are fetched on connect
+        session = open_session(SESSION_NAME)
+        client = TelegramClient(session, API_ID, API_HASH, catch_up=CATCH_UP)
+        
+        # Longer FloodWaits are raised so the outbox can defer only the affected chat
+        client.flood_sleep_threshold = FLOOD_SLEEP_THRESHOLD
+        
+        # Count RPCs per handler so slow commands can be diagnosed from bot.log
+        instrument_client(client)
+        
+        # Identical concurrent lookups (same user, same chat) share one RPC
+        coalesce_client(client)
         
         # Register all command handlers (ban, mute, welcome, etc.)
         await register_handlers(client)
         
+        # Warm restart: rate limits, dedupe keys, counters and caches from the last run
+        state_snapshot.restore()
+        
+        # Updates from before this point are the backlog; stale ones are dropped
+        catch_up.start()
+        
         # Start the bot with the bot token from @BotFather
         await client.start(bot_token=BOT_TOKEN)
         
+        # Write session changes in the background (memory session mode)
+        if isinstance(session, BufferedSession):
+            session.start()
+        
+        # Write moderation audit entries in the background
+        audit_store.start()
+        
+        # Write newly seen usernames to the on-disk index in the background
+        user_cache.start()
+        
+        # Record timed bans/mutes as they expire, including any missed while offline
+        expiry_scheduler.start(client)
+        
+        # Snapshot in-memory state periodically; drain and save on SIGTERM
+        state_snapshot.start()
+        install_shutdown_handler(client)
+        
+        # Optional local metrics endpoint for Prometheus
+        if METRICS_PORT:
+            await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        
         print("✅ Bot started successfully!")
         print("💡 Use /status in your group to check bot permissions")
         
@@ -47,6 +103,17 @@ async def main():
     except Exception as e:
         print(f"❌ Error: {e}")
         logger.error(f"Bot error: {e}")
+    finally:
+        # Save in-memory state for the next start, then persist any audit
+        # entries still waiting for a batch write
+        state_snapshot.close()
+        catch_up.close()
+        expiry_scheduler.close()
+        content_filter.close()
+        user_cache.close()
+        analysis_pipeline.close()
+        await get_state().close()
+        audit_store.close()
 
 if __name__ == '__main__':
     # Run the main async function
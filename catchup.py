@@ -0,0 +1,158 @@
+"""
+Catch-Up Module for Telegram Moderation Bot
+
+This module deals with the backlog of updates after the bot was offline:
+- With CATCH_UP on, the client asks Telegram for everything missed since
+  the last run as soon as it connects; the backlog goes through the normal
+  handlers
+- Stale events are discarded before any RPC is spent on them: joins and
+  leaves older than CATCH_UP_ACTION_MAX_AGE get no welcome or goodbye,
+  commands older than CATCH_UP_COMMAND_MAX_AGE are ignored, and messages
+  older than the anti-flood / duplicate windows are not counted there
+- Backlog joins still worth welcoming land in the normal join-wave batches,
+  so each chat gets one summary welcome rather than one per user
+- Once no missed update has arrived for CATCH_UP_QUIET seconds, the
+  catch-up is reported: how long it took, how many missed updates were
+  handled and how many events were discarded
+
+The age checks apply at any time, not only after a restart: a command
+Telegram delivers minutes late is just as stale.
+
+Author: Divyansh Shakya
+"""
+
+import time
+import asyncio
+from utils import logger
+from metrics import catch_up_discarded
+from config import CATCH_UP_QUIET
+
+
+def event_date(event):
+    """
+    When an event happened, according to Telegram.
+
+    Args:
+        event: NewMessage or ChatAction event
+
+    Returns:
+        float: Unix timestamp, or None if the event carries no date
+    """
+    message = getattr(event, 'action_message', None) or getattr(event, 'message', None)
+    date = getattr(message, 'date', None)
+    if date is None:
+        # Joins/leaves without a service message (e.g. UpdateChannelParticipant)
+        date = getattr(getattr(event, 'original_update', None), 'date', None)
+    return date.timestamp() if date is not None else None
+
+
+def event_age(event):
+    """
+    Seconds since an event happened.
+
+    Args:
+        event: NewMessage or ChatAction event
+
+    Returns:
+        float: Age in seconds (0 if the event carries no date)
+    """
+    date = event_date(event)
+    return max(0.0, time.time() - date) if date is not None else 0.0
+
+
+class CatchUpTracker:
+    """
+    Counts the backlog handled after startup and reports when it is done.
+
+    An update is part of the backlog if it happened before start() was
+    called; catch-up ends once none has arrived for `quiet` seconds.
+
+    Args:
+        quiet (float): Seconds without a missed update that end catch-up
+    """
+
+    def __init__(self, quiet):
+        self.quiet = quiet
+        self.active = False
+        self.started_at = None  # Wall-clock start; older updates were missed
+        self.duration = None
+        self._started = None
+        self._last_missed = None
+        self._watcher = None
+        self.stats = {'missed': 0, 'join': 0, 'leave': 0, 'command': 0}
+
+    def start(self):
+        """Start catch-up (call from the running event loop, before connecting)."""
+        if self._watcher is not None:
+            return
+        self.active = True
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._watcher = asyncio.create_task(self._finish_when_quiet())
+
+    def observe(self, event):
+        """
+        Note an incoming event; call once per update.
+
+        Args:
+            event: NewMessage or ChatAction event
+
+        Returns:
+            float: Age of the event in seconds (0 if it carries no date)
+        """
+        date = event_date(event)
+        if date is None:
+            return 0.0
+        if self.active and date < self.started_at:
+            self.stats['missed'] += 1
+            self._last_missed = time.monotonic()
+        return max(0.0, time.time() - date)
+
+    def discard(self, kind):
+        """
+        Count a stale event dropped without being handled.
+
+        Args:
+            kind (str): join, leave or command
+        """
+        self.stats[kind] += 1
+        catch_up_discarded.inc(kind)
+
+    async def _finish_when_quiet(self):
+        while True:
+            await asyncio.sleep(self.quiet / 4)
+            last = self._last_missed or self._started
+            if time.monotonic() - last >= self.quiet:
+                break
+        self.active = False
+        self.duration = self._last_missed - self._started if self._last_missed else 0.0
+        stats = self.stats
+        if stats['missed']:
+            logger.info(
+                f"Caught up on {stats['missed']} missed update(s) in {self.duration:.1f}s; "
+                f"discarded {stats['join']} stale join(s), {stats['leave']} leave(s) "
+                f"and {stats['command']} command(s)"
+            )
+        else:
+            logger.info("No missed updates to catch up on")
+
+    def close(self):
+        """Stop waiting for the end of catch-up."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def get_stats(self):
+        """
+        Get catch-up counters.
+
+        Returns:
+            dict: missed updates seen, stale joins/leaves/commands discarded
+            (since startup), whether catch-up is still running and how long
+            it took (None until it ends)
+        """
+        return {**self.stats, 'active': self.active, 'seconds': self.duration}
+
+
+# Shared catch-up tracker
+catch_up = CatchUpTracker(CATCH_UP_QUIET)
@@ -0,0 +1,134 @@
+"""
+Request Coalescing Module for Telegram Moderation Bot
+
+This module stops the bot from asking Telegram the same question twice at
+once:
+- Lookups (GetParticipant, GetUsers behind get_entity(id), ResolveUsername)
+  that are identical to one already in flight wait for it instead of
+  sending their own RPC, and get its result or its exception
+- "User is not a participant" answers are remembered for
+  COALESCE_NEGATIVE_TTL seconds; a join of that user clears the entry
+
+Several admins replying to the same spammer, or a join wave starting many
+handlers for the same users, then cost one RPC per distinct question.
+
+Author: Divyansh Shakya
+"""
+
+import asyncio
+from telethon import utils as tg_utils
+from telethon.tl.types import InputUserSelf
+from telethon.tl.functions.channels import GetParticipantRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.errors.rpcerrorlist import UserNotParticipantError
+from utils import ExpiringSet
+from metrics import coalesced_requests
+from config import COALESCE_NEGATIVE_TTL, COALESCE_NEGATIVE_MAX_KEYS
+
+# Lookups currently waiting on Telegram: key -> task shared by every caller
+in_flight = {}
+
+# (chat, user) pairs Telegram recently said are not participants
+not_participants = ExpiringSet(COALESCE_NEGATIVE_TTL, COALESCE_NEGATIVE_MAX_KEYS)
+
+coalesce_stats = {'coalesced': 0, 'negative': 0}
+
+
+def _peer_key(peer):
+    """Stable key for a peer given as an ID or an entity/input entity, or None."""
+    if isinstance(peer, int):
+        return peer
+    if isinstance(peer, InputUserSelf):
+        return 'self'
+    try:
+        return tg_utils.get_peer_id(peer)
+    except Exception:
+        return None
+
+
+def request_key(request):
+    """
+    Key under which identical lookups are coalesced.
+
+    Args:
+        request: Telethon request object
+
+    Returns:
+        tuple: Key, or None if the request must always be sent
+    """
+    if isinstance(request, GetParticipantRequest):
+        chat, user = _peer_key(request.channel), _peer_key(request.participant)
+        if chat is not None and user is not None:
+            return ('participant', chat, user)
+    elif isinstance(request, GetUsersRequest):
+        users = tuple(map(_peer_key, request.id))
+        if None not in users:
+            return ('users', users)
+    elif isinstance(request, ResolveUsernameRequest):
+        return ('username', request.username.lower())
+    return None
+
+
+def forget_participant(chat_id, user_id):
+    """Drop a cached "not a participant" answer, e.g. because the user just joined."""
+    not_participants.discard(('participant', chat_id, user_id))
+
+
+def coalesce_client(client):
+    """
+    Coalesce identical concurrent lookups the client sends.
+
+    Wraps the client's internal request dispatcher, like
+    utils.instrument_client; call it after instrumenting so that only RPCs
+    actually sent are counted.
+
+    Args:
+        client: Telethon client instance
+    """
+    original_call = client._call
+
+    async def coalesced_call(sender, request, *args, **kwargs):
+        key = request_key(request)
+        if key is None:
+            return await original_call(sender, request, *args, **kwargs)
+
+        method = type(request).__name__
+        if key in not_participants:
+            coalesce_stats['negative'] += 1
+            coalesced_requests.inc(method, 'negative')
+            raise UserNotParticipantError(request=request)
+
+        task = in_flight.get(key)
+        if task is not None:
+            coalesce_stats['coalesced'] += 1
+            coalesced_requests.inc(method, 'in_flight')
+        else:
+            # A task of its own, so a caller being cancelled does not cancel it for the others
+            task = in_flight[key] = asyncio.ensure_future(original_call(sender, request, *args, **kwargs))
+            task.add_done_callback(lambda done: _finish(key, done))
+        return await asyncio.shield(task)
+
+    client._call = coalesced_call
+
+
+def _finish(key, task):
+    if in_flight.get(key) is task:
+        del in_flight[key]
+    if task.cancelled():
+        return
+    # Reading the exception also keeps asyncio quiet if every caller went away
+    error = task.exception()
+    if key[0] == 'participant' and isinstance(error, UserNotParticipantError):
+        not_participants.add(key)
+
+
+def get_coalesce_stats():
+    """
+    Get coalescing counters.
+
+    Returns:
+        dict: lookups that shared an in-flight RPC, lookups answered from the
+        negative cache, and lookups currently in flight
+    """
+    return {**coalesce_stats, 'in_flight': len(in_flight)}
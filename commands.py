@@ -1,145 +1,94 @@
-from telethon import events
-from security import check_rate_limit, check_user_is_admin, check_bot_admin_status
-from user_mgmt import get_user_from_event
-from moderation import moderate_user
-from utils import get_recent_logs, format_log_text, logger
-from config import BAN_RIGHTS, MUTE_RIGHTS, UNBAN_RIGHTS
-from welcome import register_welcome_handler, send_fancy_welcome
+import math
+from security import check_user_is_admin, check_bot_admin_status, register_admin_cache_handler, get_bot_user
+from user_mgmt import get_target_from_event, get_target_refs, split_command_args
+from moderation import moderate_user, bulk_moderate
+from router import CommandRouter
+from profiling import profiled, format_perf_summary, format_slowest, format_last_profile, set_profile_rate
+from audit import get_recent_logs, format_log_text
+from outbox import reply
+from utils import format_duration
+from config import BAN_RIGHTS, MUTE_RIGHTS, UNBAN_RIGHTS, LOGS_PAGE_SIZE, RESTRICT_MIN_SECONDS, RESTRICT_MAX_SECONDS
+from welcome import register_welcome_handler
 from userinfo import register_userinfo_handler
+from antiflood import register_antiflood
+from duplicates import register_duplicate_detector
+from filters import register_filter_handler
+from usercache import register_user_cache
 
 async def register_handlers(client):
     """Register all command handlers"""
     
-    # CLEANED Welcome handler - no unnecessary logs
-    @client.on(events.ChatAction)
-    async def handle_welcome(event):
-        try:
-            # Process both user_joined and user_added events
-            if not (event.user_joined or event.user_added):
+    router = CommandRouter(client)
+
+    # Keep cached admin rosters in sync with promotions/demotions
+    register_admin_cache_handler(client)
+    
+    # Joins/leaves are handled by the single ChatAction pipeline in welcome.py
+
+    async def moderate_command(event, action, rights, timed=False):
+        # Optional duration for bans/mutes, e.g. /mute @user 2h
+        duration = None
+        if timed:
+            duration = split_command_args(event.raw_text)[1]
+            if duration is not None and not RESTRICT_MIN_SECONDS <= duration <= RESTRICT_MAX_SECONDS:
+                await reply(event, f"❌ Duration must be between {format_duration(RESTRICT_MIN_SECONDS)} "
+                                   f"and {format_duration(RESTRICT_MAX_SECONDS)}.")
                 return
-            
-            new_user = None
-            
-            # Get the action from the event
-            if hasattr(event, 'action_message') and event.action_message:
-                action_msg = event.action_message
-                
-                # Case 1: User joined by themselves
-                if event.user_joined and hasattr(action_msg, 'from_id'):
-                    try:
-                        new_user = await client.get_entity(action_msg.from_id)
-                    except Exception:
-                        pass  # Silent fail, no logging
-                
-                # Case 2: User was added by someone else
-                elif event.user_added and hasattr(action_msg, 'action') and hasattr(action_msg.action, 'users'):
-                    try:
-                        # Get the first user from the action (newly added)
-                        new_user_id = action_msg.action.users[0]
-                        new_user = await client.get_entity(new_user_id)
-                    except Exception:
-                        pass  # Silent fail, no logging
-            
-            # If we found a new user, welcome them instantly
-            if new_user:
-                try:
-                    chat = await event.get_chat()
-                    await send_fancy_welcome(client, chat, new_user)
-                    logger.info(f"Welcomed: {new_user.first_name} ({new_user.id})")
-                except Exception as e:
-                    logger.error(f"Error sending welcome: {e}")
-            
-            # No logging if user not found - this eliminates spam
-                        
-        except Exception as e:
-            logger.error(f"Welcome handler error: {e}")
 
-    # All moderation commands remain exactly the same...
-    @client.on(events.NewMessage(pattern=r'^/ban'))
-    async def ban_cmd(event):
-        if not check_rate_limit(event.sender_id):
-            await event.reply("⏱️ Please wait before using another command.")
+        # Several targets (or an attached list) go through the bulk path
+        refs = await get_target_refs(client, event)
+        if len(refs) > 1 or getattr(event.message, 'document', None) is not None:
+            await bulk_moderate(client, event, refs, action, rights, duration)
             return
-        
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can use this command.")
-            return
-        
-        user = await get_user_from_event(client, event)
+        user, participant = await get_target_from_event(client, event)
         if user:
-            await moderate_user(client, event, user, "banned", BAN_RIGHTS)
+            await moderate_user(client, event, user, action, rights, participant, duration)
 
-    @client.on(events.NewMessage(pattern=r'^/unban'))
+    # Moderation commands - admin only (enforced by the router)
+    @router.command('ban', admin_only=True)
+    @profiled('ban')
+    async def ban_cmd(event):
+        await moderate_command(event, "banned", BAN_RIGHTS, timed=True)
+
+    @router.command('unban', admin_only=True)
+    @profiled('unban')
     async def unban_cmd(event):
-        if not check_rate_limit(event.sender_id):
-            await event.reply("⏱️ Please wait before using another command.")
-            return
-        
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can use this command.")
-            return
-        
-        user = await get_user_from_event(client, event)
-        if user:
-            await moderate_user(client, event, user, "unbanned", UNBAN_RIGHTS)
+        await moderate_command(event, "unbanned", UNBAN_RIGHTS)
 
-    @client.on(events.NewMessage(pattern=r'^/mute'))
+    @router.command('mute', admin_only=True)
+    @profiled('mute')
     async def mute_cmd(event):
-        if not check_rate_limit(event.sender_id):
-            await event.reply("⏱️ Please wait before using another command.")
-            return
-        
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can use this command.")
-            return
-        
-        user = await get_user_from_event(client, event)
-        if user:
-            await moderate_user(client, event, user, "muted", MUTE_RIGHTS)
+        await moderate_command(event, "muted", MUTE_RIGHTS, timed=True)
 
-    @client.on(events.NewMessage(pattern=r'^/unmute'))
+    @router.command('unmute', admin_only=True)
+    @profiled('unmute')
     async def unmute_cmd(event):
-        if not check_rate_limit(event.sender_id):
-            await event.reply("⏱️ Please wait before using another command.")
-            return
-        
-        if not await check_user_is_admin(client, event):
-            await event.replies("❌ Only admins can use this command.")
-            return
-        
-        user = await get_user_from_event(client, event)
-        if user:
-            await moderate_user(client, event, user, "unmuted", UNBAN_RIGHTS)
+        await moderate_command(event, "unmuted", UNBAN_RIGHTS)
 
-    @client.on(events.NewMessage(pattern=r'^/kick'))
+    @router.command('kick', admin_only=True)
+    @profiled('kick')
     async def kick_cmd(event):
-        if not check_rate_limit(event.sender_id):
-            await event.reply("⏱️ Please wait before using another command.")
-            return
-        
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can use this command.")
-            return
-        
-        user = await get_user_from_event(client, event)
-        if user:
-            await moderate_user(client, event, user, "kick", None)
+        await moderate_command(event, "kick", None)
 
     # Public commands
-    @client.on(events.NewMessage(pattern=r'^/help'))
+    @router.command('help')
+    @profiled('help')
     async def help_cmd(event):
         help_text = """
     🤖 **Moderation Bot Commands:**
     
     
 **Admin Only Commands:**
-• `/ban` - Ban user (reply or @username)
-• `/unban` - Unban user  
-• `/mute` - Mute user (reply or @username)
-• `/unmute` - Unmute user
-• `/kick` - Kick user (reply or @username)
+• `/ban` - Ban user (reply, @username or several @users/IDs; add e.g. `7d` for a timed ban)
+• `/unban` - Unban user(s)
+• `/mute` - Mute user (reply, @username or several @users/IDs; add e.g. `2h` for a timed mute)
+• `/unmute` - Unmute user(s)
+• `/kick` - Kick user (reply, @username or several @users/IDs)
 • `/welcome` - Send custom welcome (reply or @username)
 • `/goodbye` - Remove user & send goodbye (reply or @username)
+• `/logs` - Moderation log for this group (`/logs 2` for older)
+• `/perf` - Handler latency p50/p95/p99 (`/perf slow`, `/perf profile [rate]`)
+• `/filter` - Blocked words, domains and invite links (`/filter add word spam`, `/filter action mute`)
 
 
 **Public Commands:**
@@ -151,7 +100,10 @@ async def register_handlers(client):
 **Usage Examples:**
 • `/ban @username`
 • `/mute` (reply to message)
+• `/mute @username 2h`
 • `/kick @spammer`
+• `/ban @spam1 @spam2 123456789` (or attach a .txt list)
+• `/filter add domain spam.example`
 • `/uinfo @someone`
 • `/welcome @newuser`
 • `/goodbye @troublemaker`
@@ -162,7 +114,10 @@ async def register_handlers(client):
 • ✅ Auto-goodbye messages (leave & remove)
 • ✅ Admin-only moderation commands  
 • ✅ Human-readable user status display
-• ✅ Rate limiting (2sec cooldown)
+• ✅ Rate limiting (per-user & per-chat budgets over a sliding window)
+• ✅ Anti-flood (auto-mute flooders, slow mode for flooded chats)
+• ✅ Content filters (blocked words, domains, invite links)
+• ✅ Cross-group duplicate spam detection
 • ✅ Creator protection
 • ✅ Admin protection
 • ✅ Duplicate message prevention
@@ -175,12 +130,13 @@ async def register_handlers(client):
 • 🔄 Works for joins, adds, leaves, kicks
 • 🛡️ Duplicate prevention system
     """
-        await event.reply(help_text)
+        await reply(event, help_text)
 
-    @client.on(events.NewMessage(pattern=r'^/status'))
+    @router.command('status')
+    @profiled('status')
     async def status_cmd(event):
         try:
-            me = await client.get_me()
+            me = await get_bot_user(client)
             is_admin = await check_bot_admin_status(client, event.chat_id)
             user_is_admin = await check_user_is_admin(client, event)
             
@@ -197,20 +153,48 @@ async def register_handlers(client):
 
 {('⚠️ **Bot needs admin privileges!**' if not is_admin else '✅ **Bot ready to moderate!**')}
             """
-            await event.reply(status_text)
+            await reply(event, status_text)
         except Exception as e:
-            await event.reply(f"Status check failed: {e}")
+            await reply(event, f"Status check failed: {e}")
 
-    @client.on(events.NewMessage(pattern=r'^/logs'))
+    @router.command('logs', pattern=r'^/logs(?:\s+(\d+))?', admin_only=True, denied_text="❌ Only admins can view logs.")
+    @profiled('logs')
     async def logs_cmd(event):
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can view logs.")
-            return
-        
-        logs = get_recent_logs()
-        log_text = format_log_text(logs)
-        await event.reply(log_text)
+        page = max(1, int(event.pattern_match.group(1) or 1))
+        logs = await get_recent_logs(event.chat_id, LOGS_PAGE_SIZE, page)
+        log_text = format_log_text(logs, page)
+        await reply(event, log_text)
+
+    @router.command('perf', pattern=r'^/perf(?:\s+(\w+))?(?:\s+(\S+))?', admin_only=True)
+    @profiled('perf')
+    async def perf_cmd(event):
+        subcommand = event.pattern_match.group(1)
+        if subcommand == 'slow':
+            await reply(event, format_slowest())
+        elif subcommand == 'profile' and event.pattern_match.group(2):
+            try:
+                rate = float(event.pattern_match.group(2))
+            except ValueError:
+                rate = None
+            if rate is None or math.isnan(rate):
+                await reply(event, "❌ Usage: `/perf profile <rate>` with a rate from 0 to 1, e.g. `/perf profile 0.05`")
+                return
+            set_profile_rate(max(0.0, min(1.0, rate)))
+            await reply(event, format_perf_summary())
+        elif subcommand == 'profile':
+            await reply(event, format_last_profile())
+        else:
+            await reply(event, format_perf_summary())
+
+    # The username cache and automatic protections see every message through the router
+    register_user_cache(client, router)
+    register_antiflood(client, router)
+    register_duplicate_detector(client, router)
+    await register_filter_handler(client, router)
 
     # Register new handlers
-    await register_welcome_handler(client)
-    await register_userinfo_handler(client)
+    await register_welcome_handler(client, router)
+    await register_userinfo_handler(client, router)
+
+    # One NewMessage handler dispatches every command registered above
+    router.install()
@@ -26,9 +26,143 @@ API_HASH = os.getenv('API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')  # Get from @BotFather
 
 # Bot Settings
-COMMAND_COOLDOWN = 2  # Seconds between commands per user (prevents spam)
 LOG_FILE = 'bot.log'  # File where bot logs are stored
+LOG_FORMAT = 'text'  # 'text' or 'json' (JSON lines with chat_id/user_id/command)
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate bot.log at this size...
+LOG_ROTATE_WHEN = None  # ...or by time instead, e.g. 'midnight'
+LOG_BACKUP_COUNT = 5  # Compressed old logs to keep
 SESSION_NAME = 'bot_session'  # Telethon session file name
+SESSION_MODE = 'sqlite'  # sqlite (Telethon's default) or memory (kept in memory, flushed in the background)
+SESSION_FLUSH_INTERVAL = 5  # Seconds between background session writes in memory mode
+ADMIN_CACHE_TTL = 300  # Seconds a chat's cached admin roster stays valid
+ADMIN_ROSTER_RETRY = 60  # Seconds before retrying a roster that failed to load (per-user checks meanwhile)
+ADMIN_ROSTER_MAX_FAILED = 10000  # Chats remembered as having no loadable roster
+WELCOME_IMAGE = 'Welc.jpeg'  # Image sent with welcome messages
+WELCOME_MEDIA_CACHE = 'welcome_media.json'  # Uploaded welcome photo handle (reused across restarts)
+
+# Join-wave coalescing: joins within the window are welcomed in one message
+WELCOME_COALESCE_WINDOW = 3  # Seconds to collect joins before posting a welcome
+WELCOME_MAX_MENTIONS = 10  # Users mentioned by name per welcome; the rest are counted
+WELCOME_MIN_INTERVAL = 15  # Minimum seconds between welcome posts in one chat
+
+# Duplicate join/leave suppression (in the state backend, so standby processes agree)
+DEDUPE_TTL = 30  # Seconds a join/leave is remembered
+
+# Shared state for rate limits and join/leave dedupe
+STATE_BACKEND = 'memory'  # memory (this process), sqlite (processes on one host) or redis
+STATE_DB = 'bot_state.db'  # Database file of the sqlite backend
+STATE_REDIS_URL = 'redis://127.0.0.1:6379/0'  # Server of the redis backend
+STATE_KEY_PREFIX = 'tgbot:'  # Prefix of every key, so bots can share a store
+STATE_MAX_KEYS = 200000  # Hard cap per key namespace (rate limits, dedupe) in the memory backend
+
+# Warm restart: in-memory state (rate limits, dedupe, anti-flood, caches) survives restarts
+SNAPSHOT_FILE = 'bot_snapshot.bin'  # Snapshot of in-memory state, restored at startup
+SNAPSHOT_INTERVAL = 60  # Seconds between background snapshots (0 = only on shutdown)
+SHUTDOWN_DRAIN_TIMEOUT = 15  # Seconds in-flight handlers and queued sends get to finish on SIGTERM
+
+# Catch-up after downtime: missed updates are fetched on connect, stale ones dropped
+CATCH_UP = True  # Ask Telegram for the updates missed while the bot was offline
+CATCH_UP_ACTION_MAX_AGE = 300  # Joins/leaves older than this get no welcome/goodbye
+CATCH_UP_COMMAND_MAX_AGE = 60  # Commands older than this are ignored
+CATCH_UP_QUIET = 5  # Seconds without a missed update before catch-up is reported done
+
+# Rate limiting (sliding windows of BURST / REFILL seconds in the state backend):
+# a command spends COMMAND_COSTS of each window budget
+RATE_LIMIT_BURST = 4  # Budget each user can spend per chat in one window
+RATE_LIMIT_REFILL = 1.0  # Window rate: average spend per second a user is allowed
+CHAT_RATE_LIMIT_BURST = 20  # Budget shared by everyone in a chat per window
+CHAT_RATE_LIMIT_REFILL = 2.0  # Window rate for the whole chat
+DEFAULT_COMMAND_COST = 1
+COMMAND_COSTS = {
+    'help': 0.25, 'status': 0.5, 'uinfo': 0.5, 'logs': 0.5,
+    'welcome': 1, 'unban': 1, 'unmute': 1,
+    'ban': 2, 'mute': 2, 'kick': 2, 'goodbye': 2,
+}
+
+# Outbound scheduler: pacing for everything the bot sends
+OUTBOX_CHAT_INTERVAL = 0.5  # Minimum seconds between sends in one chat
+OUTBOX_GLOBAL_RATE = 25  # Maximum sends per second across all chats
+OUTBOX_MAX_QUEUE = 50  # Queued sends per chat before welcomes/goodbyes are dropped
+OUTBOX_GREETING_MAX_WAIT = 10  # Seconds a welcome/goodbye yields to commands in other chats before it is sent anyway
+FLOOD_SLEEP_THRESHOLD = 5  # FloodWaits up to this many seconds are slept through by Telethon
+
+# Moderation audit log (SQLite, append-only)
+AUDIT_DB = 'moderation_audit.db'  # Database file for the audit trail
+AUDIT_BATCH_SIZE = 100  # Pending entries that force a write
+AUDIT_FLUSH_INTERVAL = 2  # Seconds between background writes
+AUDIT_TAIL_SIZE = 50  # Recent entries kept in memory per chat
+LOGS_PAGE_SIZE = 5  # Entries shown per /logs page
+
+# Bulk moderation (/ban @a @b 123 ..., or an attached list of IDs/usernames)
+BULK_MAX_TARGETS = 100  # Targets accepted by one command
+BULK_RESOLVE_BATCH = 20  # Targets resolved and membership-checked together
+BULK_CONCURRENCY = 5  # Targets moderated at the same time
+BULK_FLOOD_BUDGET = 60  # FloodWait seconds a bulk command may run into before it stops
+BULK_FILE_MAX_BYTES = 64 * 1024  # Largest attached target list that is read
+
+# Timed bans/mutes (/mute @user 2h): Telegram lifts them, the expiry scheduler records it
+RESTRICT_MIN_SECONDS = 30  # Telegram treats shorter restrictions as permanent
+RESTRICT_MAX_SECONDS = 366 * 86400  # ...and longer ones too
+EXPIRY_DB = 'moderation_expiry.db'  # Pending expiries, kept across restarts
+EXPIRY_BATCH_SIZE = 500  # Expiries handled per scheduler pass
+EXPIRY_ANNOUNCE = False  # Post a message in the chat when a restriction expires
+EXPIRY_RETRY_MAX = 60  # Longest pause (seconds) after a failed scheduler pass; doubles from 1s
+
+# Anti-flood: message rates per (chat, user) and per chat over a sliding window
+FLOOD_WINDOW = 10  # Window length in seconds
+FLOOD_USER_MAX = 12  # Messages per window before a user is muted (0 = off)
+FLOOD_CHAT_MAX = 150  # Messages per window before a chat gets slow mode (0 = off)
+FLOOD_MUTE_SECONDS = 600  # How long flooders stay muted
+FLOOD_SLOWMODE_SECONDS = 10  # Slow mode delay (Telegram allows 10, 30, 60, 300, 900, 3600; 0 = never)
+FLOOD_SLOWMODE_DURATION = 600  # How long slow mode stays on
+FLOOD_ACTION_COOLDOWN = 60  # Seconds before the same user/chat can trigger again
+FLOOD_MAX_KEYS = 100000  # Max tracked counters; idle/oldest ones are evicted
+
+# Cross-chat duplicate spam: the same (or nearly the same) text or file posted in many chats
+DUPE_WINDOW = 600  # Seconds a fingerprint's chats/senders are remembered (up to twice this)
+DUPE_CHAT_THRESHOLD = 4  # Distinct chats before a fingerprint is treated as spam (0 = off)
+DUPE_USER_THRESHOLD = 6  # Distinct senders before a fingerprint is treated as spam (0 = off)
+DUPE_MIN_WORDS = 6  # Shorter texts are not fingerprinted (greetings repeat everywhere)
+DUPE_MAX_CHARS = 500  # Only the start of a long message is fingerprinted
+DUPE_SKETCH_SLOTS = 65536  # Fingerprints tracked; fixed memory whatever the traffic
+DUPE_ACTION = 'flag'  # flag (log only), delete, mute or ban
+DUPE_MUTE_SECONDS = 3600  # How long the mute action lasts
+
+# Message analysis workers: CPU-heavy per-message checks (duplicate fingerprints) in separate processes
+PIPELINE_WORKERS = 0  # Worker processes (0 = analyse in the event loop)
+PIPELINE_BATCH_SIZE = 64  # Messages sent to a worker at once
+PIPELINE_MAX_PENDING = 5000  # Messages waiting on workers before new ones are analysed in the loop
+
+# Content filters: per-chat blocklists of words, domains and invite links (/filter)
+FILTERS_DB = 'content_filters.db'  # Blocklists and per-chat actions, kept across restarts
+FILTER_DEFAULT_ACTION = 'delete'  # delete, warn, mute or ban (changed per chat with /filter action)
+FILTER_MUTE_SECONDS = 3600  # How long the mute action lasts
+FILTER_MAX_PATTERNS = 100000  # Patterns one chat may block
+FILTER_MAX_PATTERN_LENGTH = 100  # Longest accepted pattern
+FILTER_DELTA_MAX = 256  # Changes kept in the small matcher before a full background rebuild
+FILTER_CACHE_CHATS = 1000  # Chats whose compiled matcher is kept in memory
+FILTER_DEFER_MAX = 100  # Messages held per chat while its blocklist loads
+FILTER_FILE_MAX_BYTES = 4 * 1024 * 1024  # Largest attached pattern list that is read
+FILTER_LIST_PAGE_SIZE = 20  # Patterns shown per /filter list page
+
+# Username cache: @username lookups without a ResolveUsername RPC (Telegram limits those strictly)
+USER_CACHE_DB = 'user_cache.db'  # On-disk username index, kept across restarts
+USER_CACHE_SIZE = 50000  # Usernames kept in memory
+USER_CACHE_TTL = 6 * 3600  # Seconds a username in memory is trusted without asking Telegram
+USER_INDEX_TTL = 30 * 86400  # Seconds an index entry is used (each use is re-checked by user ID; 0 = off)
+USER_CACHE_FLUSH_INTERVAL = 10  # Seconds between background writes of new usernames
+
+# Request coalescing: identical concurrent lookups share one RPC
+COALESCE_NEGATIVE_TTL = 10  # Seconds a "user is not a participant" answer is reused (0 = never)
+COALESCE_NEGATIVE_MAX_KEYS = 100000  # Hard cap on remembered non-participants
+
+# Metrics endpoint (Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics)
+METRICS_HOST = '127.0.0.1'  # Interface to listen on
+METRICS_PORT = None  # Set to a port (e.g. 9108) to enable the endpoint
+
+# Profiling (/perf)
+PERF_SAMPLE_SIZE = 500  # Recent calls kept per handler for percentiles
+PERF_PROFILE_RATE = 0  # Fraction of handler calls captured with cProfile (0 = off)
 
 # Rights configurations for moderation actions
 # MUTE: User cannot send messages but can view
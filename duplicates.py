@@ -0,0 +1,258 @@
+"""
+Duplicate Spam Module for Telegram Moderation Bot
+
+This module catches spam bots posting the same message across many groups:
+- A message's text is normalized (case, digits, punctuation and emoji are
+  dropped) and fingerprinted by its lowest-hashing adjacent word pairs, a
+  bottom-k sketch: exact copies always share it, and a few changed or added
+  words usually leave it intact; an attached photo/file is fingerprinted
+  by its file ID
+- One fixed-size table shared by all chats remembers, per fingerprint,
+  which chats and senders used it in the current and previous window, as
+  64-bit bitmaps; memory does not grow with traffic and old windows decay
+- A fingerprint seen in DUPE_CHAT_THRESHOLD chats or from DUPE_USER_THRESHOLD
+  senders within the window is spam: matching messages are flagged and,
+  depending on DUPE_ACTION, deleted or their senders muted/banned through
+  moderation.auto_moderate
+
+Fingerprinting runs in the router's message handler, or for long texts in
+the analysis worker pool when one is configured: short messages are skipped
+in well under a microsecond, a long one costs about ten; only actions start
+a task.
+
+Author: Divyansh Shakya
+"""
+
+import re
+import time
+import asyncio
+from operator import xor
+from utils import logger, ExpiringSet, start_rpc_count, set_log_context
+from metrics import duplicate_flags
+from moderation import auto_moderate
+from security import get_bot_user, check_user_admin_status
+from audit import log_moderation_action
+from outbox import delete_messages
+from pipeline import analysis_pipeline
+from catchup import event_age
+from config import (
+    DUPE_WINDOW, DUPE_CHAT_THRESHOLD, DUPE_USER_THRESHOLD, DUPE_MIN_WORDS, DUPE_MAX_CHARS,
+    DUPE_SKETCH_SLOTS, DUPE_ACTION, DUPE_MUTE_SECONDS, FLOOD_ACTION_COOLDOWN, FLOOD_MAX_KEYS,
+    MUTE_RIGHTS, BAN_RIGHTS
+)
+
+# Letters only: digits, punctuation and emoji are what spam bots vary
+WORD_RE = re.compile(r'[^\W\d_]{2,}')
+
+# Word pairs kept in the near-duplicate sketch
+SKETCH_PAIRS = 4
+
+# Actions that also restrict the sender: (moderation action, rights, duration)
+RESTRICTIONS = {'mute': ('muted', MUTE_RIGHTS, DUPE_MUTE_SECONDS), 'ban': ('banned', BAN_RIGHTS, None)}
+
+_popcount = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+
+def worth_fingerprinting(text):
+    """Cheap pre-check: most chat messages are too short to fingerprint."""
+    return text[:DUPE_MAX_CHARS].count(' ') >= DUPE_MIN_WORDS - 1
+
+
+def text_fingerprint(text):
+    """
+    Fingerprint a message's text.
+
+    Pure function of the text, so it can run in an analysis worker.
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        int: Near-duplicate fingerprint, or None for short texts
+    """
+    if not worth_fingerprinting(text):
+        return None
+    text = text[:DUPE_MAX_CHARS]
+    words = WORD_RE.findall(text.lower())
+    if len(words) < DUPE_MIN_WORDS:
+        return None
+    hashes = list(map(hash, words))
+    # Hashes of adjacent word pairs; the lowest few form the sketch
+    pairs = sorted(map(xor, hashes, hashes[1:]))
+    return hash(tuple(pairs[:SKETCH_PAIRS]))
+
+
+def media_fingerprint(message):
+    """Fingerprint of an attached photo or file, or None (stickers/GIFs/voice are common)."""
+    if message is None:
+        return None
+    if getattr(message, 'photo', None) is not None:
+        return hash(('photo', message.photo.id))
+    document = getattr(message, 'document', None)
+    if document is None or message.sticker or message.gif or message.voice or message.video_note:
+        return None
+    return hash(('document', document.id))
+
+
+class DuplicateSketch:
+    """
+    Fixed-size table of fingerprints and the chats/senders that used them.
+
+    Each fingerprint may live in one of two slots (two-choice hashing); a new
+    fingerprint takes an empty or expired slot, or else the older of the
+    two. Chats and senders are recorded as bits of 64-bit maps for the
+    current and the previous window, so the distinct counts are estimates
+    that only undercount on bit collisions.
+
+    Args:
+        slots (int): Table size (the number of fingerprints tracked)
+        window (float): Window length in seconds
+    """
+
+    def __init__(self, slots, window):
+        self.window = window
+        self._size = slots
+        self._slots = [None] * slots  # (key, window_index, chats_prev, chats_cur, users_prev, users_cur)
+
+    def hit(self, key, chat_id, user_id, now):
+        """
+        Record that a chat and sender used a fingerprint.
+
+        Returns:
+            tuple: (distinct chats, distinct senders) in the window, this one included
+        """
+        index = int(now / self.window)
+        slots = self._slots
+        slot = key % self._size
+        entry = slots[slot]
+        if entry is None or entry[0] != key:
+            other_slot = (key >> 20) % self._size
+            other = slots[other_slot]
+            if other is not None and other[0] == key:
+                slot, entry = other_slot, other
+            else:
+                # New fingerprint: evict whichever of the two was used longest ago
+                if entry is not None and (other is None or other[1] < entry[1]):
+                    slot = other_slot
+                entry = None
+
+        chat_bit = 1 << (chat_id % 64)
+        user_bit = 1 << (user_id % 64)
+        if entry is None or entry[1] < index - 1:
+            chats_prev = users_prev = chats_cur = users_cur = 0
+        elif entry[1] == index:
+            chats_prev, chats_cur, users_prev, users_cur = entry[2], entry[3], entry[4], entry[5]
+        else:
+            chats_prev, users_prev, chats_cur, users_cur = entry[3], entry[5], 0, 0
+        chats_cur |= chat_bit
+        users_cur |= user_bit
+        slots[slot] = (key, index, chats_prev, chats_cur, users_prev, users_cur)
+        return _popcount(chats_prev | chats_cur), _popcount(users_prev | users_cur)
+
+    def __len__(self):
+        return self._size - self._slots.count(None)
+
+
+# Fingerprints of recent messages across all chats
+duplicate_sketch = DuplicateSketch(DUPE_SKETCH_SLOTS, DUPE_WINDOW)
+
+# (chat, user) pairs recently restricted or logged, so a wave logs/restricts each sender once
+recent_duplicate_actions = ExpiringSet(FLOOD_ACTION_COOLDOWN, FLOOD_MAX_KEYS)
+
+duplicate_stats = {'fingerprinted': 0, 'flagged': 0}
+
+
+def watch_message(client, event):
+    """
+    Fingerprint one message and flag it if it is spreading across chats.
+
+    Called by the router for every incoming message; must stay cheap. Long
+    texts are fingerprinted through the analysis pipeline (in a worker when
+    configured), the rest is recorded in the loop in chat order.
+
+    Args:
+        client: Telethon client instance
+        event: NewMessage event
+    """
+    if event.is_private or not event.sender_id:
+        return
+    # The sketch counts by arrival time, so a backlog would bunch up messages posted far apart
+    if event_age(event) > DUPE_WINDOW:
+        return
+    text = event.raw_text
+    media_key = media_fingerprint(event.message)
+    if text and text[0] != '/' and worth_fingerprinting(text):
+        analysis_pipeline.submit(event.chat_id, text_fingerprint, text,
+                                 lambda text_key: record_message(client, event, text_key, media_key))
+    elif media_key is not None:
+        analysis_pipeline.submit(event.chat_id, None, None, lambda _: record_message(client, event, None, media_key))
+
+
+def record_message(client, event, text_key, media_key):
+    """Record a message's fingerprints in the sketch and flag it if it is spreading."""
+    keys = []
+    if text_key is not None:
+        keys.append(('text', text_key))
+    if media_key is not None:
+        keys.append(('media', media_key))
+    if not keys:
+        return
+
+    duplicate_stats['fingerprinted'] += 1
+    now = time.monotonic()
+    for source, key in keys:
+        chats, users = duplicate_sketch.hit(key, event.chat_id, event.sender_id, now)
+        if ((DUPE_CHAT_THRESHOLD and chats >= DUPE_CHAT_THRESHOLD)
+                or (DUPE_USER_THRESHOLD and users >= DUPE_USER_THRESHOLD)):
+            flag_message(client, event, source, chats, users)
+            return
+
+
+def flag_message(client, event, source, chats, users):
+    """Log a duplicate and start the configured action."""
+    duplicate_stats['flagged'] += 1
+    duplicate_flags.inc(source, DUPE_ACTION)
+    if DUPE_ACTION == 'flag':
+        if recent_duplicate_actions.add(('logged', event.chat_id, event.sender_id)):
+            logger.warning(f"Duplicate {source} from {event.sender_id} in {event.chat_id} "
+                           f"(seen in {chats} chats from {users} senders)")
+        return
+    asyncio.create_task(act_on_duplicate(client, event, source))
+
+
+async def act_on_duplicate(client, event, source):
+    """Delete a duplicate spam message and, if configured, restrict its sender."""
+    start_rpc_count()
+    set_log_context(chat_id=event.chat_id, user_id=event.sender_id, command='duplicates')
+    try:
+        if await check_user_admin_status(client, event.chat_id, event.sender_id):
+            return
+        await delete_messages(client, event.chat_id, [event.id])
+        if not recent_duplicate_actions.add(('restricted', event.chat_id, event.sender_id)):
+            return
+        user = await event.get_sender() or await client.get_entity(event.sender_id)
+        if DUPE_ACTION in RESTRICTIONS:
+            action, rights, duration = RESTRICTIONS[DUPE_ACTION]
+            await auto_moderate(client, event.chat_id, user, action, rights, duration, f"{source} spam in many chats")
+        else:
+            me = await get_bot_user(client)
+            name = f"@{user.username}" if getattr(user, 'username', None) else getattr(user, 'first_name', None) or str(user.id)
+            log_moderation_action(me.id, 'duplicates', f"deleted message ({source} spam in many chats)",
+                                  user.id, name, event.chat_id)
+    except Exception as e:
+        logger.error(f"Duplicate spam action failed for {event.sender_id} in {event.chat_id}: {e}")
+
+
+def get_duplicate_stats():
+    """
+    Get duplicate-spam counters and how full the fingerprint table is.
+
+    Returns:
+        dict: messages fingerprinted, messages flagged, fingerprints held
+    """
+    return {**duplicate_stats, 'fingerprints': len(duplicate_sketch)}
+
+
+def register_duplicate_detector(client, router):
+    """Have the router pass every message to the duplicate detector."""
+    router.watch(lambda event: watch_message(client, event))
@@ -0,0 +1,236 @@
+"""
+Restriction Expiry Module for Telegram Moderation Bot
+
+This module tracks when timed bans and mutes run out:
+- Telegram lifts the restriction itself (ChatBannedRights.until_date); the
+  bot only needs to log it, optionally announce it, and drop its own record
+- Slow mode turned on by the anti-flood detector is turned off again here
+- Pending expiries live in one SQLite table whose index on the due time is
+  the persistent min-heap: the next expiry is an index lookup, inserts are
+  O(log n), nothing is held in memory per restriction
+- A single scheduler task sleeps until the earliest expiry (or until an
+  earlier one is scheduled) and handles everything due in batches
+- Scheduling and cancelling only queue the change; the scheduler task
+  writes queued changes in one transaction from a worker thread, so no
+  database work runs on the event loop
+- Expiries that fell due while the bot was down are handled on start
+
+Author: Divyansh Shakya
+"""
+
+import time
+import sqlite3
+import asyncio
+import threading
+from telethon.tl.functions.channels import ToggleSlowModeRequest
+from utils import logger
+from audit import log_moderation_action
+from outbox import send_message, send_request, GREETING
+from config import EXPIRY_DB, EXPIRY_BATCH_SIZE, EXPIRY_ANNOUNCE, EXPIRY_RETRY_MAX
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expiries (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    due         REAL    NOT NULL,
+    chat_id     INTEGER NOT NULL,
+    user_id     INTEGER NOT NULL,
+    kind        TEXT    NOT NULL,
+    target_name TEXT,
+    UNIQUE (chat_id, user_id, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_expiries_due ON expiries (due);
+"""
+
+# Audit action recorded when a restriction of each kind runs out
+EXPIRED_ACTIONS = {'ban': 'unbanned (expired)', 'mute': 'unmuted (expired)', 'slowmode': 'slow mode off'}
+
+
+class ExpiryScheduler:
+    """
+    Persistent scheduler for the end of timed bans and mutes.
+
+    A chat/user pair has at most one pending expiry per kind; scheduling it
+    again replaces the old one, and lifting the restriction early cancels it.
+
+    Args:
+        path (str): SQLite database file
+        batch_size (int): Expiries handled per pass
+    """
+
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = None
+        self._lock = threading.Lock()
+        self._client = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._writes = []  # Queued (sql, params) changes, applied in order by the scheduler
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def schedule(self, chat_id, user_id, kind, due, target_name=None):
+        """
+        Record that a restriction ends at a given time.
+
+        Args:
+            chat_id (int): Chat the restriction applies to
+            user_id (int): Restricted user
+            kind (str): 'ban', 'mute' or 'slowmode' (user_id 0)
+            due (float): Unix time the restriction ends
+            target_name (str): Name used in logs and announcements
+        """
+        # REPLACE gives the row a new id, so an in-flight batch
+        # holding the old id can never delete the new expiry
+        self._writes.append((
+            "INSERT OR REPLACE INTO expiries (due, chat_id, user_id, kind, target_name) VALUES (?, ?, ?, ?, ?)",
+            (due, chat_id, user_id, kind, target_name)
+        ))
+        # Let the scheduler write it and re-check the earliest due time
+        self._wakeup.set()
+
+    def cancel(self, chat_id, user_id, kinds=('ban', 'mute')):
+        """Forget pending expiries for a user, e.g. after a manual unban."""
+        self._writes.append((
+            f"DELETE FROM expiries WHERE chat_id = ? AND user_id = ? AND kind IN ({', '.join('?' for _ in kinds)})",
+            (chat_id, user_id, *kinds)
+        ))
+        self._wakeup.set()
+
+    def _apply_writes(self, writes):
+        """Run queued changes in one transaction."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for sql, params in writes:
+                    conn.execute(sql, params)
+
+    async def _flush_writes(self):
+        # Take the queue on the loop thread; put it back if the write fails
+        writes, self._writes = self._writes, []
+        if not writes:
+            return
+        try:
+            await asyncio.to_thread(self._apply_writes, writes)
+        except Exception:
+            self._writes = writes + self._writes
+            raise
+
+    def pending_count(self):
+        """Number of restrictions still waiting to expire (queued changes not included)."""
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM expiries").fetchone()[0]
+
+    def _take_due(self, now):
+        """Fetch up to batch_size due expiries; also return the next due time."""
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT id, due, chat_id, user_id, kind, target_name FROM expiries "
+                "WHERE due <= ? ORDER BY due LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            next_due = None
+            if len(rows) < self.batch_size:
+                next_due = conn.execute("SELECT MIN(due) FROM expiries WHERE due > ?", (now,)).fetchone()[0]
+            return rows, next_due
+
+    def _delete(self, ids):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM expiries WHERE id = ?", ((i,) for i in ids))
+
+    def _expire(self, chat_id, user_id, kind, target_name):
+        name = target_name or str(user_id)
+        if kind == 'slowmode':
+            name = 'the chat'
+            if self._client is not None:
+                asyncio.create_task(self._end_slow_mode(chat_id))
+        log_moderation_action(None, 'timer', EXPIRED_ACTIONS.get(kind, f'{kind} expired'), user_id or None, name, chat_id)
+        if EXPIRY_ANNOUNCE and self._client is not None:
+            asyncio.create_task(self._announce(chat_id, user_id, kind, name))
+
+    async def _end_slow_mode(self, chat_id):
+        try:
+            await send_request(self._client, chat_id, ToggleSlowModeRequest(chat_id, 0))
+        except Exception as e:
+            logger.error(f"Could not turn slow mode off in {chat_id}: {e}")
+
+    async def _announce(self, chat_id, user_id, kind, name):
+        try:
+            await send_message(self._client, chat_id, f"🔓 {name}'s {kind} has expired.", priority=GREETING)
+        except Exception as e:
+            logger.error(f"Could not announce expired {kind} of {user_id} in {chat_id}: {e}")
+
+    async def _run(self):
+        retry = 1.0
+        while True:
+            self._wakeup.clear()
+            try:
+                next_due, more = await self._run_once()
+            except Exception as e:
+                # Keep the scheduler alive; the queue and due rows are retried
+                logger.error(f"Expiry scheduler pass failed, retrying in {retry:.0f}s: {e}")
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, EXPIRY_RETRY_MAX)
+                continue
+            retry = 1.0
+            if more:
+                continue
+
+            # Sleep until the earliest expiry, or until schedule() adds one
+            # (possibly while we were querying, which is why clear() is first)
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_once(self):
+        """Write queued changes and handle one batch of due expiries; returns (next due, more due)."""
+        await self._flush_writes()
+        rows, next_due = await asyncio.to_thread(self._take_due, time.time())
+        if not rows:
+            return next_due, False
+
+        for _, _, chat_id, user_id, kind, target_name in rows:
+            try:
+                self._expire(chat_id, user_id, kind, target_name)
+            except Exception as e:
+                logger.error(f"Handling the expired {kind} of {user_id} in {chat_id} failed: {e}")
+        await asyncio.to_thread(self._delete, [row[0] for row in rows])
+        logger.info(f"Handled {len(rows)} expired restriction(s)")
+        return next_due, len(rows) == self.batch_size
+
+    def start(self, client):
+        """Start the scheduler task (call from the running event loop)."""
+        self._client = client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        """Stop the scheduler, write queued changes and close the database; pending expiries are kept."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        writes, self._writes = self._writes, []
+        if writes:
+            try:
+                self._apply_writes(writes)
+            except Exception as e:
+                logger.error(f"Failed to save {len(writes)} queued expiry change(s): {e}")
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Shared expiry scheduler
+expiry_scheduler = ExpiryScheduler(EXPIRY_DB, EXPIRY_BATCH_SIZE)
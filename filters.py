@@ -0,0 +1,699 @@
+"""
+Content Filter Module for Telegram Moderation Bot
+
+This module enforces per-chat blocklists of words, domains and invite links:
+- Each chat's words and domains are compiled into one regex shaped like a
+  trie (shared prefixes are matched once), so a message is scanned in one
+  pass whatever the list size, instead of once per pattern
+- Small changes go into a second, small matcher right away; once enough
+  changes pile up the big matcher is rebuilt in a background thread, so an
+  edit never recompiles a 100k-pattern list on the event loop
+- Invite links are matched by one fixed regex and looked up in a set
+- Blocklists and each chat's action (delete, warn, mute, ban) are stored in
+  SQLite and loaded on a chat's first message; compiled matchers of recently
+  active chats stay cached
+- Hits are handled in a task: the message is deleted and mutes/bans go
+  through moderation.auto_moderate, so admins stay exempt and all is audited
+
+Admins manage the lists with /filter.
+
+Author: Divyansh Shakya
+"""
+
+import re
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from utils import logger, start_rpc_count, set_log_context, format_duration
+from metrics import filter_hits
+from moderation import auto_moderate
+from security import get_bot_user, check_user_admin_status
+from audit import log_moderation_action
+from outbox import reply, send_message, delete_messages
+from profiling import profiled
+from config import (
+    FILTERS_DB, FILTER_DEFAULT_ACTION, FILTER_MUTE_SECONDS, FILTER_MAX_PATTERNS,
+    FILTER_MAX_PATTERN_LENGTH, FILTER_DELTA_MAX, FILTER_CACHE_CHATS, FILTER_DEFER_MAX,
+    FILTER_FILE_MAX_BYTES, FILTER_LIST_PAGE_SIZE, MUTE_RIGHTS, BAN_RIGHTS
+)
+
+KINDS = ('word', 'domain', 'invite')
+ACTIONS = ('delete', 'warn', 'mute', 'ban')
+
+# Filter actions that also restrict the sender: (moderation action, rights, duration)
+RESTRICTIONS = {'mute': ('muted', MUTE_RIGHTS, FILTER_MUTE_SECONDS), 'ban': ('banned', BAN_RIGHTS, None)}
+
+# t.me/+hash, t.me/joinchat/hash and the telegram.me / telegram.dog mirrors
+INVITE_RE = re.compile(r'(?:https?://)?(?:www\.)?(?:t|telegram)\.(?:me|dog)/(?:joinchat/|\+)([\w-]+)', re.IGNORECASE)
+DOMAIN_RE = re.compile(r'^[\w-]+(?:\.[\w-]+)+$')
+
+# What may follow a matched word or domain (a domain's subdomains end in it)
+WORD_END = r'(?!\w)'
+DOMAIN_END = r'(?![\w-]|\.[\w-])'
+MATCH_ENDS = {'word': re.compile(WORD_END), 'domain': re.compile(DOMAIN_END)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filter_patterns (
+    chat_id INTEGER NOT NULL,
+    kind    TEXT    NOT NULL,
+    value   TEXT    NOT NULL,
+    PRIMARY KEY (chat_id, kind, value)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS filter_settings (
+    chat_id INTEGER PRIMARY KEY,
+    action  TEXT    NOT NULL
+);
+"""
+
+
+def normalize_pattern(kind, value):
+    """
+    Bring a pattern to the form it is stored and matched in.
+
+    Args:
+        kind (str): 'word', 'domain' or 'invite'
+        value (str): Pattern as typed by an admin
+
+    Returns:
+        str: Normalized pattern, or None if it is not valid for its kind
+    """
+    value = value.strip()
+    if not value or len(value) > FILTER_MAX_PATTERN_LENGTH:
+        return None
+    if kind == 'word':
+        return ' '.join(value.lower().split())
+    if kind == 'domain':
+        value = re.sub(r'^(?:[a-z]+://)?(?:www\.)?', '', value.lower()).split('/')[0]
+        return value if DOMAIN_RE.match(value) else None
+    if kind == 'invite':
+        if value in ('*', 'all'):
+            return '*'
+        match = INVITE_RE.search(value)
+        if match:
+            return match.group(1)
+        return value if re.fullmatch(r'[\w-]+', value) else None
+    return None
+
+
+def _trie_regex(values):
+    """Regex source matching exactly the given strings, factored as a trie."""
+    trie = {}
+    for value in values:
+        node = trie
+        for char in value:
+            node = node.setdefault(char, {})
+        node[''] = None
+    return _node_regex(trie)
+
+
+def _node_regex(node):
+    if '' in node and len(node) == 1:
+        return None
+    branches, chars, optional = [], [], False
+    for char in sorted(node):
+        if char == '':
+            optional = True
+            continue
+        tail = _node_regex(node[char])
+        if tail is None:
+            chars.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + tail)
+    only_chars = not branches
+    if chars:
+        branches.append(chars[0] if len(chars) == 1 else f"[{''.join(chars)}]")
+    result = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    if optional:
+        result = f"{result}?" if only_chars else f"(?:{result})?"
+    return result
+
+
+def compile_matcher(words, domains):
+    """
+    Compile words and domains into a single regex.
+
+    Words match whole words; domains match themselves and their subdomains.
+    Both share one left-boundary check, and a domain is matched from its
+    own first label (a '.' may precede it), so no position ever scans a
+    whole hostname just to find out that it is not blocked. The matching
+    group is named after the kind of pattern that matched.
+
+    Args:
+        words (set): Normalized words
+        domains (set): Normalized domains
+
+    Returns:
+        re.Pattern: Compiled matcher, or None if there is nothing to match
+    """
+    parts = []
+    if words:
+        parts.append(rf"(?P<word>{_trie_regex(words)}){WORD_END}")
+    if domains:
+        parts.append(rf"(?<!-)(?P<domain>{_trie_regex(domains)}){DOMAIN_END}")
+    return re.compile(rf"(?<!\w)(?:{'|'.join(parts)})") if parts else None
+
+
+class ChatFilter:
+    """
+    Compiled blocklist of one chat.
+
+    Patterns present when the filter is built go into the base matcher.
+    Later additions go into a small delta matcher, and removals of base
+    patterns are remembered and skipped when matched, until a rebuild folds
+    everything back into one base matcher.
+
+    Args:
+        patterns (iterable): (kind, value) pairs
+        action (str): What to do with a matching message
+    """
+
+    def __init__(self, patterns=(), action=FILTER_DEFAULT_ACTION):
+        self.action = action
+        self.invites = set()
+        self._base = {'word': set(), 'domain': set()}
+        self._delta = {'word': set(), 'domain': set()}
+        self._removed = set()
+        self._delta_matcher = None
+        self._delta_dirty = False
+        # Changes made while a rebuild runs, replayed onto its result
+        self.changes = None
+        for kind, value in patterns:
+            if kind == 'invite':
+                self.invites.add(value)
+            else:
+                self._base[kind].add(value)
+        self._base_matcher = compile_matcher(self._base['word'], self._base['domain'])
+
+    def add(self, kind, value):
+        if self.changes is not None:
+            self.changes.append((True, kind, value))
+        if kind == 'invite':
+            self.invites.add(value)
+        elif (kind, value) in self._removed:
+            self._removed.discard((kind, value))
+        elif value not in self._base[kind] and value not in self._delta[kind]:
+            self._delta[kind].add(value)
+            self._delta_dirty = True
+
+    def remove(self, kind, value):
+        if self.changes is not None:
+            self.changes.append((False, kind, value))
+        if kind == 'invite':
+            self.invites.discard(value)
+        elif value in self._delta[kind]:
+            self._delta[kind].discard(value)
+            self._delta_dirty = True
+        elif value in self._base[kind]:
+            self._removed.add((kind, value))
+
+    def delta_size(self):
+        """Added patterns not yet folded into the base matcher."""
+        return len(self._delta['word']) + len(self._delta['domain'])
+
+    def needs_rebuild(self):
+        # Additions are compiled on the loop, so the delta stays small;
+        # removals only cost a set lookup per match, so more may pile up
+        base_size = len(self._base['word']) + len(self._base['domain'])
+        return self.delta_size() > FILTER_DELTA_MAX or len(self._removed) > max(FILTER_DELTA_MAX, base_size // 8)
+
+    def patterns(self):
+        """All (kind, value) pairs currently blocked."""
+        result = [('invite', value) for value in self.invites]
+        for kind in ('word', 'domain'):
+            result += [(kind, value) for value in self._base[kind] if (kind, value) not in self._removed]
+            result += [(kind, value) for value in self._delta[kind]]
+        return result
+
+    def __len__(self):
+        return len(self.invites) + sum(len(values) for values in self._base.values()) \
+            + sum(len(values) for values in self._delta.values()) - len(self._removed)
+
+    def _is_blocked(self, kind, value):
+        return (value in self._delta[kind]
+                or (value in self._base[kind] and (kind, value) not in self._removed))
+
+    def _resolve(self, match):
+        kind = match.lastgroup
+        value = match.group(kind)
+        return (kind, value) if self._is_blocked(kind, value) else None
+
+    def _first_hit(self, matcher, text):
+        """
+        First blocked pattern one matcher finds in a message.
+
+        The matcher takes the longest pattern at each position, so a match of
+        a removed pattern ('spam eggs') may hide blocked ones that are
+        shorter at the same start ('spam') or start inside it ('eggs'). After
+        such a match the scan retries the same start with endpos capped below
+        its end, then moves on by one character. Capping endpos hides the
+        text after the cap from the pattern's end check, so that check is
+        repeated on the whole text.
+        """
+        match = matcher.search(text)
+        while match is not None:
+            start = match.start()
+            while match is not None:
+                hit = self._resolve(match)
+                if hit and MATCH_ENDS[match.lastgroup].match(text, match.end()):
+                    return hit
+                match = matcher.match(text, start, match.end() - 1)
+            match = matcher.search(text, start + 1)
+        return None
+
+    def scan(self, text):
+        """
+        Find the first blocked pattern in a message.
+
+        Args:
+            text (str): Message text
+
+        Returns:
+            tuple: (kind, pattern) of the first hit, or None
+        """
+        if self._delta_dirty and self.delta_size() <= FILTER_DELTA_MAX:
+            # Past that size the delta waits for the background rebuild instead
+            self._delta_matcher = compile_matcher(self._delta['word'], self._delta['domain'])
+            self._delta_dirty = False
+
+        lowered = text.lower()
+        for matcher in (self._base_matcher, self._delta_matcher):
+            if matcher is not None:
+                hit = self._first_hit(matcher, lowered)
+                if hit:
+                    return hit
+
+        if self.invites and '/' in text:
+            for match in INVITE_RE.finditer(text):
+                if '*' in self.invites or match.group(1) in self.invites:
+                    return ('invite', match.group(1))
+        return None
+
+
+class FilterStore:
+    """
+    SQLite storage for blocklists and per-chat filter actions.
+
+    Args:
+        path (str): SQLite database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def load(self, chat_id):
+        """Return a chat's (patterns, action); patterns is empty if it has none."""
+        with self._lock:
+            patterns = self._connect().execute(
+                "SELECT kind, value FROM filter_patterns WHERE chat_id = ?", (chat_id,)
+            ).fetchall()
+        return patterns, self.get_action(chat_id)
+
+    def get_action(self, chat_id):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT action FROM filter_settings WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row[0] if row else FILTER_DEFAULT_ACTION
+
+    def count(self, chat_id):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM filter_patterns WHERE chat_id = ?", (chat_id,)
+            ).fetchone()[0]
+
+    def add(self, chat_id, kind, values):
+        """Store patterns; return how many were new."""
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO filter_patterns (chat_id, kind, value) VALUES (?, ?, ?)",
+                    ((chat_id, kind, value) for value in values)
+                )
+            return conn.total_changes - before
+
+    def remove(self, chat_id, kind, values):
+        """Delete patterns; return how many existed."""
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    "DELETE FROM filter_patterns WHERE chat_id = ? AND kind = ? AND value = ?",
+                    ((chat_id, kind, value) for value in values)
+                )
+            return conn.total_changes - before
+
+    def clear(self, chat_id):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return conn.execute("DELETE FROM filter_patterns WHERE chat_id = ?", (chat_id,)).rowcount
+
+    def page(self, chat_id, offset, limit):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT kind, value FROM filter_patterns WHERE chat_id = ? "
+                "ORDER BY kind, value LIMIT ? OFFSET ?",
+                (chat_id, limit, offset)
+            ).fetchall()
+
+    def set_action(self, chat_id, action):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO filter_settings (chat_id, action) VALUES (?, ?)", (chat_id, action)
+                )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Cache entry for a chat whose blocklist is still being read
+LOADING = object()
+
+
+class ContentFilter:
+    """
+    Compiled blocklists of recently active chats, backed by a FilterStore.
+
+    get() never blocks: a chat not in the cache is loaded (and compiled) in
+    a background thread, and its messages are held back meanwhile. Chats
+    without patterns are cached as None, so they cost one dict lookup.
+
+    Args:
+        store (FilterStore): Persistent blocklists
+        max_chats (int): Chats kept in the cache
+    """
+
+    def __init__(self, store, max_chats):
+        self.store = store
+        self.max_chats = max_chats
+        self.on_loaded = None
+        self._cache = OrderedDict()  # chat_id -> ChatFilter, None or LOADING
+        self._deferred = {}
+        self._stale = set()
+        self._rebuilding = set()
+        self.stats = {'scanned': 0, 'hits': 0, 'loads': 0, 'rebuilds': 0}
+
+    def get(self, chat_id):
+        """
+        Get a chat's compiled filter.
+
+        Returns:
+            ChatFilter, None if the chat blocks nothing, or LOADING
+        """
+        cache = self._cache
+        chat_filter = cache.get(chat_id, LOADING)
+        if chat_filter is LOADING and chat_id not in cache:
+            cache[chat_id] = LOADING
+            asyncio.create_task(self._load(chat_id))
+            while len(cache) > self.max_chats:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(chat_id)
+        return chat_filter
+
+    def defer(self, chat_id, event):
+        """Hold a message until its chat's blocklist is loaded."""
+        self._deferred.setdefault(chat_id, deque(maxlen=FILTER_DEFER_MAX)).append(event)
+
+    async def _load(self, chat_id):
+        chat_filter = None
+        try:
+            while True:
+                self._stale.discard(chat_id)
+                patterns, action = await asyncio.to_thread(self.store.load, chat_id)
+                chat_filter = await asyncio.to_thread(ChatFilter, patterns, action) if patterns else None
+                # Changed while loading: read it again
+                if chat_id not in self._stale:
+                    break
+            self.stats['loads'] += 1
+        except Exception as e:
+            logger.error(f"Could not load blocklist of {chat_id}: {e}")
+        finally:
+            self._stale.discard(chat_id)
+            if self._cache.get(chat_id) is LOADING:
+                self._cache[chat_id] = chat_filter
+            else:
+                self._cache.pop(chat_id, None)
+            deferred = self._deferred.pop(chat_id, ())
+        if self.on_loaded is not None:
+            for event in deferred:
+                self.on_loaded(event)
+
+    def _update(self, chat_id, apply):
+        """Apply a stored change to the cached filter, or have it reloaded."""
+        if chat_id not in self._cache:
+            return
+        chat_filter = self._cache[chat_id]
+        if chat_filter is LOADING:
+            self._stale.add(chat_id)
+            return
+        if chat_filter is None:
+            # Nothing compiled yet; the next message loads the stored list
+            del self._cache[chat_id]
+            return
+        apply(chat_filter)
+        if chat_filter.needs_rebuild() and chat_id not in self._rebuilding:
+            self._rebuilding.add(chat_id)
+            asyncio.create_task(self._rebuild(chat_id, chat_filter))
+
+    async def _rebuild(self, chat_id, chat_filter):
+        """Fold a filter's pending changes into a fresh base matcher."""
+        chat_filter.changes = []
+        try:
+            started = time.perf_counter()
+            fresh = await asyncio.to_thread(ChatFilter, chat_filter.patterns(), chat_filter.action)
+            for added, kind, value in chat_filter.changes:
+                (fresh.add if added else fresh.remove)(kind, value)
+            fresh.action = chat_filter.action
+            if self._cache.get(chat_id) is chat_filter:
+                self._cache[chat_id] = fresh if len(fresh) else None
+            self.stats['rebuilds'] += 1
+            logger.info(f"Rebuilt blocklist of {chat_id} ({len(fresh)} patterns) "
+                        f"in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Could not rebuild blocklist of {chat_id}: {e}")
+            return
+        finally:
+            chat_filter.changes = None
+            self._rebuilding.discard(chat_id)
+        if self._cache.get(chat_id) is fresh and fresh.needs_rebuild():
+            self._rebuilding.add(chat_id)
+            asyncio.create_task(self._rebuild(chat_id, fresh))
+
+    async def add(self, chat_id, kind, values):
+        """
+        Block patterns in a chat.
+
+        Returns:
+            int: Patterns that were not blocked before
+        """
+        added = await asyncio.to_thread(self.store.add, chat_id, kind, values)
+        self._update(chat_id, lambda chat_filter: [chat_filter.add(kind, value) for value in values])
+        return added
+
+    async def remove(self, chat_id, kind, values):
+        """
+        Unblock patterns in a chat.
+
+        Returns:
+            int: Patterns that were blocked
+        """
+        removed = await asyncio.to_thread(self.store.remove, chat_id, kind, values)
+        self._update(chat_id, lambda chat_filter: [chat_filter.remove(kind, value) for value in values])
+        return removed
+
+    async def clear(self, chat_id):
+        """Unblock everything in a chat; return how many patterns were removed."""
+        removed = await asyncio.to_thread(self.store.clear, chat_id)
+        if self._cache.get(chat_id) is LOADING:
+            self._stale.add(chat_id)
+        elif chat_id in self._cache:
+            self._cache[chat_id] = None
+        return removed
+
+    async def set_action(self, chat_id, action):
+        await asyncio.to_thread(self.store.set_action, chat_id, action)
+        self._update(chat_id, lambda chat_filter: setattr(chat_filter, 'action', action))
+
+    def close(self):
+        self.store.close()
+
+
+# Shared content filter
+content_filter = ContentFilter(FilterStore(FILTERS_DB), FILTER_CACHE_CHATS)
+
+
+def watch_message(client, event):
+    """
+    Scan one message against its chat's blocklist.
+
+    Called by the router for every incoming message; a hit starts a task.
+
+    Args:
+        client: Telethon client instance
+        event: NewMessage event
+    """
+    text = event.raw_text
+    if not text or event.is_private:
+        return
+    chat_filter = content_filter.get(event.chat_id)
+    if chat_filter is None:
+        return
+    if chat_filter is LOADING:
+        content_filter.defer(event.chat_id, event)
+        return
+    content_filter.stats['scanned'] += 1
+    hit = chat_filter.scan(text)
+    if hit:
+        content_filter.stats['hits'] += 1
+        asyncio.create_task(handle_hit(client, event, hit, chat_filter.action))
+
+
+async def handle_hit(client, event, hit, action):
+    """Apply a chat's filter action to a message that matched its blocklist."""
+    kind, _ = hit
+    start_rpc_count()
+    set_log_context(chat_id=event.chat_id, user_id=event.sender_id, command='filter')
+    try:
+        # Admins may post anything, including links to other chats
+        if not event.sender_id or await check_user_admin_status(client, event.chat_id, event.sender_id):
+            return
+        filter_hits.inc(kind, action)
+        me = await get_bot_user(client)
+        user = await event.get_sender() or await client.get_entity(event.sender_id)
+        name = f"@{user.username}" if getattr(user, 'username', None) else getattr(user, 'first_name', None) or str(user.id)
+
+        await delete_messages(client, event.chat_id, [event.id])
+        if action in RESTRICTIONS:
+            moderation_action, rights, duration = RESTRICTIONS[action]
+            await auto_moderate(client, event.chat_id, user, moderation_action, rights, duration, f"blocked {kind}")
+            return
+
+        log_moderation_action(me.id, 'filter', f"deleted message (blocked {kind})", user.id, name, event.chat_id)
+        if action == 'warn':
+            await send_message(client, event.chat_id,
+                               f"⚠️ {name}, your message was removed: it contained a blocked {kind}.")
+    except Exception as e:
+        logger.error(f"Filter action failed for {event.sender_id} in {event.chat_id}: {e}")
+
+
+async def _read_pattern_file(client, event):
+    """Patterns from an attached text file, one per line."""
+    document = getattr(event.message, 'document', None)
+    if document is None:
+        return []
+    if not (document.mime_type or '').startswith('text/'):
+        raise ValueError("the attached list must be a text file")
+    if document.size > FILTER_FILE_MAX_BYTES:
+        raise ValueError(f"the attached list is larger than {FILTER_FILE_MAX_BYTES // 1024} KB")
+    data = await client.download_media(event.message, file=bytes)
+    return data.decode('utf-8', errors='ignore').splitlines()
+
+
+def _format_pattern_page(rows, total, page, action):
+    pages = max(1, -(-total // FILTER_LIST_PAGE_SIZE))
+    lines = [f"🧹 **Blocklist** ({total} patterns, action: {action}) - page {page}/{pages}"]
+    lines += [f"• {kind}: `{value}`" for kind, value in rows]
+    if not rows:
+        lines.append("Nothing is blocked here." if total == 0 else "No patterns on this page.")
+    return '\n'.join(lines)
+
+
+FILTER_USAGE = (
+    "**🔸 Filter Command Usage:**\n\n"
+    "• `/filter add word|domain|invite <patterns...>` (or attach a .txt, one per line)\n"
+    "• `/filter remove word|domain|invite <patterns...>`\n"
+    "• `/filter list [page]`\n"
+    "• `/filter action delete|warn|mute|ban`\n"
+    "• `/filter clear`\n\n"
+    "Invite patterns are invite links, or `*` for every invite link."
+)
+
+
+async def register_filter_handler(client, router):
+    """Scan every message against its chat's blocklist and add /filter."""
+    content_filter.on_loaded = lambda event: watch_message(client, event)
+    router.watch(lambda event: watch_message(client, event))
+
+    @router.command('filter', aliases=('filters', 'blocklist'), pattern=r'(?s)^/filter(?:\s+(.*))?$', admin_only=True)
+    @profiled('filter')
+    async def filter_cmd(event):
+        args = (event.pattern_match.group(1) or '').split()
+        subcommand = args[0].lower() if args else 'list'
+        chat_id = event.chat_id
+
+        if subcommand in ('add', 'remove') and len(args) >= 2 and args[1].lower() in KINDS:
+            kind = args[1].lower()
+            try:
+                raw = args[2:] + await _read_pattern_file(client, event)
+            except ValueError as e:
+                await reply(event, f"❌ Could not read patterns: {e}.")
+                return
+            values, invalid = [], 0
+            for value in dict.fromkeys(raw):
+                normalized = normalize_pattern(kind, value)
+                if normalized:
+                    values.append(normalized)
+                elif value.strip():
+                    invalid += 1
+            values = list(dict.fromkeys(values))
+            if not values:
+                await reply(event, f"❌ No valid {kind} patterns given.")
+                return
+
+            if subcommand == 'add':
+                count = await asyncio.to_thread(content_filter.store.count, chat_id)
+                if count + len(values) > FILTER_MAX_PATTERNS:
+                    await reply(event, f"❌ A chat can block at most {FILTER_MAX_PATTERNS} patterns "
+                                       f"({count} already blocked).")
+                    return
+                changed = await content_filter.add(chat_id, kind, values)
+                text = f"✅ Blocked {changed} new {kind} pattern(s)"
+            else:
+                changed = await content_filter.remove(chat_id, kind, values)
+                text = f"✅ Unblocked {changed} {kind} pattern(s)"
+            if invalid:
+                text += f", skipped {invalid} invalid"
+            await reply(event, text + ".")
+
+        elif subcommand == 'action' and len(args) == 2 and args[1].lower() in ACTIONS:
+            action = args[1].lower()
+            await content_filter.set_action(chat_id, action)
+            detail = f" for {format_duration(FILTER_MUTE_SECONDS)}" if action == 'mute' else ""
+            await reply(event, f"✅ Blocked messages will now be handled with: {action}{detail}.")
+
+        elif subcommand == 'clear':
+            removed = await content_filter.clear(chat_id)
+            await reply(event, f"✅ Removed all {removed} blocked pattern(s).")
+
+        elif subcommand == 'list' and len(args) <= 2 and (len(args) < 2 or args[1].isdigit()):
+            page = max(1, int(args[1])) if len(args) == 2 else 1
+            store = content_filter.store
+            total = await asyncio.to_thread(store.count, chat_id)
+            rows = await asyncio.to_thread(store.page, chat_id, (page - 1) * FILTER_LIST_PAGE_SIZE,
+                                           FILTER_LIST_PAGE_SIZE)
+            action = await asyncio.to_thread(store.get_action, chat_id)
+            await reply(event, _format_pattern_page(rows, total, page, action))
+
+        else:
+            await reply(event, FILTER_USAGE)
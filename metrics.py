@@ -0,0 +1,186 @@
+"""
+Metrics Module for Telegram Moderation Bot
+
+This module collects lightweight in-process metrics and serves them in the
+Prometheus text format from an optional local HTTP endpoint:
+- Counters and latency histograms with labels
+- Per-handler, per-RPC, FloodWait, dedupe, rate-limit, anti-flood, filter,
+  duplicate-spam, analysis-pipeline, username-cache and request-coalescing
+  metrics
+- A tiny asyncio HTTP server (GET /metrics), started from bot.main
+
+Recording is a dict lookup plus an increment, cheap enough to leave on.
+This module must not import other bot modules (utils depends on it).
+
+Author: Divyansh Shakya
+"""
+
+import asyncio
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Seconds a scrape may take to send its request and read the response
+HTTP_TIMEOUT = 5
+
+# All metrics, in registration order, for rendering
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+
+    Args:
+        name (str): Metric name
+        help_text (str): Description shown in the exposition output
+        labels (tuple): Label names; values are passed positionally to inc()
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets and optional labels.
+
+    Observations are stored per bucket (not cumulatively) so recording is a
+    single bisect and increment; cumulative counts are built when rendering.
+
+    Args:
+        name (str): Metric name
+        help_text (str): Description shown in the exposition output
+        labels (tuple): Label names; values are passed positionally to observe()
+        buckets (tuple): Upper bounds in ascending order
+    """
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # label_values -> [bucket counts..., +Inf count, sum]
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        state = self.values.get(label_values)
+        if state is None:
+            state = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), state[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, ('le', bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {state[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# Bot metrics
+handler_seconds = Histogram('bot_handler_seconds', 'Time spent in each command/event handler', ('handler',))
+handler_errors = Counter('bot_handler_errors_total', 'Handler invocations that raised', ('handler',))
+rpc_seconds = Histogram('bot_rpc_seconds', 'Telegram RPC latency by request type', ('method',))
+rpc_errors = Counter('bot_rpc_errors_total', 'Telegram RPCs that failed, by request type and error', ('method', 'error'))
+flood_waits = Histogram('bot_flood_wait_seconds', 'FloodWait durations demanded by Telegram', ('method',), buckets=(1, 5, 10, 30, 60, 300, 900, 3600))
+dedupe_hits = Counter('bot_dedupe_hits_total', 'Duplicate joins/leaves suppressed', ('kind',))
+rate_limit_denials = Counter('bot_rate_limit_denials_total', 'Commands refused by the rate limiter', ('scope',))
+antiflood_triggers = Counter('bot_antiflood_triggers_total', 'Message floods acted on, per user or per chat', ('scope',))
+filter_hits = Counter('bot_filter_hits_total', 'Messages matching a chat blocklist', ('kind', 'action'))
+duplicate_flags = Counter('bot_duplicate_flags_total', 'Messages flagged as cross-chat duplicates', ('source', 'action'))
+pipeline_jobs = Counter('bot_pipeline_jobs_total', 'Messages analysed, in workers or in the event loop', ('path',))
+coalesced_requests = Counter('bot_coalesced_requests_total', 'Lookups answered without an RPC of their own', ('method', 'source'))
+user_cache_lookups = Counter('bot_user_cache_lookups_total', 'Username lookups, by where they were answered', ('result',))
+catch_up_discarded = Counter('bot_catch_up_discarded_total', 'Stale joins/leaves/commands dropped (backlog or late delivery)', ('kind',))
+
+
+def render_metrics():
+    """
+    Render every registered metric in the Prometheus text format.
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+async def _read_request_line(reader):
+    request_line = await reader.readline()
+    # Drain the headers; the request body (if any) is ignored
+    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+        pass
+    return request_line
+
+
+async def _handle_http(reader, writer):
+    try:
+        # An idle or slow client must not hold its connection open forever
+        request_line = await asyncio.wait_for(_read_request_line(reader), HTTP_TIMEOUT)
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', render_metrics().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'not found\n'
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await asyncio.wait_for(writer.drain(), HTTP_TIMEOUT)
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+        # Timed out, went away, or sent an over-long line: just hang up
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host, port):
+    """
+    Serve /metrics over HTTP on host:port.
+
+    Args:
+        host (str): Interface to bind (keep it local unless scraped remotely)
+        port (int): TCP port
+
+    Returns:
+        asyncio.Server: The running server
+    """
+    return await asyncio.start_server(_handle_http, host, port)
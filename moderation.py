@@ -1,69 +1,264 @@
+import time
+import asyncio
 from telethon.tl.functions.channels import EditBannedRequest
+from telethon.tl.types import ChannelParticipantAdmin, ChannelParticipantCreator, ChatBannedRights
 from telethon.errors.rpcerrorlist import ChatAdminRequiredError, UserNotParticipantError, UserAdminInvalidError
-from security import check_bot_admin_status, check_user_is_creator, check_user_admin_status
-from utils import log_moderation_action, logger
-from config import BAN_RIGHTS, UNBAN_RIGHTS
+from security import check_bot_admin_status, check_user_is_creator, check_user_admin_status, get_bot_user
+from utils import logger, get_rpc_count, format_duration
+from audit import log_moderation_action
+from outbox import outbox, reply, send_request, send_message
+from expiry import expiry_scheduler
+from user_mgmt import resolve_targets
+from config import BAN_RIGHTS, UNBAN_RIGHTS, BULK_MAX_TARGETS, BULK_CONCURRENCY, BULK_FLOOD_BUDGET
 
-async def moderate_user(client, event, user, action, rights):
-    """Apply moderation action with comprehensive checks"""
-    try:
-        user_name = f"@{user.username}" if user.username else user.first_name
+async def preflight(client, event, user, participant=None):
+    """
+    Gather everything moderate_user needs to decide, in as few RPCs as possible.
+
+    The sender, the bot's identity and the bot's admin status are independent
+    and are looked up concurrently (all normally served from caches). When the
+    target's participant record is already known (get_target_from_event fetched
+    it while validating membership) the creator/admin decisions reuse it;
+    otherwise they fall back to the cached admin roster.
+
+    Args:
+        client: Telethon client instance
+        event: Command message event
+        user: Target User
+        participant: Target's ChannelParticipant, if already fetched
+
+    Returns:
+        dict: sender, me, bot_is_admin, target_is_creator, target_is_admin
+    """
+    sender, me, bot_is_admin = await asyncio.gather(
+        event.get_sender(),
+        get_bot_user(client),
+        check_bot_admin_status(client, event.chat_id)
+    )
+    if sender is None:
         sender = await client.get_entity(event.sender_id)
-        sender_name = f"@{sender.username}" if sender.username else sender.first_name
-        
+
+    if participant is not None:
+        target_is_creator = isinstance(participant, ChannelParticipantCreator)
+        target_is_admin = isinstance(participant, (ChannelParticipantAdmin, ChannelParticipantCreator))
+    else:
+        target_is_creator, target_is_admin = await asyncio.gather(
+            check_user_is_creator(client, event.chat_id, user.id),
+            check_user_admin_status(client, event.chat_id, user.id)
+        )
+
+    return {
+        'sender': sender,
+        'me': me,
+        'bot_is_admin': bot_is_admin,
+        'target_is_creator': target_is_creator,
+        'target_is_admin': target_is_admin,
+    }
+
+# Restriction kind tracked by the expiry scheduler for each timed action
+TIMED_KINDS = {'banned': 'ban', 'muted': 'mute'}
+
+def timed_rights(rights, until):
+    """Copy of a ChatBannedRights that Telegram lifts by itself at `until` (Unix time)."""
+    fields = {key: value for key, value in rights.to_dict().items() if key not in ('_', 'until_date')}
+    return ChatBannedRights(until_date=int(until), **fields)
+
+def _track_expiry(chat_id, user, user_name, action, until):
+    """Keep the expiry scheduler in line with what was just applied."""
+    if action in TIMED_KINDS:
+        if until is not None:
+            expiry_scheduler.schedule(chat_id, user.id, TIMED_KINDS[action], until, user_name)
+        else:
+            # A permanent restriction replaces a timed one of the same kind
+            expiry_scheduler.cancel(chat_id, user.id, (TIMED_KINDS[action],))
+    else:
+        # unban/unmute/kick all end with every restriction lifted
+        expiry_scheduler.cancel(chat_id, user.id)
+
+async def moderate_target(client, event, user, action, rights, participant=None, duration=None):
+    """
+    Check and apply one moderation action without replying.
+
+    Every outcome, successful or not, is written to the audit log, so bulk
+    commands get one audit entry per target.
+
+    Args:
+        client: Telethon client instance
+        event: Command message event
+        user: Target User
+        action (str): banned, unbanned, muted, unmuted or kick
+        rights: ChatBannedRights to apply (unused for kick)
+        participant: Target's ChannelParticipant, if already fetched
+        duration (int): Seconds until a ban/mute is lifted (None = permanent)
+
+    Returns:
+        tuple: (success (bool), message (str)) - the message is ready to send
+    """
+    user_name = f"@{user.username}" if user.username else user.first_name
+    sender_name = str(event.sender_id)
+    success, message = False, None
+    until = None
+    logged_action = action
+    if duration and action in TIMED_KINDS:
+        until = time.time() + duration
+        rights = timed_rights(rights, until)
+        logged_action = f"{action} for {format_duration(duration)}"
+    try:
+        checks = await preflight(client, event, user, participant)
+        sender = checks['sender']
+        sender_name = f"@{sender.username}" if getattr(sender, 'username', None) else getattr(sender, 'first_name', sender_name)
+
         # Check if bot has admin privileges
-        if not await check_bot_admin_status(client, event.chat_id):
-            await event.reply("❌ Bot is not an admin in this group or lacks necessary permissions.")
-            log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
-            return
-        
+        if not checks['bot_is_admin']:
+            message = "❌ Bot is not an admin in this group or lacks necessary permissions."
+
         # EXTRA PROTECTION: Cannot moderate group creator
-        if await check_user_is_creator(client, event.chat_id, user.id):
-            await event.reply("❌ Cannot moderate the group creator.")
-            log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
-            return
-        
+        elif checks['target_is_creator']:
+            message = "❌ Cannot moderate the group creator."
+
         # Check if target user is admin (prevent banning admins)
-        if action in ["banned", "muted", "kick"] and await check_user_admin_status(client, event.chat_id, user.id):
-            await event.reply("❌ Cannot moderate admins.")
-            log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
-            return
-        
-        # Get bot info to avoid self-moderation
-        me = await client.get_me()
-        if user.id == me.id:
-            await event.reply("❌ Bot cannot moderate itself.")
-            log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
-            return
-        
+        elif action in ["banned", "muted", "kick"] and checks['target_is_admin']:
+            message = "❌ Cannot moderate admins."
+
+        # Avoid self-moderation
+        elif user.id == checks['me'].id:
+            message = "❌ Bot cannot moderate itself."
+
         # Apply moderation
-        if action == "kick":
-            await client(EditBannedRequest(event.chat_id, user.id, BAN_RIGHTS))
-            await client(EditBannedRequest(event.chat_id, user.id, UNBAN_RIGHTS))
-            await event.reply(f"✅ {user_name} has been kicked.")
+        elif action == "kick":
+            await send_request(client, event.chat_id, EditBannedRequest(event.chat_id, user.id, BAN_RIGHTS))
+            await send_request(client, event.chat_id, EditBannedRequest(event.chat_id, user.id, UNBAN_RIGHTS))
+            success, message = True, f"✅ {user_name} has been kicked."
         else:
-            await client(EditBannedRequest(event.chat_id, user.id, rights))
-            await event.reply(f"✅ {user_name} has been {action}.")
-            
-        log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, True)
-        logger.info(f"Successfully {action} user {user.id} in chat {event.chat_id}")
-            
+            await send_request(client, event.chat_id, EditBannedRequest(event.chat_id, user.id, rights))
+            success, message = True, f"✅ {user_name} has been {logged_action}."
+
+        if success:
+            _track_expiry(event.chat_id, user, user_name, action, until)
+            logger.info(f"Successfully {action} user {user.id} in chat {event.chat_id} (rpcs={get_rpc_count()})")
+
     except ChatAdminRequiredError:
-        await event.reply("❌ Bot needs admin privileges with ban/restrict permissions.")
-        log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
+        message = "❌ Bot needs admin privileges with ban/restrict permissions."
     except UserNotParticipantError:
-        await event.reply("❌ User is not in this group.")
-        log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
+        message = "❌ User is not in this group."
     except UserAdminInvalidError:
-        await event.reply("❌ Cannot moderate this admin.")
-        log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
+        message = "❌ Cannot moderate this admin."
     except Exception as e:
         error_msg = str(e)
         if "participant ID is invalid" in error_msg:
-            await event.reply("❌ User not found in this group.")
+            message = "❌ User not found in this group."
         elif "not an admin" in error_msg:
-            await event.reply("❌ Bot lacks admin permissions or cannot moderate this user.")
+            message = "❌ Bot lacks admin permissions or cannot moderate this user."
         else:
-            await event.reply(f"❌ {action.title()} failed: {error_msg[:50]}")
-        log_moderation_action(event.sender_id, sender_name, action, user.id, user_name, event.chat_id, False)
-        logger.error(f"Moderation error: {e}")
+            message = f"❌ {action.title()} failed: {error_msg[:50]}"
+        logger.error(f"Moderation error: {e} (rpcs={get_rpc_count()})")
+
+    log_moderation_action(event.sender_id, sender_name, logged_action, user.id, user_name, event.chat_id, success)
+    return success, message
+
+async def moderate_user(client, event, user, action, rights, participant=None, duration=None):
+    """Apply moderation action with comprehensive checks"""
+    _, message = await moderate_target(client, event, user, action, rights, participant, duration)
+    await reply(event, message)
+
+async def bulk_moderate(client, event, refs, action, rights, duration=None):
+    """
+    Apply one moderation action to many targets and reply with a summary.
+
+    Targets are resolved and membership-checked in batches, then moderated
+    BULK_CONCURRENCY at a time (the sends themselves are still paced by the
+    outbox). Once the FloodWaits met since the command started exceed
+    BULK_FLOOD_BUDGET seconds, the remaining targets are skipped.
+
+    Args:
+        client: Telethon client instance
+        event: Command message event
+        refs (list): Usernames (without @) and numeric IDs
+        action (str): banned, unbanned, muted, unmuted or kick
+        rights: ChatBannedRights to apply (unused for kick)
+        duration (int): Seconds until a ban/mute is lifted (None = permanent)
+    """
+    verb = "kicked" if action == "kick" else action
+    if duration and action in TIMED_KINDS:
+        verb = f"{action} for {format_duration(duration)}"
+    if not refs:
+        await reply(event, f"❌ No users to be {verb}. List @usernames or IDs, or attach a text file of them.")
+        return
+
+    truncated = len(refs) > BULK_MAX_TARGETS
+    refs = refs[:BULK_MAX_TARGETS]
+    resolved, failures = await resolve_targets(client, event.chat_id, refs)
+
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    flood_wait_start = outbox.stats['flood_wait_seconds']
+
+    async def moderate_one(ref, user, participant):
+        async with semaphore:
+            if outbox.stats['flood_wait_seconds'] - flood_wait_start > BULK_FLOOD_BUDGET:
+                return ref, False, "skipped, FloodWait budget used up"
+            success, message = await moderate_target(client, event, user, action, rights, participant, duration)
+            return ref, success, message.lstrip('✅❌ ')
+
+    results = await asyncio.gather(*(moderate_one(*target) for target in resolved))
+    done = sum(1 for _, success, _ in results if success)
+    failures += [(ref, reason) for ref, success, reason in results if not success]
+
+    # Refs naming the same user were merged while resolving, so count outcomes
+    lines = [f"{'✅' if done else '❌'} {done} of {done + len(failures)} user(s) {verb}."]
+    if failures:
+        lines.append("")
+        lines += [f"• {_display_ref(ref)}: {reason}" for ref, reason in failures[:10]]
+        if len(failures) > 10:
+            lines.append(f"• ...and {len(failures) - 10} more")
+    if truncated:
+        lines.append(f"\n⚠️ Only the first {BULK_MAX_TARGETS} targets were processed.")
+    await reply(event, "\n".join(lines))
+    logger.info(f"Bulk {action}: {done}/{done + len(failures)} in chat {event.chat_id} (rpcs={get_rpc_count()})")
+
+class SystemEvent:
+    """
+    Stand-in for a command event when the bot acts on its own.
+
+    moderate_target only needs the chat, the acting user and get_sender();
+    with this the bot itself is recorded as the admin in the audit log.
+    """
+
+    def __init__(self, chat_id, me):
+        self.chat_id = chat_id
+        self.sender_id = me.id
+        self._me = me
+
+    async def get_sender(self):
+        return self._me
+
+async def auto_moderate(client, chat_id, user, action, rights, duration=None, reason=None):
+    """
+    Moderate a user on the bot's own initiative and tell the chat why.
+
+    Used by automatic protections (anti-flood, content filters). Goes through
+    moderate_target, so admins and the creator stay protected and every
+    attempt is audited; only successful actions are announced.
+
+    Args:
+        client: Telethon client instance
+        chat_id (int): Chat to act in
+        user: Target User
+        action (str): banned, muted or kick
+        rights: ChatBannedRights to apply (unused for kick)
+        duration (int): Seconds until a ban/mute is lifted (None = permanent)
+        reason (str): Short reason shown in the announcement
+
+    Returns:
+        bool: True if the action was applied
+    """
+    me = await get_bot_user(client)
+    success, message = await moderate_target(client, SystemEvent(chat_id, me), user, action, rights, None, duration)
+    if success:
+        announcement = f"🤖 {message.lstrip('✅ ').rstrip('.')}"
+        await send_message(client, chat_id, f"{announcement} ({reason})." if reason else f"{announcement}.")
+    else:
+        logger.info(f"Automatic {action} of {user.id} in {chat_id} not applied: {message}")
+    return success
+
+def _display_ref(ref):
+    return ref if ref.isdigit() else f"@{ref}"
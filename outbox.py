@@ -0,0 +1,326 @@
+"""
+Outbound Scheduler Module for Telegram Moderation Bot
+
+Every message, file and moderation request the bot sends goes through here:
+- Per-chat queues ordered by priority (moderation > command replies > greetings)
+- Per-chat pacing plus a global send rate shared by all chats
+- FloodWait handling: the wait is honoured for that chat only, then retried
+- Greetings yield to urgent items in any chat not held by a FloodWait (for
+  at most a set time, so a steady stream of commands cannot starve them),
+  and are dropped first when a chat's queue grows too long; identical
+  queued items can be merged
+
+Handlers await the returned result exactly as if they had called the client.
+
+Author: Divyansh Shakya
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from telethon import utils as tg_utils
+from telethon.errors.rpcerrorlist import FloodWaitError
+from utils import logger, get_rpc_counter, set_rpc_counter
+from config import OUTBOX_CHAT_INTERVAL, OUTBOX_GLOBAL_RATE, OUTBOX_MAX_QUEUE, OUTBOX_GREETING_MAX_WAIT
+
+# Priority classes (lower runs first)
+MODERATION = 0
+REPLY = 1
+GREETING = 2
+
+
+class _Item:
+    """One queued outbound call and the future its caller is waiting on."""
+
+    __slots__ = ('priority', 'seq', 'make_call', 'merge_key', 'future', 'cancelled', 'rpc_counter', 'queued_at')
+
+    def __init__(self, priority, seq, make_call, merge_key, future):
+        self.rpc_counter = get_rpc_counter()
+        self.queued_at = time.monotonic()
+        self.priority = priority
+        self.seq = seq
+        self.make_call = make_call
+        self.merge_key = merge_key
+        self.future = future
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _ChatQueue:
+    """Pending items and pacing state for one chat."""
+
+    __slots__ = ('heap', 'merge', 'next_allowed', 'worker', 'urgent', 'deferred', 'wake')
+
+    def __init__(self):
+        self.heap = []
+        self.merge = {}  # merge_key -> queued _Item
+        self.next_allowed = 0.0
+        self.worker = None
+        self.urgent = 0  # Queued moderation/reply items
+        self.deferred = False  # In FloodWait: its urgent items don't hold back other chats
+        self.wake = asyncio.Event()  # Set for a greeting waiting on the urgent gate
+
+
+class OutboundScheduler:
+    """
+    Priority scheduler for everything the bot sends.
+
+    Args:
+        chat_interval (float): Minimum seconds between sends in one chat
+        global_rate (float): Maximum sends per second across all chats
+        max_queue (int): Queue length per chat before greetings are dropped
+        greeting_max_wait (float): Seconds a greeting yields to urgent items
+            in other chats before it is sent anyway
+    """
+
+    def __init__(self, chat_interval, global_rate, max_queue, greeting_max_wait):
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate
+        self.max_queue = max_queue
+        self.greeting_max_wait = greeting_max_wait
+        self._chats = {}
+        self._seq = itertools.count()
+        self._global_next = 0.0
+        self._urgent_pending = 0  # Urgent items queued in chats not in FloodWait
+        self._waiting = set()  # Chats whose next item is a greeting held by the gate
+        self.stats = {'sent': 0, 'dropped': 0, 'merged': 0, 'flood_waits': 0, 'flood_wait_seconds': 0,
+                      'greetings_aged': 0}
+
+    async def submit(self, chat_id, priority, make_call, merge_key=None):
+        """
+        Queue an outbound call and wait for its result.
+
+        Args:
+            chat_id (int): Marked chat ID used for per-chat ordering and pacing
+            priority (int): MODERATION, REPLY or GREETING
+            make_call: Zero-argument callable returning the coroutine to run
+            merge_key: Optional key; a newer item with the same key replaces a
+                still-queued older one and both callers receive its result
+
+        Returns:
+            The call's result, or None if the item was dropped
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = _ChatQueue()
+
+        item = _Item(priority, next(self._seq), make_call, merge_key, loop.create_future())
+
+        if merge_key is not None:
+            older = queue.merge.get(merge_key)
+            if older is not None and not older.cancelled:
+                older.cancelled = True
+                self._track_done(older, queue)
+                item.future.add_done_callback(lambda f, old=older.future: _chain(f, old))
+                self.stats['merged'] += 1
+            queue.merge[merge_key] = item
+
+        heapq.heappush(queue.heap, item)
+        if priority < GREETING:
+            queue.urgent += 1
+            if not queue.deferred:
+                self._urgent_pending += 1
+            # A worker holding back a greeting must run this item first
+            queue.wake.set()
+
+        if len(queue.heap) > self.max_queue:
+            self._drop_greetings(chat_id, queue)
+
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self._run_chat(chat_id, queue))
+
+        return await item.future
+
+    def _drop_greetings(self, chat_id, queue):
+        """Drop the oldest queued greetings until the chat is back under max_queue."""
+        # Compact away merged/dropped items first so only live items count
+        queue.heap = [item for item in queue.heap if not item.cancelled]
+        heapq.heapify(queue.heap)
+        excess = len(queue.heap) - self.max_queue
+        if excess <= 0:
+            return
+
+        greetings = sorted(
+            (item for item in queue.heap if item.priority == GREETING),
+            key=lambda item: item.seq
+        )[:excess]
+        for item in greetings:
+            item.cancelled = True
+            if not item.future.done():
+                item.future.set_result(None)
+        self.stats['dropped'] += len(greetings)
+        if greetings:
+            logger.warning(f"Outbox for {chat_id} is backed up, dropped {len(greetings)} greeting(s)")
+
+    def _track_done(self, item, queue):
+        if item.priority < GREETING:
+            queue.urgent -= 1
+            if not queue.deferred:
+                self._urgent_add(-1)
+
+    def _urgent_add(self, count):
+        self._urgent_pending += count
+        if self._urgent_pending <= 0:
+            self._urgent_pending = 0
+            for queue in self._waiting:
+                queue.wake.set()
+
+    def _defer(self, queue, deferred):
+        """Take a chat's urgent items out of (or back into) the greeting gate."""
+        if queue.deferred != deferred:
+            queue.deferred = deferred
+            self._urgent_add(-queue.urgent if deferred else queue.urgent)
+
+    async def _run_chat(self, chat_id, queue):
+        """Drain one chat's queue in priority order, honouring pacing and FloodWait."""
+        try:
+            while queue.heap:
+                item = heapq.heappop(queue.heap)
+                if item.cancelled:
+                    continue
+
+                # Greetings wait until no moderation/reply is pending in a chat
+                # that can send; woken when that changes or an urgent item lands
+                # here, and sent anyway once they have waited greeting_max_wait
+                if item.priority == GREETING and self._urgent_pending:
+                    waited = time.monotonic() - item.queued_at
+                    if waited < self.greeting_max_wait:
+                        heapq.heappush(queue.heap, item)
+                        queue.wake.clear()
+                        self._waiting.add(queue)
+                        try:
+                            await asyncio.wait_for(queue.wake.wait(), self.greeting_max_wait - waited)
+                        except asyncio.TimeoutError:
+                            pass
+                        finally:
+                            self._waiting.discard(queue)
+                        continue
+                    self.stats['greetings_aged'] += 1
+
+                await self._pace(queue)
+                # Any FloodWait on this chat is over: its urgent items count again
+                self._defer(queue, False)
+
+                # A more urgent item may have arrived while we were pacing
+                if queue.heap and queue.heap[0] < item:
+                    heapq.heappush(queue.heap, item)
+                    continue
+
+                # Once running, the item can no longer absorb newer duplicates
+                if item.merge_key is not None and queue.merge.get(item.merge_key) is item:
+                    del queue.merge[item.merge_key]
+
+                # Charge the RPC to the handler that queued it
+                set_rpc_counter(item.rpc_counter)
+                try:
+                    result = await item.make_call()
+                except FloodWaitError as e:
+                    self.stats['flood_waits'] += 1
+                    self.stats['flood_wait_seconds'] += e.seconds
+                    queue.next_allowed = time.monotonic() + e.seconds
+                    self._defer(queue, True)
+                    logger.warning(f"FloodWait of {e.seconds}s in {chat_id}, deferring its queue")
+                    heapq.heappush(queue.heap, item)
+                    continue
+                except Exception as e:
+                    self._track_done(item, queue)
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                    continue
+
+                self.stats['sent'] += 1
+                self._track_done(item, queue)
+                if not item.future.done():
+                    item.future.set_result(result)
+        finally:
+            queue.worker = None
+            if not queue.heap and self._chats.get(chat_id) is queue:
+                del self._chats[chat_id]
+
+    async def _pace(self, queue):
+        """Sleep until both the chat and the global send slot are free."""
+        now = time.monotonic()
+        if queue.next_allowed > now:
+            await asyncio.sleep(queue.next_allowed - now)
+            now = time.monotonic()
+
+        slot = max(now, self._global_next)
+        self._global_next = slot + self.global_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        queue.next_allowed = time.monotonic() + self.chat_interval
+
+    def is_idle(self):
+        """True when nothing is queued or being sent."""
+        return not self._chats
+
+    def get_stats(self):
+        """
+        Get scheduler counters and current queue sizes.
+
+        Returns:
+            dict: sent/dropped/merged/flood-wait counters, greetings sent after
+            waiting out greeting_max_wait, queued items and chats
+        """
+        return {
+            **self.stats,
+            'queued': sum(len(q.heap) for q in self._chats.values()),
+            'chats': len(self._chats)
+        }
+
+
+def _chain(source, target):
+    """Copy a finished future's outcome to a merged-away caller's future."""
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def chat_key(chat):
+    """Marked chat ID for an entity, peer or ID, so one chat maps to one queue."""
+    if isinstance(chat, int):
+        return chat
+    return tg_utils.get_peer_id(chat)
+
+
+# Shared scheduler used by every module
+outbox = OutboundScheduler(OUTBOX_CHAT_INTERVAL, OUTBOX_GLOBAL_RATE, OUTBOX_MAX_QUEUE, OUTBOX_GREETING_MAX_WAIT)
+
+
+async def reply(event, *args, priority=REPLY, merge_key=None, **kwargs):
+    """Scheduled equivalent of event.reply()"""
+    return await outbox.submit(event.chat_id, priority, lambda: event.reply(*args, **kwargs), merge_key)
+
+
+async def send_message(client, chat, *args, priority=REPLY, merge_key=None, **kwargs):
+    """Scheduled equivalent of client.send_message()"""
+    return await outbox.submit(chat_key(chat), priority, lambda: client.send_message(chat, *args, **kwargs), merge_key)
+
+
+async def send_file(client, chat, *args, priority=GREETING, merge_key=None, **kwargs):
+    """Scheduled equivalent of client.send_file()"""
+    return await outbox.submit(chat_key(chat), priority, lambda: client.send_file(chat, *args, **kwargs), merge_key)
+
+
+async def send_request(client, chat, request, priority=MODERATION):
+    """Scheduled equivalent of client(request) for chat-scoped write requests"""
+    return await outbox.submit(chat_key(chat), priority, lambda: client(request))
+
+
+async def kick_participant(client, chat, user, priority=MODERATION):
+    """Scheduled equivalent of client.kick_participant()"""
+    return await outbox.submit(chat_key(chat), priority, lambda: client.kick_participant(chat, user))
+
+
+async def delete_messages(client, chat, message_ids, priority=MODERATION):
+    """Scheduled equivalent of client.delete_messages()"""
+    return await outbox.submit(chat_key(chat), priority, lambda: client.delete_messages(chat, message_ids))
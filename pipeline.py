@@ -0,0 +1,214 @@
+"""
+Analysis Pipeline Module for Telegram Moderation Bot
+
+This module can move CPU-heavy per-message analysis off the event loop:
+- Message watchers submit (analysis function, compact input) jobs; with
+  PIPELINE_WORKERS > 0 they are sent in batches to a pool of worker
+  processes, and verdicts come back asynchronously
+- Verdicts are applied in the event loop in message order per chat: a
+  chat's later messages wait for its earlier ones, other chats do not
+- Backpressure: past PIPELINE_MAX_PENDING queued jobs, new jobs run in the
+  loop instead (still in order); with no workers, or once the pool has
+  failed, everything runs in the loop
+
+Only pure, module-level functions of plain data can be analysed in workers;
+anything needing the event, the client or shared state belongs in the
+apply callback. Workers are forked, so string hashes (and the fingerprints
+built from them) match the ones computed in the loop; without fork the
+pipeline stays in the loop. Forking a process with other threads running
+can leave a child stuck on a lock one of them held, so the workers are
+forked first thing at startup with the log writer thread paused, and not
+at all if any other thread is alive.
+
+Author: Divyansh Shakya
+"""
+
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils import logger, logging_paused
+from metrics import pipeline_jobs
+from config import PIPELINE_WORKERS, PIPELINE_BATCH_SIZE, PIPELINE_MAX_PENDING
+
+# Result placeholder of a job still in a worker
+PENDING = object()
+
+
+def _run_batch(jobs):
+    """Run a batch of (function, argument) jobs in a worker process."""
+    results = []
+    for func, arg in jobs:
+        try:
+            results.append((True, func(arg)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class AnalysisPipeline:
+    """
+    Per-chat ordered message analysis, in worker processes or in the loop.
+
+    Each chat with jobs in flight has a queue of slots [result, apply];
+    a slot is applied once it and every slot before it have a result.
+
+    Args:
+        workers (int): Worker processes (0 = run everything in the loop)
+        batch_size (int): Jobs sent to a worker at once
+        max_pending (int): Jobs queued in workers before new jobs run in the loop
+    """
+
+    def __init__(self, workers, batch_size, max_pending):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._executor = None
+        self._queues = {}  # chat ID -> deque of [result, apply]
+        self._batch = []  # (chat ID, slot, function, argument) not yet sent
+        self._pending = 0
+        self.stats = {'pool': 0, 'loop': 0, 'saturated': 0, 'failed': 0}
+
+    def start(self):
+        """
+        Start the worker processes, if configured.
+
+        Call first thing at startup: workers are forked right away, before
+        the client connects and before any worker thread exists.
+        """
+        if not self.workers or self._executor is not None:
+            return
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            logger.warning("Analysis workers need fork; analysing messages in the event loop")
+            return
+        with logging_paused():
+            threads = [t.name for t in threading.enumerate() if t is not threading.current_thread()]
+            if not threads:
+                executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+                # Fork every worker now (a fork-context pool starts them all on first use,
+                # before its own management thread)
+                executor.submit(int).result()
+                self._executor = executor
+        if threads:
+            logger.warning(f"Not forking analysis workers while other threads run ({', '.join(threads)}); "
+                           f"analysing messages in the event loop")
+            return
+        logger.info(f"Started {self.workers} message analysis workers")
+
+    def close(self):
+        """Stop the workers; jobs still queued are dropped."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def pending(self):
+        """Jobs submitted to workers whose verdict has not been applied yet."""
+        return self._pending
+
+    def submit(self, chat_id, func, arg, apply):
+        """
+        Analyse one message and apply the verdict in the loop, in chat order.
+
+        Args:
+            chat_id (int): Chat the message belongs to (the ordering key)
+            func: Module-level function run on arg (None = nothing to analyse)
+            arg: Picklable input for func, e.g. the message text
+            apply: Callback taking func(arg) (or None), run in the event loop
+        """
+        queue = self._queues.get(chat_id)
+        if func is None or self._executor is None or self._pending >= self.max_pending:
+            if func is not None:
+                self.stats['loop'] += 1
+                pipeline_jobs.inc('loop')
+                if self._executor is not None:
+                    self.stats['saturated'] += 1
+                    pipeline_jobs.inc('saturated')
+            result = func(arg) if func is not None else None
+            if queue is None:
+                apply(result)
+            else:
+                # Earlier messages of this chat are still in a worker
+                queue.append([result, apply])
+            return
+
+        slot = [PENDING, apply]
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append(slot)
+        self._pending += 1
+        self.stats['pool'] += 1
+        pipeline_jobs.inc('pool')
+        self._batch.append((chat_id, slot, func, arg))
+        if len(self._batch) >= self.batch_size:
+            self._send_batch()
+        elif len(self._batch) == 1:
+            # Messages arriving together are sent together
+            asyncio.get_running_loop().call_soon(self._send_batch)
+
+    def _send_batch(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        try:
+            future = asyncio.wrap_future(self._executor.submit(_run_batch, [(func, arg) for _, _, func, arg in batch]))
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        future.add_done_callback(lambda done: self._finish_batch(batch, done))
+
+    def _finish_batch(self, batch, future):
+        if future.cancelled() or future.exception() is not None:
+            self._fail(batch, future.exception() if not future.cancelled() else 'cancelled')
+            return
+        for (chat_id, slot, _, _), (ok, value) in zip(batch, future.result()):
+            if not ok:
+                logger.error(f"Message analysis failed in {chat_id}: {value}")
+            slot[0] = value if ok else None
+        self._pending -= len(batch)
+        for chat_id in {chat_id for chat_id, _, _, _ in batch}:
+            self._drain(chat_id)
+
+    def _fail(self, batch, error):
+        """A batch could not be analysed in a worker: analyse it here and stop using the pool."""
+        if self._executor is not None:
+            logger.error(f"Message analysis workers failed ({error}); analysing in the event loop")
+            self.close()
+        self.stats['failed'] += len(batch)
+        for chat_id, slot, func, arg in batch:
+            try:
+                slot[0] = func(arg)
+            except Exception as e:
+                logger.error(f"Message analysis failed in {chat_id}: {e}")
+                slot[0] = None
+        self._pending -= len(batch)
+        for chat_id in {chat_id for chat_id, _, _, _ in batch}:
+            self._drain(chat_id)
+
+    def _drain(self, chat_id):
+        """Apply a chat's finished verdicts, stopping at the first still in a worker."""
+        queue = self._queues.get(chat_id)
+        while queue and queue[0][0] is not PENDING:
+            result, apply = queue.popleft()
+            try:
+                apply(result)
+            except Exception as e:
+                logger.error(f"Applying message analysis failed in {chat_id}: {e}")
+        if not queue:
+            self._queues.pop(chat_id, None)
+
+    def get_stats(self):
+        """
+        Get job counters.
+
+        Returns:
+            dict: jobs analysed in workers / in the loop, loop runs caused by
+            backpressure, jobs re-run after a pool failure, jobs pending and
+            the configured number of workers
+        """
+        return {**self.stats, 'pending': self._pending, 'workers': self.workers}
+
+
+# Shared analysis pipeline
+analysis_pipeline = AnalysisPipeline(PIPELINE_WORKERS, PIPELINE_BATCH_SIZE, PIPELINE_MAX_PENDING)
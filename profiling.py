@@ -0,0 +1,155 @@
+"""
+Profiling Module for Telegram Moderation Bot
+
+This module answers "where did the time go?" for slow commands:
+- A decorator recording wall time, RPC count and RPC time per handler call;
+  the wall time also feeds the bot_handler_seconds metric, so each call is
+  timed once
+- Rolling per-handler samples for p50/p95/p99 and the slowest recent calls
+- Optional sampled cProfile capture, toggled at runtime from /perf
+
+Every handler in commands.py, welcome.py and userinfo.py is wrapped with
+@profiled(name); the admin-only /perf command renders the results.
+
+Author: Divyansh Shakya
+"""
+
+import io
+import time
+import pstats
+import random
+import cProfile
+import functools
+from collections import defaultdict, deque
+from utils import logger, get_rpc_counter, start_rpc_count
+from metrics import handler_seconds
+from config import PERF_SAMPLE_SIZE, PERF_PROFILE_RATE
+
+# handler name -> deque of (wall_seconds, rpc_count, rpc_seconds, finished_at)
+handler_samples = defaultdict(lambda: deque(maxlen=PERF_SAMPLE_SIZE))
+
+# Runtime-adjustable profiling state; captured profiles are (handler, wall, text)
+profile_settings = {'rate': PERF_PROFILE_RATE}
+captured_profiles = deque(maxlen=5)
+_profile_active = False
+
+
+def _profile_text(profile, limit=12):
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def profiled(name):
+    """
+    Decorator recording timing for every call of an async handler.
+
+    Args:
+        name (str): Handler name used in /perf output
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            global _profile_active
+            counter = get_rpc_counter()
+            if counter is None:
+                start_rpc_count()
+                counter = get_rpc_counter()
+            rpc_count_before, rpc_time_before = counter
+
+            # cProfile is process-wide, so only one sampled call at a time
+            profile = None
+            if profile_settings['rate'] and not _profile_active and random.random() < profile_settings['rate']:
+                profile = cProfile.Profile()
+                _profile_active = True
+                profile.enable()
+
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - started
+                if profile is not None:
+                    profile.disable()
+                    _profile_active = False
+                    captured_profiles.append((name, wall, _profile_text(profile)))
+                handler_samples[name].append(
+                    (wall, counter[0] - rpc_count_before, counter[1] - rpc_time_before, time.time())
+                )
+                handler_seconds.observe(wall, name)
+        return wrapper
+    return decorator
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def format_perf_summary():
+    """
+    Build the /perf table: calls and latency percentiles per handler.
+
+    Returns:
+        str: Message text
+    """
+    if not handler_samples:
+        return "📈 No handler timings recorded yet."
+
+    text = "📈 **Handler Performance** (recent calls, ms)\n\n"
+    for name in sorted(handler_samples):
+        samples = handler_samples[name]
+        if not samples:
+            continue
+        walls = sorted(sample[0] * 1000 for sample in samples)
+        avg_rpcs = sum(sample[1] for sample in samples) / len(samples)
+        avg_rpc_ms = sum(sample[2] for sample in samples) * 1000 / len(samples)
+        text += (
+            f"• `{name}` n={len(samples)} "
+            f"p50={_percentile(walls, 0.5):.0f} p95={_percentile(walls, 0.95):.0f} p99={_percentile(walls, 0.99):.0f} "
+            f"rpcs={avg_rpcs:.1f} ({avg_rpc_ms:.0f}ms)\n"
+        )
+    text += f"\n🔬 Profiling: {'sampling ' + format(profile_settings['rate'], '.0%') if profile_settings['rate'] else 'off'}"
+    return text
+
+
+def format_slowest(count=5):
+    """
+    List the slowest recent invocations across all handlers.
+
+    Returns:
+        str: Message text
+    """
+    calls = [
+        (wall, name, rpcs, rpc_time, finished)
+        for name, samples in handler_samples.items()
+        for wall, rpcs, rpc_time, finished in samples
+    ]
+    if not calls:
+        return "📈 No handler timings recorded yet."
+
+    text = "🐢 **Slowest Recent Calls:**\n\n"
+    for wall, name, rpcs, rpc_time, finished in sorted(calls, reverse=True)[:count]:
+        timestamp = time.strftime('%H:%M:%S', time.localtime(finished))
+        text += f"• `{timestamp}` `{name}` {wall * 1000:.0f}ms, {rpcs} RPCs ({rpc_time * 1000:.0f}ms)\n"
+    return text
+
+
+def format_last_profile():
+    """
+    Show the most recent sampled cProfile capture.
+
+    Returns:
+        str: Message text
+    """
+    if not captured_profiles:
+        return "🔬 No profiles captured. Enable sampling with `/perf profile 0.05`."
+    name, wall, report = captured_profiles[-1]
+    # Keep within Telegram's message size limit
+    return f"🔬 **Profile of `{name}`** ({wall * 1000:.0f}ms)\n```\n{report[:3500]}\n```"
+
+
+def set_profile_rate(rate):
+    """Change the cProfile sampling rate (0 disables it)."""
+    profile_settings['rate'] = max(0.0, min(1.0, rate))
+    logger.info(f"cProfile sampling rate set to {profile_settings['rate']}")
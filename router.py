@@ -0,0 +1,152 @@
+"""
+Command Router Module for Telegram Moderation Bot
+
+This module dispatches every bot command through a single NewMessage handler:
+- One cheap first-character check so ordinary chat messages cost almost nothing
+- Table lookup by command name, including aliases and /cmd@BotName
+- Shared middleware for rate limiting and admin-only gating
+- Optional per-command regex, applied only after dispatch, for argument parsing
+- Watchers: cheap synchronous callbacks that see every message (anti-flood)
+- Stale commands (delivered late, e.g. the backlog after downtime) are ignored
+
+Handlers keep using event.pattern_match exactly as with Telethon patterns.
+
+Author: Divyansh Shakya
+"""
+
+import re
+from telethon import events
+from security import check_rate_limit, check_user_is_admin, get_bot_user
+from utils import logger, start_rpc_count, set_log_context
+from outbox import reply
+from metrics import handler_errors
+from catchup import catch_up
+from config import CATCH_UP_COMMAND_MAX_AGE
+
+RATE_LIMIT_TEXT = "⏱️ Please wait before using another command."
+ADMIN_ONLY_TEXT = "❌ Only admins can use this command."
+
+
+class Command:
+    """A registered command and its middleware settings."""
+
+    def __init__(self, name, handler, pattern=None, admin_only=False,
+                 rate_limited=True, denied_text=ADMIN_ONLY_TEXT):
+        self.name = name
+        self.handler = handler
+        self.pattern = re.compile(pattern) if pattern else None
+        self.admin_only = admin_only
+        self.rate_limited = rate_limited
+        self.denied_text = denied_text
+
+
+class CommandRouter:
+    """
+    Routes bot commands to their handlers from one NewMessage handler.
+
+    Usage:
+        router = CommandRouter(client)
+
+        @router.command('ban', admin_only=True)
+        async def ban_cmd(event):
+            ...
+
+        router.install()
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = {}
+        self.watchers = []
+
+    def command(self, name, aliases=(), pattern=None, admin_only=False,
+                rate_limited=True, denied_text=ADMIN_ONLY_TEXT):
+        """
+        Decorator registering a command handler under a name and its aliases.
+
+        Args:
+            name (str): Command name without the leading slash
+            aliases (tuple): Alternative names for the same command
+            pattern (str): Optional regex matched against the normalized text
+                (``/name args``); the match is exposed as event.pattern_match
+            admin_only (bool): Reject senders who are not chat admins
+            rate_limited (bool): Charge the command against the rate limiter
+                (costs come from config.COMMAND_COSTS)
+            denied_text (str): Reply sent when admin_only rejects a sender
+        """
+        def decorator(handler):
+            command = Command(name, handler, pattern, admin_only, rate_limited, denied_text)
+            for key in (name, *aliases):
+                self.commands[key.lower()] = command
+            return handler
+        return decorator
+
+    def watch(self, callback):
+        """
+        Run a callback for every incoming message, before command lookup.
+
+        Watchers run synchronously inside the dispatching handler, so they
+        must be cheap and start a task for anything that awaits.
+
+        Args:
+            callback: Function taking the NewMessage event
+        """
+        self.watchers.append(callback)
+
+    def install(self):
+        """Attach the single dispatching handler to the client."""
+        self.client.add_event_handler(self.dispatch, events.NewMessage())
+
+    async def dispatch(self, event):
+        """Look up and run the command in a message, if any."""
+        age = catch_up.observe(event)
+        for watcher in self.watchers:
+            try:
+                watcher(event)
+            except Exception as e:
+                logger.error(f"Message watcher failed: {e}")
+
+        text = event.raw_text
+        if not text or text[0] != '/':
+            return
+
+        parts = text.split(None, 1)
+        rest = parts[1] if len(parts) > 1 else ''
+        name, _, target_bot = parts[0][1:].partition('@')
+        command = self.commands.get(name.lower())
+        if command is None:
+            return
+
+        # /cmd@OtherBot is meant for a different bot in the same group
+        if target_bot:
+            me = await get_bot_user(self.client)
+            if not me.username or target_bot.lower() != me.username.lower():
+                return
+
+        # Nobody is waiting for the answer to a command sent long ago
+        if age > CATCH_UP_COMMAND_MAX_AGE:
+            catch_up.discard('command')
+            return
+
+        start_rpc_count()
+        set_log_context(chat_id=event.chat_id, user_id=event.sender_id, command=command.name)
+
+        if command.pattern is not None:
+            normalized = f"/{command.name} {rest}" if rest else f"/{command.name}"
+            event.pattern_match = command.pattern.match(normalized)
+            if event.pattern_match is None:
+                return
+
+        try:
+            if command.rate_limited and not await check_rate_limit(event.sender_id, event.chat_id, command.name):
+                await reply(event, RATE_LIMIT_TEXT, merge_key=('rate_limit', event.sender_id))
+                return
+
+            if command.admin_only and not await check_user_is_admin(self.client, event):
+                await reply(event, command.denied_text)
+                return
+
+            await command.handler(event)
+        except Exception as e:
+            handler_errors.inc(command.name)
+            logger.error(f"Error handling /{command.name}: {e}")
@@ -2,10 +2,13 @@
 Security Module for Telegram Moderation Bot
 
 This module provides security functions for the bot including:
-- Rate limiting to prevent command spam
+- Rate limiting to prevent command spam (budgets in the shared state backend)
 - Admin permission checks
 - User role verification (admin, creator)
 - Bot permission validation
+- Per-chat admin roster cache (bulk-loaded, TTL-bound, invalidated by updates);
+  chats whose roster cannot be loaded (e.g. basic groups) are remembered for
+  ADMIN_ROSTER_RETRY seconds and checked per user meanwhile
 
 All moderation commands use these functions to ensure secure operation.
 
@@ -13,38 +16,300 @@ Author: Divyansh Shakya
 """
 
 import time
-from collections import defaultdict
-from telethon.tl.functions.channels import GetParticipantRequest
-from telethon.tl.types import ChannelParticipantAdmin, ChannelParticipantCreator
-from utils import logger
-from config import COMMAND_COOLDOWN
+import asyncio
+from telethon import events, utils as tg_utils
+from telethon.tl.functions.channels import GetParticipantRequest, GetParticipantsRequest
+from telethon.tl.types import (
+    ChannelParticipantAdmin, ChannelParticipantCreator, ChannelParticipantsAdmins,
+    UpdateChannelParticipant, UpdateChatParticipantAdmin, PeerChannel, PeerChat
+)
+from utils import logger, tl_from_bytes, ExpiringSet
+from metrics import rate_limit_denials
+from state import get_state, StateError
+from config import (
+    ADMIN_CACHE_TTL, ADMIN_ROSTER_RETRY, ADMIN_ROSTER_MAX_FAILED, RATE_LIMIT_BURST, RATE_LIMIT_REFILL, CHAT_RATE_LIMIT_BURST,
+    CHAT_RATE_LIMIT_REFILL, COMMAND_COSTS, DEFAULT_COMMAND_COST
+)
 
-# Rate limiting storage: tracks last command time for each user
-user_last_command = defaultdict(float)
 
-def check_rate_limit(user_id):
+class SlidingWindowLimiter:
+    """
+    Spending budgets over a sliding window, kept in the shared state backend.
+
+    A key may spend `capacity` per window of capacity / refill_rate seconds.
+    Spending is counted per fixed window with atomic increments; the
+    previous window's count is weighted by how much of it still overlaps
+    the sliding window. Only incr is needed, so any backend can hold the
+    counters and several processes share the budgets.
+
+    Args:
+        name (str): Key namespace
+        capacity (float): Budget per window (burst size)
+        refill_rate (float): Window rate, the average spend per second
+    """
+
+    def __init__(self, name, capacity, refill_rate):
+        self.name = name
+        self.capacity = capacity
+        self.window = capacity / refill_rate
+
+    def keys(self, key, now):
+        """
+        Counter keys of the current and previous window.
+
+        Returns:
+            tuple: (current key, previous key, weight of the previous window)
+        """
+        index, offset = divmod(now, self.window)
+        index = int(index)
+        return (f"rl:{self.name}:{key}:{index}", f"rl:{self.name}:{key}:{index - 1}",
+                1 - offset / self.window)
+
+
+# Rate limiting budgets: one per (chat, user) and one aggregate per chat
+user_limiter = SlidingWindowLimiter('user', RATE_LIMIT_BURST, RATE_LIMIT_REFILL)
+chat_limiter = SlidingWindowLimiter('chat', CHAT_RATE_LIMIT_BURST, CHAT_RATE_LIMIT_REFILL)
+
+# Rate limiting counters: allowed commands and denials by which bucket ran dry
+rate_limit_stats = {'allowed': 0, 'denied_user': 0, 'denied_chat': 0}
+
+# Admin roster cache: chat_id -> AdminRoster, plus the load in flight per chat
+admin_rosters = {}
+_roster_loads = {}
+
+# Chats whose roster could not be loaded recently; admin checks go per user
+rosters_unavailable = ExpiringSet(ADMIN_ROSTER_RETRY, ADMIN_ROSTER_MAX_FAILED)
+
+# Cached bot identity (get_me() never changes for a running session)
+_bot_user = None
+
+
+class AdminRoster:
+    """
+    Snapshot of a chat's administrators and creator.
+
+    Attributes:
+        admins (dict): user_id -> ChannelParticipantAdmin/ChannelParticipantCreator
+        creator_id (int): ID of the group creator, or None if not visible
+        loaded_at (float): Monotonic time the roster was fetched
+    """
+
+    def __init__(self, participants):
+        self.admins = {p.user_id: p for p in participants}
+        self.creator_id = next(
+            (p.user_id for p in participants if isinstance(p, ChannelParticipantCreator)), None
+        )
+        self.loaded_at = time.monotonic()
+
+    def is_fresh(self):
+        return time.monotonic() - self.loaded_at < ADMIN_CACHE_TTL
+
+
+async def get_bot_user(client):
+    """
+    Return the bot's own User object, fetching it only once per process.
+
+    Args:
+        client: Telethon client instance
+
+    Returns:
+        User: The bot account
+    """
+    global _bot_user
+    if _bot_user is None:
+        _bot_user = await client.get_me()
+    return _bot_user
+
+
+async def get_admin_roster(client, chat_id):
+    """
+    Get the cached admin roster for a chat, bulk-loading it on a miss.
+
+    All admins and the creator are fetched in a single GetParticipantsRequest
+    with the admins filter. Concurrent callers for the same chat share one load.
+    A failed load is remembered for ADMIN_ROSTER_RETRY seconds, so callers
+    go straight to the per-user check instead of retrying it every time.
+
+    Args:
+        client: Telethon client instance
+        chat_id (int): Chat/group ID
+
+    Returns:
+        AdminRoster: Roster for the chat, or None if it could not be loaded
+    """
+    roster = admin_rosters.get(chat_id)
+    if roster and roster.is_fresh():
+        return roster
+    if chat_id in rosters_unavailable:
+        return None
+
+    load = _roster_loads.get(chat_id)
+    if load is None:
+        # A task of its own, so a caller being cancelled does not cancel it for the others
+        load = _roster_loads[chat_id] = asyncio.ensure_future(_load_admin_roster(client, chat_id))
+        load.add_done_callback(lambda done: _roster_loads.pop(chat_id) if _roster_loads.get(chat_id) is done else None)
+    return await asyncio.shield(load)
+
+
+async def _load_admin_roster(client, chat_id):
+    try:
+        result = await client(GetParticipantsRequest(
+            channel=chat_id,
+            filter=ChannelParticipantsAdmins(),
+            offset=0,
+            limit=200,
+            hash=0
+        ))
+    except Exception as e:
+        logger.error(f"Error loading admin roster for {chat_id}: {e}")
+        rosters_unavailable.add(chat_id)
+        return None
+
+    roster = AdminRoster(result.participants)
+    admin_rosters[chat_id] = roster
+    return roster
+
+
+def invalidate_admin_roster(chat_id):
+    """Drop the cached admin roster for a chat so the next check reloads it."""
+    admin_rosters.pop(chat_id, None)
+    # Roles changed, so a roster that failed to load may load now
+    rosters_unavailable.discard(chat_id)
+
+
+def handle_members_left(chat_id, user_ids):
+    """Invalidate a chat's roster if any of the departed users was an admin."""
+    roster = admin_rosters.get(chat_id)
+    if roster and any(user_id in roster.admins for user_id in user_ids):
+        invalidate_admin_roster(chat_id)
+
+
+def dump_admin_cache():
+    """
+    Fresh admin rosters and the bot's identity, serialized for a snapshot.
+
+    Returns:
+        dict: rosters (chat_id -> (age in seconds, serialized participants))
+        and bot_user (serialized User or None)
+    """
+    now = time.monotonic()
+    return {
+        'rosters': {
+            chat_id: (now - roster.loaded_at, [bytes(p) for p in roster.admins.values()])
+            for chat_id, roster in admin_rosters.items() if roster.is_fresh()
+        },
+        'bot_user': bytes(_bot_user) if _bot_user is not None else None
+    }
+
+
+def load_admin_cache(data, elapsed=0.0):
+    """
+    Restore rosters and the bot's identity saved by dump_admin_cache().
+
+    Args:
+        data (dict): Output of dump_admin_cache()
+        elapsed (float): Seconds since the snapshot was taken
+    """
+    global _bot_user
+    if data['bot_user'] is not None and _bot_user is None:
+        _bot_user = tl_from_bytes(data['bot_user'])
+    for chat_id, (age, participants) in data['rosters'].items():
+        if age + elapsed >= ADMIN_CACHE_TTL or chat_id in admin_rosters:
+            continue
+        roster = AdminRoster([tl_from_bytes(p) for p in participants])
+        roster.loaded_at -= age + elapsed
+        admin_rosters[chat_id] = roster
+
+
+def register_admin_cache_handler(client):
+    """
+    Keep admin rosters in sync with incoming participant updates.
+
+    Promotions and demotions invalidate the affected chat's roster; admins
+    leaving are reported by the ChatAction pipeline via handle_members_left.
+    Anything missed is covered by ADMIN_CACHE_TTL.
+
+    Args:
+        client: Telethon client instance
+    """
+    @client.on(events.Raw(types=(UpdateChannelParticipant, UpdateChatParticipantAdmin)))
+    async def admin_change_handler(update):
+        if isinstance(update, UpdateChannelParticipant):
+            chat_id = tg_utils.get_peer_id(PeerChannel(update.channel_id))
+            roles = (ChannelParticipantAdmin, ChannelParticipantCreator)
+            roster = admin_rosters.get(chat_id)
+            if (isinstance(update.prev_participant, roles)
+                    or isinstance(update.new_participant, roles)
+                    or (roster and update.user_id in roster.admins)):
+                invalidate_admin_roster(chat_id)
+        else:
+            invalidate_admin_roster(tg_utils.get_peer_id(PeerChat(update.chat_id)))
+
+
+async def _fetch_participant(client, chat_id, user_id):
+    """Fetch one participant record; fallback for when the roster is unavailable."""
+    participant = await client(GetParticipantRequest(
+        channel=chat_id,
+        participant=user_id
+    ))
+    return participant.participant
+
+async def check_rate_limit(user_id, chat_id=None, command=None):
     """
     Check if user is sending commands too fast.
     
-    Prevents command spam by enforcing a cooldown period between commands.
-    Each user can only execute one command every COMMAND_COOLDOWN seconds.
+    Prevents command spam with sliding-window budgets: each user has a
+    budget per chat and each chat has an aggregate budget shared by all its
+    users. A command spends COMMAND_COSTS[command] from both (cheap for
+    /help, expensive for /ban) and is allowed only if both can pay for it. Budgets
+    live in the shared state backend, so every bot process sees the same
+    ones; if the backend fails, commands are allowed.
     
     Args:
         user_id (int): Telegram user ID
+        chat_id (int): Chat/group ID (None for a single global scope)
+        command (str): Command name used to look up its cost
         
     Returns:
-        bool: True if user can execute command, False if still in cooldown
+        bool: True if user can execute command, False if rate limited
     """
-    current_time = time.time()
-    last_command_time = user_last_command[user_id]
-    
-    # Check if enough time has passed since last command
-    if current_time - last_command_time < COMMAND_COOLDOWN:
-        return False
+    now = time.time()  # Wall clock: shared by every process using the backend
+    cost = COMMAND_COSTS.get(command, DEFAULT_COMMAND_COST)
+    user_current, user_previous, user_weight = user_limiter.keys(f"{chat_id}:{user_id}", now)
+    chat_current, chat_previous, chat_weight = chat_limiter.keys(chat_id, now)
+    state = get_state()
+
+    try:
+        # Spend first, refund if over budget: check-and-spend stays atomic per counter
+        spent_user, previous_user, spent_chat, previous_chat = await (
+            state.pipeline()
+            .incr(user_current, cost, ttl=2 * user_limiter.window).get(user_previous)
+            .incr(chat_current, cost, ttl=2 * chat_limiter.window).get(chat_previous)
+            .execute()
+        )
+        user_used = spent_user + float(previous_user or 0) * user_weight
+        chat_used = spent_chat + float(previous_chat or 0) * chat_weight
+        if user_used <= user_limiter.capacity and chat_used <= chat_limiter.capacity:
+            rate_limit_stats['allowed'] += 1
+            return True
+        await state.pipeline().incr(user_current, -cost).incr(chat_current, -cost).execute()
+    except StateError as e:
+        logger.error(f"Rate limit check failed, allowing the command: {e}")
+        return True
+
+    scope = 'user' if user_used > user_limiter.capacity else 'chat'
+    rate_limit_stats['denied_' + scope] += 1
+    rate_limit_denials.inc(scope)
+    return False
+
+def get_rate_limit_stats():
+    """
+    Get rate limiter counters of this process.
     
-    # Update last command time for this user
-    user_last_command[user_id] = current_time
-    return True
+    Returns:
+        dict: allowed/denied counters
+    """
+    return dict(rate_limit_stats)
 
 async def check_user_is_admin(client, event):
     """
@@ -62,13 +327,14 @@ async def check_user_is_admin(client, event):
     """
     try:
         sender_id = event.sender_id
-        participant = await client(GetParticipantRequest(
-            channel=event.chat_id,
-            participant=sender_id
-        ))
+        roster = await get_admin_roster(client, event.chat_id)
+        if roster is not None:
+            return sender_id in roster.admins
+
+        participant = await _fetch_participant(client, event.chat_id, sender_id)
         
         # Check if user is admin or creator
-        if isinstance(participant.participant, (ChannelParticipantAdmin, ChannelParticipantCreator)):
+        if isinstance(participant, (ChannelParticipantAdmin, ChannelParticipantCreator)):
             return True
         return False
     except Exception as e:
@@ -91,11 +357,12 @@ async def check_user_is_creator(client, chat_id, user_id):
         bool: True if user is the group creator, False otherwise
     """
     try:
-        participant = await client(GetParticipantRequest(
-            channel=chat_id,
-            participant=user_id
-        ))
-        return isinstance(participant.participant, ChannelParticipantCreator)
+        roster = await get_admin_roster(client, chat_id)
+        if roster is not None:
+            return roster.creator_id == user_id
+
+        participant = await _fetch_participant(client, chat_id, user_id)
+        return isinstance(participant, ChannelParticipantCreator)
     except Exception as e:
         logger.error(f"Error checking creator status: {e}")
         return False
@@ -115,14 +382,15 @@ async def check_bot_admin_status(client, chat_id):
         bool: True if bot is admin or creator, False otherwise
     """
     try:
-        me = await client.get_me()
-        participant = await client(GetParticipantRequest(
-            channel=chat_id,
-            participant=me.id
-        ))
+        me = await get_bot_user(client)
+        roster = await get_admin_roster(client, chat_id)
+        if roster is not None:
+            return me.id in roster.admins
+
+        participant = await _fetch_participant(client, chat_id, me.id)
         
         # Check if bot has admin or creator status
-        if isinstance(participant.participant, (ChannelParticipantAdmin, ChannelParticipantCreator)):
+        if isinstance(participant, (ChannelParticipantAdmin, ChannelParticipantCreator)):
             return True
         return False
     except Exception as e:
@@ -145,13 +413,14 @@ async def check_user_admin_status(client, chat_id, user_id):
         bool: True if user is admin or creator, False otherwise
     """
     try:
-        participant = await client(GetParticipantRequest(
-            channel=chat_id,
-            participant=user_id
-        ))
+        roster = await get_admin_roster(client, chat_id)
+        if roster is not None:
+            return user_id in roster.admins
+
+        participant = await _fetch_participant(client, chat_id, user_id)
         
         # Check if user is admin or creator
-        if isinstance(participant.participant, (ChannelParticipantAdmin, ChannelParticipantCreator)):
+        if isinstance(participant, (ChannelParticipantAdmin, ChannelParticipantCreator)):
             return True
         return False
     except Exception as e:
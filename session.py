@@ -0,0 +1,342 @@
+"""
+Session Storage Module for Telegram Moderation Bot
+
+This module offers an alternative to Telethon's default SQLite session:
+- BufferedSession keeps the auth key, data center, update state, entity
+  (access hash) cache and sent-file cache in memory, with dict lookups by
+  ID, username and phone
+- Changes are written to disk in batches, from a worker thread, every
+  SESSION_FLUSH_INTERVAL seconds and when the client disconnects; nothing
+  touches the disk on the event loop while updates are handled
+- Writes are crash-safe (temporary file, fsync, atomic rename); a crash
+  loses at most the last interval of entity/update-state changes, which the
+  next start re-learns from Telegram
+- At startup the file is loaded; if it does not exist yet, the SQLite
+  session of the same name is imported, so switching modes needs no login
+
+Telethon's SQLite session runs an INSERT for every request result carrying
+users or chats and commits (with fsync) on the event loop; during a join
+storm that is steady disk I/O in the loop. Select the mode with
+SESSION_MODE.
+
+Author: Divyansh Shakya
+"""
+
+import os
+import time
+import asyncio
+import datetime
+import threading
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.sessions.memory import _SentFileType
+from telethon.tl.types import PeerUser, PeerChat, PeerChannel, InputPeerUser, InputPeerChannel
+from telethon.tl.types.updates import State
+from telethon import utils as tg_utils
+from telethon.crypto import AuthKey
+from utils import logger, encode_state_file, decode_state_file, write_file_atomic
+from config import SESSION_MODE, SESSION_FLUSH_INTERVAL
+
+MAGIC = b'TGSN'
+FORMAT_VERSION = 1
+
+# Suffix of the buffered session file (next to Telethon's .session file)
+EXTENSION = '.session.bin'
+
+
+class BufferedSession(MemorySession):
+    """
+    Telethon session held in memory and flushed to disk in the background.
+
+    Every change bumps a counter; the flusher copies the session in the loop
+    (plain dict/list copies) and encodes and writes it in a worker thread,
+    so any number of changes between flushes cost one write. A copy is
+    never written over a newer one.
+
+    Args:
+        path (str): Session file
+        flush_interval (float): Seconds between background writes
+    """
+
+    def __init__(self, path, flush_interval):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self._rows = {}  # marked ID -> (id, hash, username, phone, name)
+        self._usernames = {}  # lowercase username -> marked ID
+        self._phones = {}  # phone -> marked ID
+        self.save_entities = True
+        self._changes = 0  # Changes made so far...
+        self._written = 0  # ...and how many of them the file on disk has
+        self._flusher = None
+        self._lock = threading.Lock()  # One write at a time (flusher vs. close)
+        self.stats = {'flushes': 0, 'failures': 0, 'bytes': 0, 'collect_ms': 0.0, 'write_ms': 0.0}
+        self.load()
+
+    # --- Telethon session interface ---
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._changes += 1
+
+    @property
+    def auth_key(self):
+        return self._auth_key
+
+    @auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self._changes += 1
+
+    @property
+    def takeout_id(self):
+        return self._takeout_id
+
+    @takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self._changes += 1
+
+    def set_update_state(self, entity_id, state):
+        self._update_states[entity_id] = state
+        self._changes += 1
+
+    def process_entities(self, tlo):
+        if not self.save_entities:
+            return
+        rows = self._rows
+        for row in self._entities_to_rows(tlo):
+            old = rows.get(row[0])
+            if old == row:
+                continue
+            if old is not None and old[1] == row[1] and row[2:] == (None, None, None):
+                # Bare input peer (Telethon's periodic save): keep the username/phone/name known
+                continue
+            if old is not None:
+                if old[2] and self._usernames.get(old[2]) == old[0]:
+                    del self._usernames[old[2]]
+                if old[3] and self._phones.get(old[3]) == old[0]:
+                    del self._phones[old[3]]
+            rows[row[0]] = row
+            # The newest owner of a username or phone wins, like the SQLite session
+            if row[2]:
+                self._usernames[row[2]] = row[0]
+            if row[3]:
+                self._phones[row[3]] = row[0]
+            self._changes += 1
+
+    def _entity_to_row(self, e):
+        # Fast path for the bare input peers of Telethon's periodic save (thousands at a time)
+        if type(e) is InputPeerUser:
+            return e.user_id, e.access_hash, None, None, None
+        if type(e) is InputPeerChannel:
+            return tg_utils.get_peer_id(PeerChannel(e.channel_id)), e.access_hash, None, None, None
+        return super()._entity_to_row(e)
+
+    def _row_by(self, index, key):
+        row = self._rows.get(index.get(key))
+        return (row[0], row[1]) if row else None
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._row_by(self._phones, phone)
+
+    def get_entity_rows_by_username(self, username):
+        return self._row_by(self._usernames, username)
+
+    def get_entity_rows_by_name(self, name):
+        # Rare (Telethon's last resort for string keys), so a scan is fine
+        return next(((row[0], row[1]) for row in self._rows.values() if row[4] == name), None)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            ids = (id,)
+        else:
+            ids = (tg_utils.get_peer_id(PeerUser(id)), tg_utils.get_peer_id(PeerChat(id)),
+                   tg_utils.get_peer_id(PeerChannel(id)))
+        for marked_id in ids:
+            row = self._rows.get(marked_id)
+            if row:
+                return row[0], row[1]
+        return None
+
+    def cache_file(self, md5_digest, file_size, instance):
+        super().cache_file(md5_digest, file_size, instance)
+        self._changes += 1
+
+    def clone(self, to_instance=None):
+        # A throwaway session for another data center, not a second writer of this file
+        return to_instance or MemorySession()
+
+    def save(self):
+        # Telethon calls this after changes; they are written by the flusher instead
+        pass
+
+    def close(self):
+        """Stop the flusher and write pending changes (Telethon calls this on disconnect)."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._changes > self._written:
+            self.flush()
+
+    def delete(self):
+        """Forget the session on disk (Telethon calls this on log out)."""
+        self._written = self._changes
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    # --- Persistence ---
+
+    def _collect(self):
+        """Copy of the session as plain values, taken in the loop."""
+        started = time.perf_counter()
+        data = {
+            'dc': (self._dc_id, self._server_address, self._port),
+            'auth_key': self._auth_key.key if self._auth_key else None,
+            'takeout_id': self._takeout_id,
+            'states': {entity_id: (state.pts, state.qts, state.date.timestamp(), state.seq)
+                       for entity_id, state in self._update_states.items()},
+            'entities': list(self._rows.values()),
+            'files': [(md5, size, kind.value, file_id, file_hash)
+                      for (md5, size, kind), (file_id, file_hash) in self._files.items()],
+        }
+        self.stats['collect_ms'] = (time.perf_counter() - started) * 1000
+        return data
+
+    def _write(self, data, changes):
+        started = time.perf_counter()
+        try:
+            blob = encode_state_file(data, time.time(), MAGIC, FORMAT_VERSION)
+            with self._lock:
+                if changes <= self._written:
+                    return True  # A newer copy was written meanwhile
+                write_file_atomic(self.path, blob)
+                self._written = changes
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.error(f"Failed to write session {self.path}: {e}")
+            return False
+        self.stats['flushes'] += 1
+        self.stats['bytes'] = len(blob)
+        self.stats['write_ms'] = (time.perf_counter() - started) * 1000
+        return True
+
+    def flush(self):
+        """Write the session now, blocking."""
+        return self._write(self._collect(), self._changes)
+
+    async def flush_async(self):
+        """Copy the session in the loop and write it from a worker thread."""
+        # Changes made while writing stay pending for the next flush
+        return await asyncio.to_thread(self._write, self._collect(), self._changes)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._changes > self._written:
+                await self.flush_async()
+
+    def start(self):
+        """Start the background flusher (call from the running event loop)."""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    def load(self):
+        """
+        Load the session file, or import the SQLite session of the same name.
+
+        Returns:
+            bool: True if a session was loaded or imported
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return self._import_sqlite()
+
+        try:
+            _, data = decode_state_file(blob, MAGIC, FORMAT_VERSION)
+            self._apply(data)
+        except (ValueError, KeyError, TypeError) as e:
+            # Fall back to the SQLite session if there is one; otherwise the bot logs in again
+            logger.error(f"Ignoring unreadable session {self.path}: {e}")
+            return self._import_sqlite()
+        return True
+
+    def _apply(self, data):
+        super().set_dc(*data['dc'])
+        self._auth_key = AuthKey(data['auth_key']) if data['auth_key'] else None
+        self._takeout_id = data['takeout_id']
+        self._update_states = {
+            entity_id: State(pts, qts, datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc), seq,
+                             unread_count=0)
+            for entity_id, (pts, qts, date, seq) in data['states'].items()
+        }
+        for row in data['entities']:
+            row = tuple(row)
+            self._rows[row[0]] = row
+            if row[2]:
+                self._usernames[row[2]] = row[0]
+            if row[3]:
+                self._phones[row[3]] = row[0]
+        self._files = {(md5, size, _SentFileType(kind)): (file_id, file_hash)
+                       for md5, size, kind, file_id, file_hash in data['files']}
+
+    def _import_sqlite(self):
+        """Take over an existing SQLite session, so switching modes keeps the login."""
+        sqlite_path = self.path[:-len(EXTENSION)] + '.session'
+        if not self.path.endswith(EXTENSION) or not os.path.exists(sqlite_path):
+            return False
+        try:
+            old = SQLiteSession(sqlite_path)
+            try:
+                dc = (old.dc_id, old.server_address, old.port)
+                auth_key, takeout_id = old.auth_key, old.takeout_id
+                states = dict(old.get_update_states())
+                cursor = old._cursor()
+                try:
+                    entities = cursor.execute('select id, hash, username, phone, name from entities').fetchall()
+                    files = cursor.execute('select md5_digest, file_size, type, id, hash from sent_files').fetchall()
+                finally:
+                    cursor.close()
+            finally:
+                old.close()
+        except Exception as e:
+            logger.error(f"Failed to import SQLite session {sqlite_path}: {e}")
+            return False
+        self._apply({'dc': dc, 'auth_key': auth_key.key if auth_key else None, 'takeout_id': takeout_id,
+                     'states': {}, 'entities': entities, 'files': files})
+        self._update_states = states
+        self._changes = 1  # Write our own file on the first flush
+        logger.info(f"Imported SQLite session {sqlite_path} ({len(entities)} entities)")
+        return True
+
+    def get_stats(self):
+        """
+        Get flush counters.
+
+        Returns:
+            dict: flushes written and failed, size of the last file, time the
+            last copy took in the loop and the last write in its thread (ms),
+            entities held and changes not yet written
+        """
+        return {**self.stats, 'entities': len(self._rows), 'pending': self._changes - self._written}
+
+
+def open_session(name, mode=SESSION_MODE):
+    """
+    Session to create the client with.
+
+    Args:
+        name (str): Session name (SESSION_NAME)
+        mode (str): sqlite (Telethon's default) or memory (BufferedSession)
+
+    Returns:
+        The session name for Telethon's SQLite session, or a BufferedSession
+    """
+    if mode == 'sqlite':
+        return name
+    if mode == 'memory':
+        return BufferedSession(name + EXTENSION, SESSION_FLUSH_INTERVAL)
+    raise ValueError(f"Unknown session mode: {mode}")
@@ -0,0 +1,319 @@
+"""
+Warm Restart Module for Telegram Moderation Bot
+
+This module carries the bot's in-memory state over a restart:
+- Rate limit windows and join/leave dedupe keys (memory state backend),
+  anti-flood counters and cooldowns, duplicate-spam cooldowns, cached "not
+  a participant" answers, admin rosters, the bot's own user, cached users
+  and welcome pacing are saved to SNAPSHOT_FILE every SNAPSHOT_INTERVAL
+  seconds and on shutdown
+- At startup the snapshot is loaded before any update is handled; every
+  lifetime and window is shifted by the time the bot was down, so entries
+  that expired meanwhile are dropped and none outlives its TTL
+- On SIGTERM (or Ctrl+C) the bot drains before it disconnects: running
+  handlers finish, batched welcomes and queued sends go out and pending
+  analysis verdicts are applied, for up to SHUTDOWN_DRAIN_TIMEOUT seconds
+
+The file is a fixed header (magic, format version, save time, CRC32) and
+zlib-compressed marshal data (utils.encode_state_file). Sections hold
+plain values only (Telegram objects as their serialized bytes), so
+loading a snapshot cannot run code; a file that fails any check is
+ignored and the bot starts cold. Writes go to a temporary file that then
+replaces the snapshot, so a crash mid-write leaves the previous one intact.
+
+The duplicate-spam sketch is not saved: its fingerprints are built from
+string hashes, which are salted per process.
+
+Author: Divyansh Shakya
+"""
+
+import time
+import signal
+import asyncio
+from utils import logger, encode_state_file, decode_state_file, write_file_atomic
+from state import get_state, MemoryBackend
+from antiflood import user_message_rates, chat_message_rates, recent_flood_actions
+from duplicates import recent_duplicate_actions
+from coalesce import not_participants
+from security import dump_admin_cache, load_admin_cache
+from usercache import user_cache
+from welcome import send_pending_welcomes, dump_welcome_pacing, load_welcome_pacing
+from outbox import outbox
+from pipeline import analysis_pipeline
+from config import SNAPSHOT_FILE, SNAPSHOT_INTERVAL, SHUTDOWN_DRAIN_TIMEOUT
+
+MAGIC = b'TGBS'
+FORMAT_VERSION = 1
+
+
+def _dump_state():
+    backend = get_state()
+    # Shared backends keep their own data across restarts
+    return backend.dump() if isinstance(backend, MemoryBackend) else None
+
+
+def _load_state(entries, elapsed):
+    backend = get_state()
+    if entries is not None and isinstance(backend, MemoryBackend):
+        backend.load(entries, elapsed)
+
+
+# Section name -> (dump(), load(data, elapsed)); unknown sections in a file are skipped
+SECTIONS = {
+    'state': (_dump_state, _load_state),
+    'flood_users': (user_message_rates.dump, user_message_rates.load),
+    'flood_chats': (chat_message_rates.dump, chat_message_rates.load),
+    'flood_actions': (recent_flood_actions.dump, recent_flood_actions.load),
+    'duplicate_actions': (recent_duplicate_actions.dump, recent_duplicate_actions.load),
+    'not_participants': (not_participants.dump, not_participants.load),
+    'admins': (dump_admin_cache, load_admin_cache),
+    'users': (user_cache.dump, user_cache.load),
+    'welcome_pacing': (dump_welcome_pacing, load_welcome_pacing),
+}
+
+
+def encode_snapshot(sections, saved_at):
+    """
+    Serialize snapshot sections.
+
+    Args:
+        sections (dict): Section name -> plain data (marshal-compatible)
+        saved_at (float): Wall-clock time the data was taken
+
+    Returns:
+        bytes: Header and compressed body
+    """
+    return encode_state_file(sections, saved_at, MAGIC, FORMAT_VERSION)
+
+
+def decode_snapshot(data):
+    """
+    Parse and check a snapshot written by encode_snapshot().
+
+    Args:
+        data (bytes): File contents
+
+    Returns:
+        tuple: (saved_at, sections)
+
+    Raises:
+        ValueError: If the file is not a snapshot of this format version or is damaged
+    """
+    saved_at, sections = decode_state_file(data, MAGIC, FORMAT_VERSION)
+    if not isinstance(sections, dict):
+        raise ValueError("unexpected body")
+    return saved_at, sections
+
+
+class StateSnapshotter:
+    """
+    Periodic and on-shutdown snapshots of in-memory state, restored at startup.
+
+    Sections are taken in the event loop (a consistent view, no locking);
+    encoding and the write run in a worker thread.
+
+    Args:
+        path (str): Snapshot file
+        interval (float): Seconds between periodic snapshots (0 = only on shutdown)
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._saver = None
+        self._started = False
+        self.stats = {'saves': 0, 'failures': 0, 'bytes': 0, 'collect_ms': 0.0, 'restore_ms': 0.0}
+
+    def collect(self):
+        """Dump every section; a failing section is left out of the snapshot."""
+        started = time.perf_counter()
+        sections = {}
+        for name, (dump, _) in SECTIONS.items():
+            try:
+                sections[name] = dump()
+            except Exception as e:
+                logger.error(f"Snapshot of {name} failed: {e}")
+        self.stats['collect_ms'] = (time.perf_counter() - started) * 1000
+        return sections
+
+    def _write(self, sections, saved_at):
+        try:
+            data = encode_snapshot(sections, saved_at)
+            write_file_atomic(self.path, data)
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.error(f"Failed to write state snapshot: {e}")
+            return False
+        self.stats['saves'] += 1
+        self.stats['bytes'] = len(data)
+        return True
+
+    def save(self):
+        """Write a snapshot now, blocking (used on shutdown)."""
+        return self._write(self.collect(), time.time())
+
+    async def save_async(self):
+        """Take a snapshot in the loop and write it from a worker thread."""
+        sections = self.collect()
+        return await asyncio.to_thread(self._write, sections, time.time())
+
+    def restore(self):
+        """
+        Load the snapshot, if there is a usable one.
+
+        Call once at startup, before updates are handled.
+
+        Returns:
+            bool: True if a snapshot was loaded
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Failed to read state snapshot: {e}")
+            return False
+
+        started = time.perf_counter()
+        try:
+            saved_at, sections = decode_snapshot(data)
+        except ValueError as e:
+            logger.warning(f"Ignoring state snapshot {self.path}: {e}")
+            return False
+
+        elapsed = max(0.0, time.time() - saved_at)
+        for name, (_, load) in SECTIONS.items():
+            if name not in sections:
+                continue
+            try:
+                load(sections[name], elapsed)
+            except Exception as e:
+                logger.error(f"Restoring {name} from the snapshot failed: {e}")
+        self.stats['restore_ms'] = (time.perf_counter() - started) * 1000
+        logger.info(f"Restored state snapshot from {elapsed:.0f}s ago "
+                    f"({len(data)} bytes) in {self.stats['restore_ms']:.1f} ms")
+        return True
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save_async()
+
+    def start(self):
+        """Start periodic snapshots (call from the running event loop, after restore())."""
+        self._started = True
+        if self.interval and self._saver is None:
+            self._saver = asyncio.create_task(self._save_periodically())
+
+    def close(self):
+        """Stop periodic snapshots and write a final one."""
+        if self._saver is not None:
+            self._saver.cancel()
+            self._saver = None
+        # A bot that never got running must not overwrite a good snapshot with empty state
+        if self._started:
+            self._started = False
+            self.save()
+
+    def get_stats(self):
+        """
+        Get snapshot counters.
+
+        Returns:
+            dict: snapshots written and failed, size of the last one, time
+            spent taking the last one and restoring at startup (ms)
+        """
+        return dict(self.stats)
+
+
+# Shared snapshotter
+state_snapshot = StateSnapshotter(SNAPSHOT_FILE, SNAPSHOT_INTERVAL)
+
+# Set once a shutdown signal has been received
+_shutdown_task = None
+
+
+async def _wait_until(predicate, deadline):
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def drain(client, timeout=SHUTDOWN_DRAIN_TIMEOUT):
+    """
+    Let in-flight work finish before disconnecting.
+
+    Waits for running event handlers, sends batched welcomes right away,
+    then waits until queued sends are out and analysis verdicts applied.
+    Updates that arrive meanwhile are still handled.
+
+    Args:
+        client: Telethon client instance
+        timeout (float): Seconds to wait at most
+
+    Returns:
+        bool: True if everything finished in time
+    """
+    deadline = time.monotonic() + timeout
+    # Telethon tracks the tasks running event handlers, and cancels them on disconnect
+    handlers = getattr(client, '_event_handler_tasks', set())
+    current = asyncio.current_task()
+
+    def handlers_done():
+        return not any(task is not current and not task.done() for task in handlers)
+
+    def all_done():
+        return handlers_done() and outbox.is_idle() and not analysis_pipeline.pending
+
+    await _wait_until(handlers_done, deadline)
+    try:
+        await asyncio.wait_for(send_pending_welcomes(client), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        pass
+    if await _wait_until(all_done, deadline):
+        return True
+    logger.warning(
+        f"Shutdown drain timed out after {timeout}s: "
+        f"{sum(1 for task in handlers if not task.done())} handler(s), "
+        f"{outbox.get_stats()['queued']} queued send(s), "
+        f"{analysis_pipeline.pending} analysis job(s) left"
+    )
+    return False
+
+
+async def shutdown(client):
+    """Drain in-flight work, then disconnect (run_until_disconnected returns)."""
+    logger.info("Shutting down: draining in-flight work")
+    started = time.monotonic()
+    await drain(client)
+    logger.info(f"Drained in {time.monotonic() - started:.1f}s, disconnecting")
+    await client.disconnect()
+
+
+def install_shutdown_handler(client):
+    """
+    Shut down gracefully on SIGTERM/SIGINT; a second signal disconnects at once.
+
+    Args:
+        client: Telethon client instance
+    """
+    loop = asyncio.get_running_loop()
+
+    def on_signal(signum):
+        global _shutdown_task
+        if _shutdown_task is None:
+            logger.info(f"Received {signal.Signals(signum).name}")
+            _shutdown_task = asyncio.ensure_future(shutdown(client))
+        else:
+            logger.warning("Second shutdown signal, disconnecting without draining")
+            asyncio.ensure_future(client.disconnect())
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, on_signal, signum)
+        except (NotImplementedError, RuntimeError):
+            # No loop signal handlers on Windows; Ctrl+C still stops the bot, without draining
+            pass
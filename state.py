@@ -0,0 +1,591 @@
+"""
+Shared State Module for Telegram Moderation Bot
+
+This module holds short-lived state that several bot processes (a hot
+standby, or workers splitting the load) must agree on, such as command
+rate limits and join/leave dedupe, behind one small interface:
+- Atomic increment (with a TTL set when the key is created), set-if-absent
+  with a TTL, get, delete and expire
+- Pipelines: many operations sent as one batch (one round trip, or one
+  transaction for SQLite)
+- Backends: 'memory' (one process, no I/O), 'sqlite' (processes on one
+  host sharing a file) and 'redis' (anything speaking the Redis protocol)
+
+Keys are strings, counters are floats, other values are returned as
+strings. TTLs are in seconds.
+
+Author: Divyansh Shakya
+"""
+
+import time
+import heapq
+import itertools
+import sqlite3
+import asyncio
+import threading
+from urllib.parse import urlparse
+from utils import logger
+from config import STATE_BACKEND, STATE_DB, STATE_REDIS_URL, STATE_KEY_PREFIX, STATE_MAX_KEYS
+
+
+class StateError(Exception):
+    """A state backend refused or failed an operation."""
+
+
+class Pipeline:
+    """
+    Operations queued for one batched call to a backend.
+
+    Each method queues an operation and returns the pipeline; execute()
+    runs them in order and returns their results in a list.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._ops = []
+
+    def incr(self, key, amount=1, ttl=None):
+        self._ops.append(('incr', key, amount, ttl))
+        return self
+
+    def set_if_absent(self, key, value, ttl=None):
+        self._ops.append(('set_if_absent', key, value, ttl))
+        return self
+
+    def get(self, key):
+        self._ops.append(('get', key))
+        return self
+
+    def delete(self, key):
+        self._ops.append(('delete', key))
+        return self
+
+    def expire(self, key, ttl):
+        self._ops.append(('expire', key, ttl))
+        return self
+
+    async def execute(self):
+        """
+        Run the queued operations.
+
+        Returns:
+            list: One result per operation, in order
+        """
+        ops, self._ops = self._ops, []
+        return await self._backend.execute(ops) if ops else []
+
+
+class StateBackend:
+    """
+    Interface of a state backend.
+
+    Subclasses implement execute(); the single-operation methods are
+    one-operation pipelines.
+
+    Args:
+        prefix (str): Prepended to every key, so several bots can share a store
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+
+    def pipeline(self):
+        """Start a batch of operations."""
+        return Pipeline(self)
+
+    async def incr(self, key, amount=1, ttl=None):
+        """
+        Atomically add to a counter, creating it (at 0) if needed.
+
+        Args:
+            key (str): Counter key
+            amount (float): Value to add (may be negative)
+            ttl (float): Expiry set when the key is created (None = never)
+
+        Returns:
+            float: The new value
+        """
+        return (await self.execute([('incr', key, amount, ttl)]))[0]
+
+    async def set_if_absent(self, key, value, ttl=None):
+        """
+        Atomically set a key unless it exists.
+
+        Returns:
+            bool: True if the key was set, False if it already existed
+        """
+        return (await self.execute([('set_if_absent', key, value, ttl)]))[0]
+
+    async def get(self, key):
+        """Value of a key as a string, or None."""
+        return (await self.execute([('get', key)]))[0]
+
+    async def delete(self, key):
+        """Delete a key; True if it existed."""
+        return (await self.execute([('delete', key)]))[0]
+
+    async def expire(self, key, ttl):
+        """Set a key's TTL; True if the key exists."""
+        return (await self.execute([('expire', key, ttl)]))[0]
+
+    async def execute(self, ops):
+        """Run a list of operation tuples and return their results."""
+        raise NotImplementedError
+
+    async def close(self):
+        """Release connections or files."""
+
+
+def _format(value):
+    """String form of a stored value (counters as Redis prints them)."""
+    if isinstance(value, float):
+        return repr(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+class MemoryBackend(StateBackend):
+    """
+    State kept in this process only: no I/O, nothing shared.
+
+    Expired keys are swept through a heap of expiry times on each call.
+    The cap applies per namespace (the key up to its first ':', e.g. 'rl'
+    for rate limits, 'chat_action' for join/leave dedupe): past max_keys
+    a namespace loses its longest-held keys, so a flood of one kind of key
+    never evicts another kind.
+
+    Args:
+        max_keys (int): Hard cap on stored keys per namespace
+        prefix (str): Key prefix
+    """
+
+    def __init__(self, max_keys, prefix=''):
+        super().__init__(prefix)
+        self.max_keys = max_keys
+        self._data = {}  # key -> [value, expires_at or None]
+        self._spaces = {}  # namespace -> {key: None} in insertion order
+        self._expiries = []  # heap of (expires_at, key), possibly stale
+
+    async def execute(self, ops):
+        return self.run(ops)
+
+    def run(self, ops):
+        """Run operations synchronously (the memory backend never waits)."""
+        now = time.monotonic()
+        self._sweep(now)
+        results = [getattr(self, '_' + op[0])(self.prefix + op[1], *op[2:], now=now) for op in ops]
+        self._evict()
+        return results
+
+    def _namespace(self, key):
+        return key[len(self.prefix):].partition(':')[0]
+
+    def _insert(self, key, value):
+        entry = self._data[key] = [value, None]
+        self._spaces.setdefault(self._namespace(key), {})[key] = None
+        return entry
+
+    def _remove(self, key):
+        if self._data.pop(key, None) is None:
+            return False
+        namespace = self._namespace(key)
+        space = self._spaces[namespace]
+        del space[key]
+        if not space:
+            del self._spaces[namespace]
+        return True
+
+    def _evict(self):
+        for namespace, space in list(self._spaces.items()):
+            excess = len(space) - self.max_keys
+            if excess > 0:
+                for key in list(itertools.islice(space, excess)):
+                    self._remove(key)
+
+    def _sweep(self, now):
+        expiries, data = self._expiries, self._data
+        while expiries and expiries[0][0] <= now:
+            expires_at, key = heapq.heappop(expiries)
+            entry = data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            self._remove(key)
+            return None
+        return entry
+
+    def _set_expiry(self, key, entry, ttl, now):
+        entry[1] = now + ttl
+        heapq.heappush(self._expiries, (entry[1], key))
+
+    def _incr(self, key, amount, ttl, now):
+        entry = self._live(key, now)
+        if entry is None:
+            entry = self._insert(key, 0.0)
+            if ttl is not None:
+                self._set_expiry(key, entry, ttl, now)
+        try:
+            entry[0] = float(entry[0]) + amount
+        except ValueError:
+            raise StateError(f"{key} is not a number")
+        return entry[0]
+
+    def _set_if_absent(self, key, value, ttl, now):
+        if self._live(key, now) is not None:
+            return False
+        entry = self._insert(key, value)
+        if ttl is not None:
+            self._set_expiry(key, entry, ttl, now)
+        return True
+
+    def _get(self, key, now):
+        entry = self._live(key, now)
+        return _format(entry[0]) if entry is not None else None
+
+    def _delete(self, key, now):
+        return self._remove(key)
+
+    def _expire(self, key, ttl, now):
+        entry = self._live(key, now)
+        if entry is None:
+            return False
+        self._set_expiry(key, entry, ttl, now)
+        return True
+
+    def dump(self):
+        """
+        Live keys for a snapshot.
+
+        Returns:
+            list: (key, value, seconds left or None), prefix included
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        return [(key, value, expires_at - now if expires_at is not None else None)
+                for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now]
+
+    def load(self, entries, elapsed=0.0):
+        """
+        Restore keys saved by dump(), minus the time passed since the snapshot.
+
+        Args:
+            entries (list): Output of dump()
+            elapsed (float): Seconds since the snapshot was taken
+        """
+        now = time.monotonic()
+        for key, value, remaining in entries:
+            if remaining is None:
+                self._remove(key)
+                self._insert(key, value)
+            elif remaining > elapsed:
+                self._remove(key)
+                entry = self._insert(key, value)
+                self._set_expiry(key, entry, remaining - elapsed, now)
+        self._evict()
+
+    def __len__(self):
+        return len(self._data)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL,
+    expires REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_state_expires ON state (expires);
+"""
+
+
+class SQLiteBackend(StateBackend):
+    """
+    State in an SQLite file that processes on one host can share.
+
+    Each pipeline is one write transaction (BEGIN IMMEDIATE), so its
+    operations are atomic with respect to other processes. Expiry uses
+    wall-clock time, as the processes do not share a monotonic clock.
+
+    Args:
+        path (str): Database file
+        prefix (str): Key prefix
+    """
+
+    PURGE_EVERY = 1000  # Pipelines between purges of expired rows
+
+    def __init__(self, path, prefix=''):
+        super().__init__(prefix)
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._runs = 0
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SQLITE_SCHEMA)
+        return self._conn
+
+    async def execute(self, ops):
+        return await asyncio.to_thread(self._run, ops)
+
+    def _run(self, ops):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                results = [getattr(self, '_' + op[0])(conn, self.prefix + op[1], *op[2:], now=now) for op in ops]
+                self._runs += 1
+                if self._runs % self.PURGE_EVERY == 0:
+                    conn.execute("DELETE FROM state WHERE expires <= ?", (now,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return results
+
+    def _live(self, conn, key, now):
+        row = conn.execute("SELECT value, expires FROM state WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[1] is not None and row[1] <= now:
+            return None
+        return row
+
+    def _incr(self, conn, key, amount, ttl, now):
+        row = self._live(conn, key, now)
+        if row is None:
+            value, expires = float(amount), (now + ttl if ttl is not None else None)
+        else:
+            try:
+                value, expires = float(row[0]) + amount, row[1]
+            except ValueError:
+                raise StateError(f"{key} is not a number")
+        conn.execute("INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                     (key, _format(value), expires))
+        return value
+
+    def _set_if_absent(self, conn, key, value, ttl, now):
+        if self._live(conn, key, now) is not None:
+            return False
+        conn.execute("INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                     (key, _format(value), now + ttl if ttl is not None else None))
+        return True
+
+    def _get(self, conn, key, now):
+        row = self._live(conn, key, now)
+        return row[0] if row is not None else None
+
+    def _delete(self, conn, key, now):
+        return conn.execute("DELETE FROM state WHERE key = ?", (key,)).rowcount > 0
+
+    def _expire(self, conn, key, ttl, now):
+        if self._live(conn, key, now) is None:
+            return False
+        conn.execute("UPDATE state SET expires = ? WHERE key = ?", (now + ttl, key))
+        return True
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def encode_command(*args):
+    """Encode one command in the Redis protocol (RESP)."""
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+async def read_reply(reader):
+    """Read one RESP reply; error replies are returned as StateError instances."""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("State server closed the connection")
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body.decode()
+    if kind == b'-':
+        return StateError(body.decode())
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        size = int(body)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2].decode()
+    if kind == b'*':
+        size = int(body)
+        return None if size < 0 else [await read_reply(reader) for _ in range(size)]
+    raise StateError(f"Unexpected reply from state server: {line!r}")
+
+
+def _ms(ttl):
+    return max(1, int(ttl * 1000))
+
+
+class RedisBackend(StateBackend):
+    """
+    State on a Redis-protocol server, shared by every process that uses it.
+
+    One connection, opened on first use; a pipeline is written in one go
+    and its replies read back in order. incr with a TTL is a MULTI/EXEC
+    block, so the key cannot lose its expiry between creation and increment.
+    A caller cancelled between writing and reading its replies leaves them
+    unread, so the connection is dropped then rather than handing those
+    replies to the next caller.
+
+    Args:
+        url (str): redis://host:port/db
+        prefix (str): Key prefix
+    """
+
+    def __init__(self, url, prefix=''):
+        super().__init__(prefix)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self._reader = self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        for reply in await self._send(setup):
+            if isinstance(reply, StateError):
+                raise reply
+
+    async def _send(self, commands):
+        self._writer.write(b''.join(encode_command(*command) for command in commands))
+        await self._writer.drain()
+        return [await read_reply(self._reader) for _ in commands]
+
+    def _commands(self, op):
+        """Protocol commands for one operation, and how many replies belong to it."""
+        name, key = op[0], self.prefix + op[1]
+        if name == 'incr':
+            amount, ttl = op[2], op[3]
+            if ttl is None:
+                return [('INCRBYFLOAT', key, amount)]
+            return [('MULTI',), ('SET', key, 0, 'PX', _ms(ttl), 'NX'), ('INCRBYFLOAT', key, amount), ('EXEC',)]
+        if name == 'set_if_absent':
+            value, ttl = op[2], op[3]
+            if ttl is None:
+                return [('SET', key, _format(value), 'NX')]
+            return [('SET', key, _format(value), 'PX', _ms(ttl), 'NX')]
+        if name == 'get':
+            return [('GET', key)]
+        if name == 'delete':
+            return [('DEL', key)]
+        if name == 'expire':
+            return [('PEXPIRE', key, _ms(op[2]))]
+        raise StateError(f"Unknown state operation {name}")
+
+    @staticmethod
+    def _result(name, replies):
+        reply = replies[-1]
+        for item in replies:
+            if isinstance(item, StateError):
+                return item
+        if name == 'incr':
+            if isinstance(reply, list):
+                reply = reply[-1]
+                if isinstance(reply, StateError):
+                    return reply
+            return float(reply)
+        if name == 'set_if_absent':
+            return reply == 'OK'
+        if name in ('delete', 'expire'):
+            return reply > 0
+        return reply
+
+    async def execute(self, ops):
+        groups = [self._commands(op) for op in ops]
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._open()
+                replies = await self._send([command for group in groups for command in group])
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                # Reconnect on the next call
+                await self._disconnect()
+                raise StateError(f"State server unavailable: {e}")
+            except asyncio.CancelledError:
+                # Replies may still be in flight: the connection is out of step, reconnect next time
+                self._abort()
+                raise
+        results, position = [], 0
+        for op, group in zip(ops, groups):
+            results.append(self._result(op[0], replies[position:position + len(group)]))
+            position += len(group)
+        errors = [result for result in results if isinstance(result, StateError)]
+        if errors:
+            raise errors[0]
+        return results
+
+    def _abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+
+
+def create_backend(kind=STATE_BACKEND):
+    """
+    Build the configured state backend.
+
+    Args:
+        kind (str): 'memory', 'sqlite' or 'redis'
+
+    Returns:
+        StateBackend: The backend
+    """
+    if kind == 'memory':
+        return MemoryBackend(STATE_MAX_KEYS, STATE_KEY_PREFIX)
+    if kind == 'sqlite':
+        return SQLiteBackend(STATE_DB, STATE_KEY_PREFIX)
+    if kind == 'redis':
+        return RedisBackend(STATE_REDIS_URL, STATE_KEY_PREFIX)
+    raise ValueError(f"Unknown STATE_BACKEND {kind!r} (use memory, sqlite or redis)")
+
+
+# Shared state backend
+state = create_backend()
+
+
+def use_backend(backend):
+    """Replace the shared backend (e.g. for a standby process or a benchmark)."""
+    global state
+    state = backend
+    logger.info(f"Using {type(backend).__name__} for shared state")
+
+
+def get_state():
+    """The shared backend; call at use time, as use_backend() may replace it."""
+    return state
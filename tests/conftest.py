@@ -0,0 +1,14 @@
+"""
+Shared test setup: the bot's modules read credentials from the environment
+at import time and are imported from the repository root.
+
+Author: Divyansh Shakya
+"""
+
+import os
+import sys
+
+os.environ.setdefault('API_ID', '0')
+os.environ.setdefault('API_HASH', 'test')
+os.environ.setdefault('BOT_TOKEN', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
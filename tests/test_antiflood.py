@@ -0,0 +1,49 @@
+"""
+Tests for the anti-flood sliding-window counter.
+
+Author: Divyansh Shakya
+"""
+
+import time
+
+import pytest
+
+from antiflood import SlidingWindowCounter
+
+
+def test_counts_within_one_window():
+    counter = SlidingWindowCounter(window=10, max_keys=100)
+    assert [counter.hit('a', 100 + i) for i in range(3)] == [1, 2, 3]
+    assert counter.hit('b', 103) == 1
+
+
+def test_previous_window_is_weighted_by_overlap():
+    counter = SlidingWindowCounter(window=10, max_keys=100)
+    for _ in range(4):
+        counter.hit('a', 105)
+    # 2.5 s into the next window, three quarters of the previous one still overlap
+    assert counter.hit('a', 112.5) == pytest.approx(4 * 0.75 + 1)
+    # Two windows later nothing of the old counts is left
+    assert counter.hit('a', 131) == 1
+
+
+def test_idle_and_excess_keys_are_evicted():
+    counter = SlidingWindowCounter(window=10, max_keys=3)
+    counter.hit('idle', 100)
+    counter.hit('a', 125)
+    assert len(counter) == 1
+    for key in 'bcd':
+        counter.hit(key, 126)
+    assert len(counter) == 3
+    # The least recently used key went first
+    assert counter.hit('a', 127) == 1
+
+
+def test_dump_and_load_keep_counts():
+    counter = SlidingWindowCounter(window=1000, max_keys=100)
+    now = time.monotonic()
+    for _ in range(3):
+        counter.hit('a', now)
+    restored = SlidingWindowCounter(window=1000, max_keys=100)
+    restored.load(counter.dump())
+    assert restored.hit('a', now) >= 4
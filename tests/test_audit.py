@@ -0,0 +1,50 @@
+"""
+Tests for the moderation audit store's paginated queries.
+
+Author: Divyansh Shakya
+"""
+
+import asyncio
+
+from audit import ModerationAuditStore
+
+
+def make_entry(number, chat_id=-100, admin_id=1, action='banned'):
+    return {'timestamp': 1000.0 + number, 'chat_id': chat_id, 'admin_id': admin_id, 'admin_name': 'admin',
+            'action': action, 'target_id': number, 'target_name': f'user{number}', 'success': True}
+
+
+def test_pages_are_newest_first_and_contiguous(tmp_path):
+    async def run():
+        store = ModerationAuditStore(str(tmp_path / 'audit.db'), batch_size=100, tail_size=3)
+        for number in range(10):
+            store.append(make_entry(number))
+            store.append(make_entry(number, chat_id=-200))
+        # The first page comes from the in-memory tail, later ones from the database
+        pages = [await store.query(chat_id=-100, limit=3, offset=offset) for offset in range(0, 12, 3)]
+        assert [[entry['target_id'] for entry in page] for page in pages] == [[9, 8, 7], [6, 5, 4], [3, 2, 1], [0]]
+        assert all(entry['chat_id'] == -100 for page in pages for entry in page)
+        assert await store.query(chat_id=-100, limit=5, offset=10) == []
+        store.close()
+
+    asyncio.run(run())
+
+
+def test_filters_combine_and_pending_entries_are_included(tmp_path):
+    async def run():
+        store = ModerationAuditStore(str(tmp_path / 'audit.db'), batch_size=100, tail_size=3)
+        for number in range(6):
+            store.append(make_entry(number, admin_id=number % 2))
+        entries = await store.query(chat_id=-100, admin_id=1, limit=10)
+        assert [entry['target_id'] for entry in entries] == [5, 3, 1]
+        entries = await store.query(since=1004.0, limit=10)
+        assert [entry['target_id'] for entry in entries] == [5, 4]
+        assert entries[0]['success'] is True
+        store.close()
+
+        # Everything was written: a fresh store on the same file sees it
+        reopened = ModerationAuditStore(str(tmp_path / 'audit.db'), batch_size=100, tail_size=3)
+        assert len(await reopened.query(limit=100)) == 6
+        reopened.close()
+
+    asyncio.run(run())
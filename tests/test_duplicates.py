@@ -0,0 +1,50 @@
+"""
+Tests for near-duplicate fingerprints and the cross-chat duplicate sketch.
+
+Author: Divyansh Shakya
+"""
+
+from duplicates import DuplicateSketch, text_fingerprint
+
+SPAM = "Earn money fast with our crypto signals group, join today and get rich"
+
+
+def test_fingerprint_ignores_digits_punctuation_and_case():
+    assert text_fingerprint(SPAM) == text_fingerprint("EARN money fast!!! with our crypto signals group 24/7, "
+                                                      "join today and get rich 💰")
+    assert text_fingerprint(SPAM) != text_fingerprint("A completely different message about the weekly meeting notes")
+    assert text_fingerprint("hi there") is None
+
+
+def test_distinct_chats_and_senders_in_one_window():
+    sketch = DuplicateSketch(slots=64, window=10)
+    assert sketch.hit(1234, chat_id=1, user_id=100, now=101) == (1, 1)
+    assert sketch.hit(1234, chat_id=1, user_id=100, now=102) == (1, 1)
+    assert sketch.hit(1234, chat_id=2, user_id=101, now=103) == (2, 2)
+    assert sketch.hit(5678, chat_id=3, user_id=100, now=104) == (1, 1)
+
+
+def test_window_rollover():
+    sketch = DuplicateSketch(slots=64, window=10)
+    sketch.hit(1234, chat_id=1, user_id=100, now=105)
+    sketch.hit(1234, chat_id=2, user_id=100, now=106)
+    # Next window: the previous window's chats still count
+    assert sketch.hit(1234, chat_id=3, user_id=101, now=115) == (3, 2)
+    # One more: only the window just before is kept
+    assert sketch.hit(1234, chat_id=4, user_id=102, now=125) == (2, 2)
+    # After two idle windows everything is forgotten
+    assert sketch.hit(1234, chat_id=5, user_id=103, now=150) == (1, 1)
+
+
+def test_new_fingerprint_takes_the_older_of_two_slots():
+    sketch = DuplicateSketch(slots=4, window=10)
+    # 1, 5 and 9 share their first slot and their second
+    sketch.hit(1, chat_id=1, user_id=1, now=5)
+    sketch.hit(5, chat_id=1, user_id=1, now=15)
+    sketch.hit(5, chat_id=2, user_id=1, now=15)
+    assert len(sketch) == 2
+    sketch.hit(9, chat_id=1, user_id=1, now=16)
+    assert len(sketch) == 2
+    # 1 was evicted, 5 was kept
+    assert sketch.hit(5, chat_id=3, user_id=1, now=17) == (3, 1)
+    assert sketch.hit(1, chat_id=2, user_id=1, now=17) == (1, 1)
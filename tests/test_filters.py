@@ -0,0 +1,67 @@
+"""
+Tests for compiled content filters: matching, and additions and removals
+on top of a compiled blocklist.
+
+Author: Divyansh Shakya
+"""
+
+from filters import ChatFilter, compile_matcher, normalize_pattern
+
+
+def test_normalize_pattern():
+    assert normalize_pattern('word', '  Free   MONEY ') == 'free money'
+    assert normalize_pattern('domain', 'https://www.Spam.example/path') == 'spam.example'
+    assert normalize_pattern('domain', 'not a domain') is None
+    assert normalize_pattern('invite', 'https://t.me/+AbC-123') == 'AbC-123'
+    assert normalize_pattern('invite', 'all') == '*'
+
+
+def test_words_match_whole_words_and_domains_match_subdomains():
+    matcher = compile_matcher({'spam', 'spammer', 'scam'}, {'bad.example'})
+    found = [(match.lastgroup, match.group(match.lastgroup))
+             for match in matcher.finditer('spammers scam x.bad.example bad.example.org nobad.example')]
+    assert found == [('word', 'scam'), ('domain', 'bad.example')]
+    assert compile_matcher(set(), set()) is None
+
+
+def test_scan_words_domains_and_invites():
+    chat_filter = ChatFilter([('word', 'free money'), ('domain', 'bad.example'), ('invite', 'AbC')])
+    assert chat_filter.scan("Get FREE money now") == ('word', 'free money')
+    assert chat_filter.scan("see https://cdn.bad.example/x") == ('domain', 'bad.example')
+    assert chat_filter.scan("join t.me/+AbC") == ('invite', 'AbC')
+    assert chat_filter.scan("join t.me/+Other, free moneys") is None
+
+
+def test_delta_additions_and_removals():
+    chat_filter = ChatFilter([('word', 'spam')])
+    chat_filter.add('word', 'eggs')
+    assert chat_filter.scan("green eggs") == ('word', 'eggs')
+    chat_filter.remove('word', 'spam')
+    assert chat_filter.scan("spam") is None
+    chat_filter.add('word', 'spam')
+    assert chat_filter.scan("spam") == ('word', 'spam')
+    chat_filter.remove('word', 'eggs')
+    assert chat_filter.scan("green eggs") is None
+    assert sorted(chat_filter.patterns()) == [('word', 'spam')]
+    assert len(chat_filter) == 1
+
+
+def test_removed_pattern_does_not_hide_blocked_ones():
+    chat_filter = ChatFilter([('word', 'spam'), ('word', 'spam eggs'), ('word', 'eggs'),
+                              ('word', 'eggs benedict')])
+    chat_filter.remove('word', 'spam eggs')
+    assert chat_filter.scan("spam eggs") == ('word', 'spam')
+    chat_filter.remove('word', 'spam')
+    assert chat_filter.scan("spam eggs") == ('word', 'eggs')
+    chat_filter.remove('word', 'eggs')
+    assert chat_filter.scan("spam eggs benedict") == ('word', 'eggs benedict')
+    # A shorter pattern found with endpos capped must still end on a word boundary
+    assert chat_filter.scan("spam eggsy") is None
+
+
+def test_removed_domain_does_not_hide_word_inside_it():
+    chat_filter = ChatFilter([('domain', 'bad.example'), ('word', 'example')])
+    chat_filter.remove('domain', 'bad.example')
+    assert chat_filter.scan("visit bad.example") == ('word', 'example')
+    chat_filter.remove('word', 'example')
+    assert chat_filter.scan("visit bad.example") is None
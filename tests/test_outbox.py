@@ -0,0 +1,96 @@
+"""
+Tests for the outbound scheduler: FloodWait handling and greeting priority.
+
+Author: Divyansh Shakya
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+os.environ.setdefault('API_ID', '0')
+os.environ.setdefault('API_HASH', 'test')
+os.environ.setdefault('BOT_TOKEN', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.errors.rpcerrorlist import FloodWaitError
+from outbox import OutboundScheduler, MODERATION, REPLY, GREETING
+
+CHAT_A = -1001
+CHAT_B = -1002
+
+
+def test_flood_wait_in_one_chat_does_not_hold_greetings_elsewhere():
+    async def run():
+        scheduler = OutboundScheduler(chat_interval=0, global_rate=1000, max_queue=100, greeting_max_wait=5)
+        attempts = []
+
+        async def flooded_ban():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise FloodWaitError(None, capture=2)
+            return 'banned'
+
+        async def welcome():
+            return 'welcomed'
+
+        ban = asyncio.create_task(scheduler.submit(CHAT_A, MODERATION, flooded_ban))
+        while not attempts:
+            await asyncio.sleep(0)
+        # Chat A is now waiting out its FloodWait with the ban still queued
+        started = time.monotonic()
+        assert await asyncio.wait_for(scheduler.submit(CHAT_B, GREETING, welcome), 1) == 'welcomed'
+        assert time.monotonic() - started < 0.5
+        assert not ban.done()
+        assert await asyncio.wait_for(ban, 5) == 'banned'
+        assert scheduler.is_idle()
+
+    asyncio.run(run())
+
+
+def test_greeting_waits_for_urgent_items_in_other_chats():
+    async def run():
+        scheduler = OutboundScheduler(chat_interval=0, global_rate=1000, max_queue=100, greeting_max_wait=5)
+        order = []
+        release = asyncio.Event()
+
+        async def slow_reply():
+            await release.wait()
+            order.append('reply')
+
+        async def welcome():
+            order.append('welcome')
+
+        reply = asyncio.create_task(scheduler.submit(CHAT_A, REPLY, slow_reply))
+        await asyncio.sleep(0)
+        greeting = asyncio.create_task(scheduler.submit(CHAT_B, GREETING, welcome))
+        await asyncio.sleep(0.05)
+        assert order == []
+        release.set()
+        await asyncio.wait_for(asyncio.gather(reply, greeting), 1)
+        assert order == ['reply', 'welcome']
+
+    asyncio.run(run())
+
+
+def test_greeting_is_sent_after_max_wait():
+    async def run():
+        scheduler = OutboundScheduler(chat_interval=0, global_rate=1000, max_queue=100, greeting_max_wait=0.1)
+        release = asyncio.Event()
+
+        async def stuck_reply():
+            await release.wait()
+
+        async def welcome():
+            return 'welcomed'
+
+        reply = asyncio.create_task(scheduler.submit(CHAT_A, REPLY, stuck_reply))
+        await asyncio.sleep(0)
+        # Chat A keeps an urgent item pending the whole time, yet the greeting goes out
+        assert await asyncio.wait_for(scheduler.submit(CHAT_B, GREETING, welcome), 1) == 'welcomed'
+        assert scheduler.get_stats()['greetings_aged'] == 1
+        release.set()
+        await reply
+
+    asyncio.run(run())
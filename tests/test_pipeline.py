@@ -0,0 +1,123 @@
+"""
+Tests for the analysis pipeline: per-chat ordering of verdicts and the
+fallback to the event loop when the worker pool fails.
+
+Author: Divyansh Shakya
+"""
+
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from pipeline import AnalysisPipeline
+
+CHAT_A = -1001
+CHAT_B = -1002
+
+
+def shout(text):
+    if text == 'bad':
+        raise ValueError("cannot analyse")
+    return text.upper()
+
+
+class ManualPool:
+    """Stands in for the process pool: a batch finishes only when the test says so."""
+
+    def __init__(self):
+        self.batches = []
+        self.shut_down = False
+
+    def submit(self, func, jobs):
+        future = Future()
+        self.batches.append((future, func, jobs))
+        return future
+
+    def finish(self, index):
+        future, func, jobs = self.batches[index]
+        future.set_result(func(jobs))
+
+    def fail(self, index):
+        self.batches[index][0].set_exception(BrokenProcessPool("a worker died"))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def make_pipeline(batch_size, max_pending=100):
+    pipeline = AnalysisPipeline(workers=1, batch_size=batch_size, max_pending=max_pending)
+    pool = pipeline._executor = ManualPool()
+    return pipeline, pool
+
+
+def test_verdicts_apply_in_chat_order():
+    async def run():
+        pipeline, pool = make_pipeline(batch_size=2)
+        applied = []
+        for text in ('a0', 'a1', 'a2'):
+            pipeline.submit(CHAT_A, shout, text, applied.append)
+        pipeline.submit(CHAT_B, shout, 'b0', applied.append)
+        # Nothing to analyse, but it still waits for the chat's earlier messages
+        pipeline.submit(CHAT_A, None, None, lambda _: applied.append('a3'))
+        await settle()
+        assert [jobs for _, _, jobs in pool.batches] == [[(shout, 'a0'), (shout, 'a1')], [(shout, 'a2'), (shout, 'b0')]]
+
+        pool.finish(1)
+        await settle()
+        # Chat B does not wait for chat A's earlier batch
+        assert applied == ['B0']
+        pool.finish(0)
+        await settle()
+        assert applied == ['B0', 'A0', 'A1', 'A2', 'a3']
+        assert pipeline.pending == 0
+        assert pipeline.get_stats()['pool'] == 4
+
+    asyncio.run(run())
+
+
+def test_backpressure_runs_jobs_in_the_loop_in_order():
+    async def run():
+        pipeline, pool = make_pipeline(batch_size=1, max_pending=1)
+        applied = []
+        pipeline.submit(CHAT_A, shout, 'a0', applied.append)
+        pipeline.submit(CHAT_A, shout, 'a1', applied.append)
+        pipeline.submit(CHAT_B, shout, 'b0', applied.append)
+        assert len(pool.batches) == 1
+        assert applied == ['B0']
+        pool.finish(0)
+        await settle()
+        assert applied == ['B0', 'A0', 'A1']
+        assert pipeline.get_stats()['saturated'] == 2
+
+    asyncio.run(run())
+
+
+def test_pool_failure_falls_back_to_the_loop():
+    async def run():
+        pipeline, pool = make_pipeline(batch_size=1)
+        applied = []
+        for text in ('a0', 'bad'):
+            pipeline.submit(CHAT_A, shout, text, applied.append)
+        assert len(pool.batches) == 2
+
+        pool.fail(0)
+        await settle()
+        assert applied == ['A0']
+        assert pool.shut_down
+        # The pool is gone: new jobs run in the loop, behind the chat's job still in flight
+        pipeline.submit(CHAT_A, shout, 'a2', applied.append)
+        assert applied == ['A0']
+
+        pool.fail(1)
+        await settle()
+        # A job that raises is applied as None
+        assert applied == ['A0', None, 'A2']
+        assert pipeline.get_stats()['failed'] == 2
+        assert pipeline.pending == 0
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+"""
+Tests for state snapshot files: encoding, integrity checks and restore.
+
+Author: Divyansh Shakya
+"""
+
+import pytest
+
+import snapshot
+from snapshot import StateSnapshotter, encode_snapshot, decode_snapshot
+from utils import STATE_FILE_HEADER
+
+SECTIONS = {'flood_users': [((-100, 1), 0, 2, 3)], 'state': [('tgbot:rl:user:1', 1.5, 20.0)], 'admins': None}
+
+
+def test_round_trip():
+    saved_at, sections = decode_snapshot(encode_snapshot(SECTIONS, 1700000000.5))
+    assert saved_at == 1700000000.5
+    assert sections == SECTIONS
+
+
+def test_damaged_body_fails_the_checksum():
+    data = bytearray(encode_snapshot(SECTIONS, 1700000000.0))
+    data[STATE_FILE_HEADER.size + 3] ^= 0xFF
+    with pytest.raises(ValueError, match="checksum"):
+        decode_snapshot(bytes(data))
+
+
+@pytest.mark.parametrize('damage, message', [
+    (lambda data: data[:STATE_FILE_HEADER.size - 1], "truncated"),
+    (lambda data: b'XXXX' + data[4:], "kind"),
+    (lambda data: data[:4] + b'\x00\x09' + data[6:], "version"),
+    (lambda data: data[:-5], "checksum"),
+])
+def test_other_files_are_rejected(damage, message):
+    with pytest.raises(ValueError, match=message):
+        decode_snapshot(damage(encode_snapshot(SECTIONS, 1700000000.0)))
+
+
+def test_save_and_restore(tmp_path, monkeypatch):
+    restored = {}
+    monkeypatch.setattr(snapshot, 'SECTIONS', {
+        'counts': (lambda: {'a': 1}, lambda data, elapsed: restored.update(data)),
+        'broken': (lambda: 1 / 0, lambda data, elapsed: restored.update(broken=True)),
+    })
+    snapshotter = StateSnapshotter(str(tmp_path / 'snapshot.bin'), interval=0)
+    assert snapshotter.save()
+    # A failing section is left out; the others are still saved and restored
+    assert snapshotter.restore()
+    assert restored == {'a': 1}
+
+
+def test_damaged_file_is_ignored(tmp_path):
+    path = tmp_path / 'snapshot.bin'
+    data = bytearray(encode_snapshot(SECTIONS, 1700000000.0))
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert not StateSnapshotter(str(path), interval=0).restore()
+    assert not StateSnapshotter(str(tmp_path / 'missing.bin'), interval=0).restore()
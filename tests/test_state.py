@@ -0,0 +1,157 @@
+"""
+Tests for the shared state backends: the same checks run against memory,
+SQLite and Redis (the local stand-in server from benchmarks/fake_redis.py).
+
+Author: Divyansh Shakya
+"""
+
+import asyncio
+import contextlib
+
+import pytest
+
+import state
+import security
+from state import MemoryBackend, SQLiteBackend, RedisBackend, StateError
+from benchmarks import fake_redis
+
+BACKENDS = ('memory', 'sqlite', 'redis')
+
+
+@contextlib.asynccontextmanager
+async def open_backend(kind, tmp_path):
+    server = None
+    if kind == 'memory':
+        backend = MemoryBackend(1000, 'test:')
+    elif kind == 'sqlite':
+        backend = SQLiteBackend(str(tmp_path / 'state.db'), 'test:')
+    else:
+        server, _, port = await fake_redis.serve()
+        backend = RedisBackend(f'redis://127.0.0.1:{port}/0', 'test:')
+    try:
+        yield backend
+    finally:
+        await backend.close()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+
+@pytest.mark.parametrize('kind', BACKENDS)
+def test_set_if_absent(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            assert await backend.set_if_absent('seen', '1', ttl=30)
+            assert not await backend.set_if_absent('seen', '2', ttl=30)
+            assert await backend.get('seen') == '1'
+            assert await backend.delete('seen')
+            assert not await backend.delete('seen')
+            assert await backend.set_if_absent('seen', '3')
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('kind', BACKENDS)
+def test_incr_sets_ttl_only_on_create(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            assert await backend.incr('count', 1.5, ttl=0.2) == 1.5
+            # A later ttl does not extend the window the key was created for
+            assert await backend.incr('count', 1, ttl=30) == 2.5
+            assert await backend.get('count') == '2.5'
+            await asyncio.sleep(0.3)
+            assert await backend.get('count') is None
+            assert await backend.incr('count', 1, ttl=30) == 1
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('kind', BACKENDS)
+def test_expiry(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            await backend.set_if_absent('short', 'x', ttl=0.1)
+            await backend.set_if_absent('kept', 'y')
+            assert await backend.expire('kept', 0.1)
+            assert not await backend.expire('missing', 1)
+            await asyncio.sleep(0.25)
+            assert await backend.get('short') is None
+            assert await backend.get('kept') is None
+            assert await backend.set_if_absent('short', 'z', ttl=30)
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('kind', BACKENDS)
+def test_pipeline_results_in_order(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            results = await (
+                backend.pipeline()
+                .incr('a', 2, ttl=30).get('a').set_if_absent('b', 'x', ttl=30)
+                .set_if_absent('b', 'y').get('b').delete('a').get('a')
+                .execute()
+            )
+            assert results == [2, '2', True, False, 'x', True, None]
+            assert await backend.pipeline().execute() == []
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('kind', BACKENDS)
+def test_concurrent_incr_is_atomic(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            async def spend():
+                return await backend.pipeline().incr('spent', 1, ttl=30).get('spent').execute()
+
+            results = await asyncio.gather(*(spend() for _ in range(50)))
+            # Every increment sees a distinct total: none was lost or applied twice
+            assert sorted(spent for spent, _ in results) == list(range(1, 51))
+            assert await backend.get('spent') == '50'
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('kind', BACKENDS)
+def test_rate_limit_spends_and_refunds(kind, tmp_path, monkeypatch):
+    monkeypatch.setattr(security, 'user_limiter', security.SlidingWindowLimiter('user', 2, 0.01))
+    monkeypatch.setattr(security, 'chat_limiter', security.SlidingWindowLimiter('chat', 100, 1))
+
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            monkeypatch.setattr(state, 'state', backend)
+            allowed = [await security.check_rate_limit(1, -100, 'warn') for _ in range(3)]
+            assert allowed == [True, True, False]
+            # The denied command was refunded from the chat budget too
+            current, previous, _ = security.chat_limiter.keys(-100, security.time.time())
+            spent = await backend.pipeline().get(current).get(previous).execute()
+            assert sum(float(value or 0) for value in spent) == 2
+            assert await security.check_rate_limit(2, -100, 'warn')
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_fails_open(monkeypatch):
+    async def scenario():
+        server, _, port = await fake_redis.serve()
+        server.close()
+        await server.wait_closed()
+        backend = RedisBackend(f'redis://127.0.0.1:{port}/0', 'test:')
+        monkeypatch.setattr(state, 'state', backend)
+        with pytest.raises(StateError):
+            await backend.get('anything')
+        assert await security.check_rate_limit(1, -100, 'ban')
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_cap_is_per_namespace():
+    backend = MemoryBackend(3, 'test:')
+    backend.run([('set_if_absent', 'chat_action:1:2:join', '1', 30)])
+    for i in range(10):
+        backend.run([('incr', f'rl:user:{i}:0', 1, 30)])
+    assert backend.run([('get', 'chat_action:1:2:join')]) == ['1']
+    assert backend.run([('get', 'rl:user:6:0'), ('get', 'rl:user:7:0')]) == [None, '1']
+    assert len(backend) == 4
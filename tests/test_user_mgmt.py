@@ -0,0 +1,29 @@
+"""
+Tests for parsing moderation command arguments.
+
+Author: Divyansh Shakya
+"""
+
+from user_mgmt import split_command_args
+
+
+def test_targets_then_reason():
+    targets, duration, reason = split_command_args("/ban @spammer spamming links")
+    assert targets == ['@spammer']
+    assert duration is None
+    assert reason == "spamming links"
+
+
+def test_several_targets_and_duration():
+    assert split_command_args("/mute @a 123456 2h @b flooding") == (['@a', '123456', '@b'], 7200, "flooding")
+
+
+def test_words_after_the_reason_are_not_targets():
+    targets, duration, reason = split_command_args("/ban @x because of @y 7d")
+    assert targets == ['@x']
+    assert duration is None
+    assert reason == "because of @y 7d"
+
+
+def test_no_arguments():
+    assert split_command_args("/ban") == ([], None, None)
@@ -0,0 +1,64 @@
+"""
+Tests for the shared helpers in utils.
+
+Author: Divyansh Shakya
+"""
+
+import time
+
+import pytest
+
+from utils import ExpiringSet, parse_duration, format_duration
+
+
+def test_expiring_set_rejects_duplicates_until_expiry():
+    seen = ExpiringSet(ttl=0.05, max_size=10)
+    assert seen.add('join:1')
+    assert not seen.add('join:1')
+    assert 'join:1' in seen
+    time.sleep(0.1)
+    assert 'join:1' not in seen
+    assert seen.add('join:1')
+
+
+def test_expiring_set_evicts_oldest_past_max_size():
+    seen = ExpiringSet(ttl=60, max_size=3)
+    for key in range(5):
+        assert seen.add(key)
+    assert len(seen) == 3
+    assert 0 not in seen and 1 not in seen
+    assert 4 in seen
+    seen.discard(4)
+    assert seen.add(4)
+
+
+def test_expiring_set_dump_and_load():
+    seen = ExpiringSet(ttl=60, max_size=10)
+    seen.add('a')
+    seen.add('b')
+    restored = ExpiringSet(ttl=60, max_size=10)
+    # Keys whose lifetime ran out while the bot was down are not restored
+    restored.load([('a', 5.0), ('b', 120.0), ('c', 1.0)], elapsed=2.0)
+    assert 'a' in restored and 'b' in restored and 'c' not in restored
+    assert [key for key, _ in seen.dump()] == ['a', 'b']
+    # Remaining lifetimes are capped at the set's own TTL
+    assert max(left for _, left in restored.dump()) <= 60
+
+
+@pytest.mark.parametrize('text, seconds', [
+    ('90s', 90), ('30m', 1800), ('2H', 7200), ('7d', 604800), ('1w', 604800), ('1d12h', 129600), (' 5m ', 300),
+])
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
+
+
+@pytest.mark.parametrize('text', ['', '10', 'm', '1x', '1h 30m', '-5m', '1.5h', 'spam'])
+def test_parse_duration_rejects_other_text(text):
+    assert parse_duration(text) is None
+
+
+def test_format_duration():
+    assert format_duration(129600) == '1d12h'
+    assert format_duration(9000) == '2h30m'
+    assert format_duration(45) == '45s'
+    assert format_duration(0) == '0s'
@@ -1,27 +1,46 @@
+import re
+import asyncio
 from telethon.tl.functions.channels import GetParticipantRequest
 from telethon.tl.types import User
 from telethon.errors.rpcerrorlist import UsernameInvalidError, PeerIdInvalidError, UserNotParticipantError
-from utils import logger
+from utils import logger, parse_duration
+from outbox import reply
+from usercache import resolve_username
+from config import BULK_RESOLVE_BATCH, BULK_FILE_MAX_BYTES
 
 async def validate_participant(client, chat_id, user_id):
-    """Validate that user is actually in the chat"""
+    """Validate that user is actually in the chat.
+
+    Returns the participant record (truthy) so callers can reuse it for
+    creator/admin decisions instead of fetching it again, or None.
+    """
     try:
-        await client(GetParticipantRequest(
+        result = await client(GetParticipantRequest(
             channel=chat_id,
             participant=user_id
         ))
-        return True
+        return result.participant
     except UserNotParticipantError:
-        return False
+        return None
     except Exception as e:
         logger.error(f"Error validating participant: {e}")
-        return False
+        return None
 
 async def get_user_from_event(client, event):
     """Get user from command arguments or reply with thorough validation"""
+    user, _ = await get_target_from_event(client, event)
+    return user
+
+async def get_target_from_event(client, event):
+    """Resolve the command target and its participant record.
+
+    Returns:
+        tuple: (User, ChannelParticipant) or (None, None) on failure
+    """
     try:
         message_text = event.raw_text.strip()
-        parts = message_text.split()
+        # Durations (/mute @user 2h) are not targets
+        parts = [part for part in message_text.split() if parse_duration(part) is None]
         
         # Method 1: Username in command
         if len(parts) > 1:
@@ -33,54 +52,170 @@ async def get_user_from_event(client, event):
                 if username_part.isdigit():
                     user = await client.get_entity(int(username_part))
                 else:
-                    user = await client.get_entity(username_part)
+                    user = await resolve_username(client, username_part)
                 
                 if not isinstance(user, User):
-                    await event.reply("❌ That's not a user account.")
-                    return None
+                    await reply(event, "❌ That's not a user account.")
+                    return None, None
                 
-                if not await validate_participant(client, event.chat_id, user.id):
-                    await event.reply("❌ User is not a member of this group.")
-                    return None
+                participant = await validate_participant(client, event.chat_id, user.id)
+                if not participant:
+                    await reply(event, "❌ User is not a member of this group.")
+                    return None, None
                     
-                return user
+                return user, participant
                 
             except (UsernameInvalidError, ValueError, PeerIdInvalidError):  # ValueError is built-in Python
-                await event.reply(f"❌ User not found: {username_part}")
-                return None
+                await reply(event, f"❌ User not found: {username_part}")
+                return None, None
             except Exception as e:
-                await event.reply(f"❌ Error finding user: {str(e)[:50]}")
-                return None
+                await reply(event, f"❌ Error finding user: {str(e)[:50]}")
+                return None, None
         
         # Method 2: Reply to message
         elif event.is_reply:
             try:
-                reply = await event.get_reply_message()
-                if not reply or not reply.sender_id:
-                    await event.reply("❌ Could not get user from replied message.")
-                    return None
+                replied = await event.get_reply_message()
+                if not replied or not replied.sender_id:
+                    await reply(event, "❌ Could not get user from replied message.")
+                    return None, None
                 
-                user = await client.get_entity(reply.sender_id)
+                user = await replied.get_sender() or await client.get_entity(replied.sender_id)
                 if not isinstance(user, User):
-                    await event.reply("❌ Replied message is not from a user.")
-                    return None
+                    await reply(event, "❌ Replied message is not from a user.")
+                    return None, None
                 
-                if not await validate_participant(client, event.chat_id, user.id):
-                    await event.reply("❌ User is not a member of this group.")
-                    return None
+                participant = await validate_participant(client, event.chat_id, user.id)
+                if not participant:
+                    await reply(event, "❌ User is not a member of this group.")
+                    return None, None
                     
-                return user
+                return user, participant
                 
             except Exception as e:
-                await event.reply("❌ Error getting user from reply.")
+                await reply(event, "❌ Error getting user from reply.")
                 logger.error(f"Reply error: {e}")
-                return None
+                return None, None
         
         else:
-            await event.reply("❌ Please reply to a user or use @username")
-            return None
+            await reply(event, "❌ Please reply to a user or use @username")
+            return None, None
             
     except Exception as e:
         logger.error(f"Error in get_user_from_event: {e}")
-        await event.reply("❌ Error processing command.")
-        return None
+        await reply(event, "❌ Error processing command.")
+        return None, None
+
+def split_command_args(text):
+    """Split moderation command arguments into targets, duration and reason.
+
+    Targets (@usernames or numeric IDs) and an optional duration come first;
+    the first other word starts a free-text reason, so in
+    `/ban @spammer 7d spamming links` only @spammer is a target.
+
+    Returns:
+        tuple: (targets as written, duration in seconds or None, reason or None)
+    """
+    parts = text.split()[1:]
+    targets, duration = [], None
+    for index, part in enumerate(parts):
+        seconds = parse_duration(part)
+        if seconds is not None:
+            if duration is None and seconds:
+                duration = seconds
+        elif part.startswith('@') or part.isdigit():
+            targets.append(part)
+        else:
+            return targets, duration, ' '.join(parts[index:])
+    return targets, duration, None
+
+async def get_target_refs(client, event):
+    """Collect every username/ID a command names.
+
+    Targets come from the command arguments (see split_command_args) and, if
+    the command was sent as the caption of a text file, from that file (IDs
+    or usernames separated by whitespace, commas or semicolons). Duplicates
+    are removed, order is kept.
+
+    Returns:
+        list: Usernames without the leading @, and numeric IDs, as strings
+    """
+    refs = split_command_args(event.raw_text)[0]
+
+    document = getattr(event.message, 'document', None)
+    if document is not None:
+        if not (document.mime_type or '').startswith('text/'):
+            logger.info(f"Ignoring non-text target list ({document.mime_type}) in {event.chat_id}")
+        elif document.size > BULK_FILE_MAX_BYTES:
+            logger.info(f"Ignoring {document.size}-byte target list in {event.chat_id}")
+        else:
+            data = await client.download_media(event.message, file=bytes)
+            refs += re.split(r'[\s,;]+', data.decode('utf-8', errors='ignore'))
+
+    unique, seen = [], set()
+    for ref in refs:
+        ref = ref.strip().lstrip('@')
+        if ref and ref.lower() not in seen:
+            seen.add(ref.lower())
+            unique.append(ref)
+    return unique
+
+async def _resolve_entities(client, refs):
+    """Resolve refs to entities: numeric IDs in one call, usernames concurrently.
+
+    Returns:
+        list: Entity or None for each ref, in order
+    """
+    ids = [int(ref) for ref in refs if ref.isdigit()]
+    by_id = {}
+    if ids:
+        try:
+            by_id = {entity.id: entity for entity in await client.get_entity(ids)}
+        except Exception:
+            # One unknown ID fails the whole call; fall back to one at a time
+            results = await asyncio.gather(*(client.get_entity(i) for i in ids), return_exceptions=True)
+            by_id = {i: result for i, result in zip(ids, results) if not isinstance(result, Exception)}
+
+    usernames = [ref for ref in refs if not ref.isdigit()]
+    results = await asyncio.gather(*(resolve_username(client, name) for name in usernames), return_exceptions=True)
+    by_name = {name: result for name, result in zip(usernames, results) if not isinstance(result, Exception)}
+
+    return [by_id.get(int(ref)) if ref.isdigit() else by_name.get(ref) for ref in refs]
+
+async def resolve_targets(client, chat_id, refs):
+    """Resolve many command targets to members of a chat.
+
+    Refs are handled BULK_RESOLVE_BATCH at a time: the batch is resolved,
+    then every resolved user's membership is checked concurrently. Refs that
+    turn out to be the same user are only kept once.
+
+    Args:
+        client: Telethon client instance
+        chat_id (int): Chat the targets must belong to
+        refs (list): Usernames (without @) and numeric IDs
+
+    Returns:
+        tuple: (list of (ref, User, ChannelParticipant), list of (ref, reason))
+    """
+    resolved, failures, seen_ids = [], [], set()
+    for start in range(0, len(refs), BULK_RESOLVE_BATCH):
+        batch = refs[start:start + BULK_RESOLVE_BATCH]
+        candidates = []
+        for ref, entity in zip(batch, await _resolve_entities(client, batch)):
+            if entity is None:
+                failures.append((ref, "not found"))
+            elif not isinstance(entity, User):
+                failures.append((ref, "not a user account"))
+            elif entity.id not in seen_ids:
+                seen_ids.add(entity.id)
+                candidates.append((ref, entity))
+
+        participants = await asyncio.gather(
+            *(validate_participant(client, chat_id, user.id) for _, user in candidates)
+        )
+        for (ref, user), participant in zip(candidates, participants):
+            if participant:
+                resolved.append((ref, user, participant))
+            else:
+                failures.append((ref, "not a member of this group"))
+    return resolved, failures
@@ -0,0 +1,357 @@
+"""
+User Cache Module for Telegram Moderation Bot
+
+This module resolves @usernames without asking Telegram every time:
+- Every user the bot sees (message senders, joins and leaves, lookups) is
+  remembered passively, in a bounded in-memory LRU keyed by username
+- Usernames are also written, in batches off the event loop, to an on-disk
+  index (SQLite) so the cache survives restarts
+- A username seen on a new user ID, or a user seen under new usernames,
+  invalidates the old mapping; memory entries expire after USER_CACHE_TTL
+- An index hit is checked with a cheap by-ID lookup; only a miss costs a
+  ResolveUsername RPC, which Telegram rate limits far more strictly
+
+Author: Divyansh Shakya
+"""
+
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from telethon.tl.types import User, InputUser
+from utils import logger, tl_from_bytes
+from metrics import user_cache_lookups
+from config import USER_CACHE_DB, USER_CACHE_SIZE, USER_CACHE_TTL, USER_INDEX_TTL, USER_CACHE_FLUSH_INTERVAL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usernames (
+    username    TEXT    PRIMARY KEY,
+    user_id     INTEGER NOT NULL,
+    access_hash INTEGER NOT NULL,
+    seen        REAL    NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_usernames_user ON usernames (user_id);
+"""
+
+
+def usernames_of(user):
+    """
+    All active usernames of a user, lowercased.
+
+    Args:
+        user: Telethon User
+
+    Returns:
+        frozenset: Usernames without the @
+    """
+    names = []
+    if user.username:
+        names.append(user.username.lower())
+    for item in getattr(user, 'usernames', None) or ():
+        if item.active:
+            names.append(item.username.lower())
+    return frozenset(names)
+
+
+class UserCache:
+    """
+    Username -> user cache, in memory with an on-disk index behind it.
+
+    Remembering a user is a few dict operations and never touches the disk;
+    new or changed usernames are queued and written every
+    USER_CACHE_FLUSH_INTERVAL seconds. Users already cached are not queued
+    again until half their TTL has passed.
+
+    Args:
+        path (str): SQLite database file of the username index
+        max_entries (int): Usernames kept in memory
+        ttl (float): Seconds a username in memory is trusted
+        index_ttl (float): Seconds an index entry is used (0 = no index lookups)
+    """
+
+    def __init__(self, path, max_entries, ttl, index_ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index_ttl = index_ttl
+        self._users = OrderedDict()  # username -> (User, expires_at)
+        self._names = {}  # user ID -> usernames held in memory
+        self._pending = {}  # user ID -> (usernames, access_hash, seen) to write
+        self._forgotten = set()  # Usernames to delete from the index
+        self._conn = None
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.stats = {'memory': 0, 'index': 0, 'miss': 0, 'moved': 0}
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def remember(self, user):
+        """Record a user seen in an update or a lookup. Cheap; safe to call per message."""
+        if not isinstance(user, User) or user.min or user.access_hash is None:
+            return
+        known = self._names.get(user.id)
+        if not user.username and not user.usernames and not known:
+            return
+        names = usernames_of(user)
+        now = time.monotonic()
+        if known == names:
+            entry = self._users.get(next(iter(names)))
+            if entry is not None and entry[1] - now > self.ttl / 2:
+                return
+
+        # Renamed: usernames this user no longer has are free to move
+        if known:
+            for name in known - names:
+                self._drop(name)
+        for name in names:
+            entry = self._users.get(name)
+            if entry is not None and entry[0].id != user.id:
+                self.stats['moved'] += 1
+                logger.info(f"Username @{name} moved from {entry[0].id} to {user.id}")
+                self._drop(name)
+            self._users[name] = (user, now + self.ttl)
+            self._users.move_to_end(name)
+        if names:
+            self._names[user.id] = set(names)
+        else:
+            self._names.pop(user.id, None)
+        self._pending[user.id] = (names, user.access_hash, time.time())
+
+        while len(self._users) > self.max_entries:
+            self._drop(next(iter(self._users)))
+
+    def _drop(self, name):
+        """Remove a username from memory (the index is updated with the owner's next write)."""
+        entry = self._users.pop(name, None)
+        if entry is None:
+            return
+        names = self._names.get(entry[0].id)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del self._names[entry[0].id]
+
+    def forget(self, name):
+        """Invalidate a username in memory and in the index."""
+        self._drop(name)
+        self._forgotten.add(name)
+
+    def get(self, name):
+        """
+        Look a username up in memory only.
+
+        Args:
+            name (str): Lowercase username without the @
+
+        Returns:
+            User: The cached user, or None if unknown or expired
+        """
+        entry = self._users.get(name)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._drop(name)
+            return None
+        self._users.move_to_end(name)
+        return entry[0]
+
+    def dump(self):
+        """
+        Users held in memory, serialized for a snapshot.
+
+        Returns:
+            list: (serialized User, seconds left), least recently used first
+        """
+        now = time.monotonic()
+        users = {}
+        for user, expires_at in self._users.values():
+            if expires_at > now:
+                # A user with several usernames is stored once, with its longest lifetime
+                users[user.id] = (user, max(expires_at, users.get(user.id, (None, 0))[1]))
+        return [(bytes(user), expires_at - now) for user, expires_at in users.values()]
+
+    def load(self, entries, elapsed=0.0):
+        """
+        Put users saved by dump() back in memory (they are in the index already).
+
+        Args:
+            entries (list): Output of dump()
+            elapsed (float): Seconds since the snapshot was taken
+        """
+        now = time.monotonic()
+        for data, remaining in entries:
+            if remaining <= elapsed:
+                continue
+            user = tl_from_bytes(data)
+            if user.id in self._names:
+                continue
+            names = {name for name in usernames_of(user) if name not in self._users}
+            for name in names:
+                self._users[name] = (user, now + remaining - elapsed)
+            if names:
+                self._names[user.id] = names
+        while len(self._users) > self.max_entries:
+            self._drop(next(iter(self._users)))
+
+    def _lookup(self, name):
+        """Index entry (user_id, access_hash) for a username, if recent enough."""
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT user_id, access_hash, seen FROM usernames WHERE username = ?", (name,)
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Failed to read username index: {e}")
+            return None
+        if row is None or row[2] < time.time() - self.index_ttl:
+            return None
+        return row[0], row[1]
+
+    async def resolve(self, client, username):
+        """
+        Resolve a username to its entity, asking Telegram only on a miss.
+
+        Args:
+            client: Telethon client instance
+            username (str): Username, with or without the @
+
+        Returns:
+            Entity returned by Telegram (a User for every cached hit)
+
+        Raises:
+            The errors of client.get_entity() when the username is unknown
+        """
+        name = username.lstrip('@').lower()
+        user = self.get(name)
+        if user is not None:
+            self.stats['memory'] += 1
+            user_cache_lookups.inc('memory')
+            return user
+
+        row = await asyncio.to_thread(self._lookup, name) if self.index_ttl else None
+        if row is not None:
+            try:
+                # GetUsers by ID is cheap; the reply shows whether the username still points here
+                user = await client.get_entity(InputUser(*row))
+            except Exception as e:
+                logger.warning(f"Stale username index entry @{name} -> {row[0]}: {e}")
+                user = None
+            if isinstance(user, User) and name in usernames_of(user):
+                self.stats['index'] += 1
+                user_cache_lookups.inc('index')
+                self.remember(user)
+                return user
+            self.stats['moved'] += 1
+            self.forget(name)
+
+        self.stats['miss'] += 1
+        user_cache_lookups.inc('miss')
+        entity = await client.get_entity(username)
+        self.remember(entity)
+        return entity
+
+    def _take_pending(self):
+        pending, self._pending = self._pending, {}
+        forgotten, self._forgotten = self._forgotten, set()
+        return pending, forgotten
+
+    def _write(self, pending, forgotten):
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.executemany("DELETE FROM usernames WHERE username = ?", ((name,) for name in forgotten))
+                    # A user's rows are replaced as a whole, so old usernames disappear
+                    conn.executemany("DELETE FROM usernames WHERE user_id = ?", ((user_id,) for user_id in pending))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO usernames (username, user_id, access_hash, seen) VALUES (?, ?, ?, ?)",
+                        [(name, user_id, access_hash, seen)
+                         for user_id, (names, access_hash, seen) in pending.items() for name in names]
+                    )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to write username index: {e}")
+            return False
+
+    def _restore(self, pending, forgotten):
+        # Newer sightings queued meanwhile win over the failed batch
+        self._pending = {**pending, **self._pending}
+        self._forgotten |= forgotten
+
+    def flush(self):
+        """Write queued usernames to the index."""
+        pending, forgotten = self._take_pending()
+        if (pending or forgotten) and not self._write(pending, forgotten):
+            self._restore(pending, forgotten)
+
+    def _prune(self):
+        """Delete index entries too old to be used."""
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    removed = conn.execute("DELETE FROM usernames WHERE seen < ?",
+                                           (time.time() - self.index_ttl,)).rowcount
+            if removed:
+                logger.info(f"Pruned {removed} expired usernames from the index")
+        except Exception as e:
+            logger.error(f"Failed to prune username index: {e}")
+
+    async def _flush_periodically(self):
+        if self.index_ttl:
+            await asyncio.to_thread(self._prune)
+        while True:
+            await asyncio.sleep(USER_CACHE_FLUSH_INTERVAL)
+            pending, forgotten = self._take_pending()
+            if (pending or forgotten) and not await asyncio.to_thread(self._write, pending, forgotten):
+                self._restore(pending, forgotten)
+
+    def start(self):
+        """Start the background flusher (call from the running event loop)."""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    def close(self):
+        """Stop the flusher, write what is queued and close the database."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self):
+        """
+        Get lookup counters and the number of usernames in memory.
+
+        Returns:
+            dict: memory/index hits, misses, moved usernames, cached usernames
+        """
+        return {**self.stats, 'cached': len(self._users)}
+
+
+# Shared username cache
+user_cache = UserCache(USER_CACHE_DB, USER_CACHE_SIZE, USER_CACHE_TTL, USER_INDEX_TTL)
+
+
+async def resolve_username(client, username):
+    """Resolve a username through the shared cache; see UserCache.resolve."""
+    return await user_cache.resolve(client, username)
+
+
+def register_user_cache(client, router):
+    """Have the router pass every message sender to the username cache."""
+    def watch_message(event):
+        sender = getattr(event, 'sender', None)
+        if sender is not None:
+            user_cache.remember(sender)
+    router.watch(watch_message)
@@ -1,10 +1,12 @@
-from telethon import events
 from telethon.tl.types import (
     UserStatusOnline, UserStatusOffline, UserStatusRecently,
     UserStatusLastWeek, UserStatusLastMonth, UserStatusEmpty
 )
 from datetime import datetime
 from utils import logger
+from outbox import reply
+from profiling import profiled
+from usercache import resolve_username
 
 def format_user_status(status):
     """
@@ -44,8 +46,9 @@ def format_user_status(status):
         return f"❓ Unknown status: {type(status).__name__}"
 
 
-async def register_userinfo_handler(client):
-    @client.on(events.NewMessage(pattern=r'^/uinfo(?:\s+(@?\w+))?'))
+async def register_userinfo_handler(client, router):
+    @router.command('uinfo', aliases=('userinfo', 'info'), pattern=r'^/uinfo(?:\s+(@?\w+))?')
+    @profiled('uinfo')
     async def userinfo_handler(event):
         args = event.pattern_match.group(1)
         target_user = None
@@ -54,15 +57,15 @@ async def register_userinfo_handler(client):
                 arg = args.strip()
                 if arg.startswith('@'):
                     arg = arg[1:]
-                target_user = await client.get_entity(arg)
+                target_user = await resolve_username(client, arg)
             elif event.is_reply:
                 replied = await event.get_reply_message()
                 target_user = await client.get_entity(replied.sender_id)
             else:
-                await event.reply("❌ Please reply to a user or provide a username with /uinfo @username")
+                await reply(event, "❌ Please reply to a user or provide a username with /uinfo @username")
                 return
         except Exception as e:
-            await event.reply(f"❌ Could not fetch user info: {str(e)}")
+            await reply(event, f"❌ Could not fetch user info: {str(e)}")
             logger.error(f"Userinfo fetch error: {e}")
             return
 
@@ -88,4 +91,4 @@ async def register_userinfo_handler(client):
             text += f"🔒 <b>Restriction:</b> {entity.restriction_reason}\n"
 
 
-        await event.reply(text, parse_mode='html')
+        await reply(event, text, parse_mode='html')
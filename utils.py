@@ -2,124 +2,444 @@
 Utilities Module for Telegram Moderation Bot
 
 This module provides utility functions for the bot including:
-- Logging configuration and setup
-- Moderation action logging and tracking
-- Log formatting and display
+- Non-blocking, rotating logging setup (text or JSON lines)
+- Per-handler RPC accounting
+- A bounded expiring set for short-lived duplicate suppression
+- Parsing and formatting of durations such as 30m, 2h or 1d12h
 
-All moderation actions are logged here for audit trail and transparency.
+Moderation actions are recorded in audit.py.
 
 Author: Divyansh Shakya
 """
 
-import logging
-import time
+import os
 import sys
-from collections import defaultdict
+import gzip
+import json
+import time
+import queue
+import re
+import zlib
+import struct
+import atexit
+import contextlib
+import marshal
+import shutil
+import logging
+import logging.handlers
+import contextvars
+from telethon.errors.rpcerrorlist import FloodWaitError
+from telethon.extensions import BinaryReader
+from collections import defaultdict, OrderedDict
+from metrics import rpc_seconds, rpc_errors, flood_waits
+from config import LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN
+
+# Structured logging context - set per handler task, copied onto every record
+_log_context = contextvars.ContextVar('log_context', default={})
+
+def set_log_context(**fields):
+    """
+    Attach fields (e.g. chat_id, user_id, command) to every log record
+    emitted by the current handler task.
+    """
+    _log_context.set({**_log_context.get(), **fields})
+
+class ContextFilter(logging.Filter):
+    """Copy the current task's log context onto the record.
+
+    Runs on the QueueHandler, i.e. in the task that logged, before the
+    record is handed to the background writer thread.
+    """
+
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+class LightQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers all formatting to the writer thread.
+
+    Only the message arguments are merged (so later mutation of the
+    arguments cannot change the record); timestamps, level names and
+    layout are formatted by the listener's handlers, off the event loop.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    FIELDS = ('chat_id', 'user_id', 'command')
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _gzip_rotator(source, dest):
+    """Compress a rotated log file instead of keeping it as plain text."""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def _build_file_handler():
+    """Rotating file handler: by time if LOG_ROTATE_WHEN is set, else by size."""
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    handler.namer = lambda name: name + '.gz'
+    handler.rotator = _gzip_rotator
+    return handler
 
 # Setup logging with proper encoding for Windows
 def setup_logging():
     """
     Configure logging for the bot.
     
-    Sets up both file and console logging with proper formatting and encoding.
-    Logs are written to 'bot.log' file and displayed in console.
+    Handlers that do I/O never run on the event loop: the logger only puts
+    records on an in-memory queue, and a background thread writes them to
+    the console and to a rotating, gzip-compressed LOG_FILE. Set LOG_FORMAT
+    to 'json' for JSON-lines output including chat_id/user_id/command.
     
     Returns:
         logging.Logger: Configured logger instance
     """
-    # Create formatter without emojis for log files
-    file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # Create formatter for console (handle encoding)
-    console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    global log_listener
+
+    text_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_formatter = JsonLinesFormatter() if LOG_FORMAT == 'json' else text_formatter
     
-    # File handler - writes logs to bot.log with UTF-8 encoding
-    file_handler = logging.FileHandler('bot.log', encoding='utf-8')
+    # File handler - rotating and compressed, UTF-8 encoded
+    file_handler = _build_file_handler()
     file_handler.setFormatter(file_formatter)
     
     # Console handler - displays logs in terminal with proper encoding
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(console_formatter)
+    console_handler.setFormatter(text_formatter)
+    
+    # Queue handler - the only handler on the logger, so logging never blocks
+    log_queue = queue.SimpleQueue()
+    queue_handler = LightQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    log_listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    log_listener.start()
+    atexit.register(stop_logging)
     
     # Configure root logger with INFO level
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(queue_handler)
     
     return logger
 
+def stop_logging():
+    """Flush queued log records and stop the background writer thread."""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+@contextlib.contextmanager
+def logging_paused():
+    """
+    Stop the log writer thread for the duration of a block, e.g. while
+    forking; records logged meanwhile wait in the queue.
+    """
+    listener = log_listener
+    if listener is not None:
+        listener.stop()
+    try:
+        yield
+    finally:
+        if listener is not None:
+            listener.start()
+
 # Initialize logger
+log_listener = None
 logger = setup_logging()
 
-# Moderation logging - stores recent moderation actions in memory
-moderation_log = []
+# RPC accounting - per-task [count, seconds] of Telegram requests sent through the client
+_rpc_counter = contextvars.ContextVar('rpc_counter', default=None)
 
-def log_moderation_action(admin_id, admin_name, action, target_id, target_name, chat_id, success=True):
+def instrument_client(client):
     """
-    Log all moderation actions for audit trail.
-    
-    Records every moderation action (ban, mute, kick, etc.) with details
-    including who performed it, on whom, and whether it succeeded.
+    Count every Telegram RPC the client sends.
+
+    Wraps the client's internal request dispatcher so that all requests,
+    including those issued by helpers such as get_entity() or get_me(),
+    are counted against the current task's counter (see start_rpc_count)
+    and recorded in the per-request-type latency/error metrics.
     
     Args:
-        admin_id (int): ID of admin who performed the action
-        admin_name (str): Username or name of the admin
-        action (str): Type of action (banned, muted, kicked, etc.)
-        target_id (int): ID of user who was moderated
-        target_name (str): Username or name of target user
-        chat_id (int): Group/chat where action was performed
-        success (bool): Whether the action succeeded (default: True)
-    """
-    log_entry = {
-        'timestamp': time.time(),
-        'admin_id': admin_id,
-        'admin_name': admin_name,
-        'action': action,
-        'target_id': target_id,
-        'target_name': target_name,
-        'chat_id': chat_id,
-        'success': success
-    }
-    moderation_log.append(log_entry)
-    status = 'SUCCESS' if success else 'FAILED'
-    logger.info(f"MODERATION: {admin_name} ({admin_id}) {action} {target_name} ({target_id}) in {chat_id} - {status}")
-
-def get_recent_logs(count=5):
-    """
-    Get recent moderation logs.
-    
-    Retrieves the most recent moderation actions from memory.
-    Used by the /logs command to display recent activity.
+        client: Telethon client instance
+    """
+    original_call = client._call
+
+    async def counted_call(sender, request, *args, **kwargs):
+        counter = _rpc_counter.get()
+        if counter is not None:
+            counter[0] += 1
+        method = type(request).__name__
+        started = time.perf_counter()
+        try:
+            return await original_call(sender, request, *args, **kwargs)
+        except Exception as e:
+            rpc_errors.inc(method, type(e).__name__)
+            if isinstance(e, FloodWaitError):
+                flood_waits.observe(e.seconds, method)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            rpc_seconds.observe(elapsed, method)
+            if counter is not None:
+                counter[1] += elapsed
+
+    client._call = counted_call
+
+def start_rpc_count():
+    """Start counting RPCs for the current handler task."""
+    _rpc_counter.set([0, 0.0])
+
+def get_rpc_counter():
+    """Get the current task's RPC counter so work done elsewhere can be charged to it."""
+    return _rpc_counter.get()
+
+def set_rpc_counter(counter):
+    """Charge RPCs made by the current task to a counter from get_rpc_counter()."""
+    _rpc_counter.set(counter)
+
+def get_rpc_count():
+    """
+    Get the number of RPCs sent since start_rpc_count() in this task.
     
+    Returns:
+        int: RPC count, or 0 if counting was not started
+    """
+    counter = _rpc_counter.get()
+    return counter[0] if counter is not None else 0
+
+class ExpiringSet:
+    """
+    Bounded set whose keys expire a fixed time after they were added.
+
+    Every key has the same TTL, so insertion order is also expiry order:
+    expired keys are swept from the front on each access, in O(1) amortized
+    time, with no background task or timer per key. When max_size is
+    reached the oldest key is evicted early.
+
+    Args:
+        ttl (float): Seconds a key stays in the set
+        max_size (int): Hard cap on the number of keys held
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expiry = OrderedDict()  # key -> monotonic expiry time
+
+    def _sweep(self, now):
+        expiry = self._expiry
+        while expiry:
+            key, expires_at = next(iter(expiry.items()))
+            if expires_at > now:
+                break
+            expiry.popitem(last=False)
+
+    def add(self, key):
+        """
+        Add a key unless it is already present.
+
+        Returns:
+            bool: True if the key was added, False if it was a duplicate
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        if key in self._expiry:
+            return False
+        self._expiry[key] = now + self.ttl
+        if len(self._expiry) > self.max_size:
+            self._expiry.popitem(last=False)
+        return True
+
+    def discard(self, key):
+        """Remove a key if it is present."""
+        self._expiry.pop(key, None)
+
+    def dump(self):
+        """
+        Keys with their remaining lifetime, oldest first, for a snapshot.
+
+        Returns:
+            list: (key, seconds left) pairs
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        return [(key, expires_at - now) for key, expires_at in self._expiry.items()]
+
+    def load(self, items, elapsed=0.0):
+        """
+        Add keys saved by dump(), minus the time passed since the snapshot.
+
+        Args:
+            items (list): (key, seconds left) pairs, oldest first
+            elapsed (float): Seconds since the snapshot was taken
+        """
+        now = time.monotonic()
+        for key, remaining in items:
+            remaining -= elapsed
+            if remaining > 0 and key not in self._expiry:
+                self._expiry[key] = now + min(remaining, self.ttl)
+        while len(self._expiry) > self.max_size:
+            self._expiry.popitem(last=False)
+
+    def __contains__(self, key):
+        self._sweep(time.monotonic())
+        return key in self._expiry
+
+    def __len__(self):
+        self._sweep(time.monotonic())
+        return len(self._expiry)
+
+# magic, format version, wall-clock save time, CRC32 of the compressed body
+STATE_FILE_HEADER = struct.Struct('>4sHdI')
+
+def encode_state_file(data, saved_at, magic, version):
+    """
+    Serialize plain data (marshal-compatible values only) for a state file.
+
     Args:
-        count (int): Number of recent logs to retrieve (default: 5)
-        
+        data: Dicts, lists, tuples, strings, bytes, numbers and None
+        saved_at (float): Wall-clock time the data was taken
+        magic (bytes): Four bytes identifying the kind of file
+        version (int): Format version of the data
+
     Returns:
-        list: List of recent log entries (dictionaries)
+        bytes: Header and zlib-compressed body
     """
-    return moderation_log[-count:] if moderation_log else []
+    body = zlib.compress(marshal.dumps(data), 6)
+    return STATE_FILE_HEADER.pack(magic, version, saved_at, zlib.crc32(body)) + body
 
-def format_log_text(logs):
+def decode_state_file(blob, magic, version):
     """
-    Format logs for display in Telegram.
-    
-    Converts log entries into a formatted string suitable for
-    sending as a message in Telegram.
-    
+    Parse and check a file written by encode_state_file().
+
+    Loading runs no code (marshal only builds plain values).
+
     Args:
-        logs (list): List of log entry dictionaries
-        
+        blob (bytes): File contents
+        magic (bytes): Expected kind of file
+        version (int): Expected format version
+
     Returns:
-        str: Formatted log text with emojis and timestamps
+        tuple: (saved_at, data)
+
+    Raises:
+        ValueError: If the file is of another kind or version, or is damaged
     """
-    if not logs:
-        return "📋 No moderation actions logged yet."
-    
-    log_text = "📋 **Recent Moderation Actions:**\n\n"
-    for log in logs:
-        timestamp = time.strftime('%H:%M:%S', time.localtime(log['timestamp']))
-        status = "✅" if log['success'] else "❌"
-        log_text += f"{status} `{timestamp}` - {log['admin_name']} {log['action']} {log['target_name']}\n"
-    
-    return log_text
+    if len(blob) < STATE_FILE_HEADER.size:
+        raise ValueError("file is truncated")
+    found_magic, found_version, saved_at, crc = STATE_FILE_HEADER.unpack_from(blob)
+    if found_magic != magic:
+        raise ValueError("not a file of this kind")
+    if found_version != version:
+        raise ValueError(f"format version {found_version}, expected {version}")
+    body = blob[STATE_FILE_HEADER.size:]
+    if zlib.crc32(body) != crc:
+        raise ValueError("checksum mismatch")
+    try:
+        return saved_at, marshal.loads(zlib.decompress(body))
+    except (zlib.error, EOFError, TypeError, ValueError) as e:
+        raise ValueError(f"unreadable body: {e}")
+
+def write_file_atomic(path, data):
+    """
+    Replace a file's contents so that a crash leaves either the old or the new file.
+
+    Args:
+        path (str): File to write
+        data (bytes): New contents
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    # Make the rename itself durable (POSIX only)
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def tl_from_bytes(data):
+    """
+    Rebuild a Telethon object serialized with bytes(obj).
+
+    Args:
+        data (bytes): Serialized TL object
+
+    Returns:
+        TLObject: The deserialized object
+    """
+    with BinaryReader(data) as reader:
+        return reader.tgread_object()
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_DURATION_RE = re.compile(r'^(?:\d+[smhdw])+$')
+_DURATION_PART_RE = re.compile(r'(\d+)([smhdw])')
+
+def parse_duration(text):
+    """
+    Parse a duration such as 90s, 30m, 2h, 7d, 1w or 1d12h.
+
+    Args:
+        text (str): Duration text (case-insensitive)
+
+    Returns:
+        int: Duration in seconds, or None if text is not a duration
+    """
+    text = text.strip().lower()
+    if not _DURATION_RE.match(text):
+        return None
+    return sum(int(amount) * DURATION_UNITS[unit] for amount, unit in _DURATION_PART_RE.findall(text))
+
+def format_duration(seconds):
+    """
+    Format seconds with the two largest units, e.g. 7d, 2h30m or 45s.
+
+    Args:
+        seconds (int): Duration in seconds
+
+    Returns:
+        str: Compact duration text
+    """
+    parts = []
+    for unit, size in sorted(DURATION_UNITS.items(), key=lambda item: -item[1]):
+        if unit == 'w':
+            continue
+        amount, seconds = divmod(int(seconds), size)
+        if amount:
+            parts.append(f"{amount}{unit}")
+    return ''.join(parts[:2]) or '0s'
@@ -1,18 +1,49 @@
+import os
+import html
+import json
+import time
 import random
 import asyncio
+import hashlib
 from telethon import events
 from telethon.tl.types import (
-    MessageEntityMention, MessageEntityMentionName,
+    MessageEntityMention, MessageEntityMentionName, InputPhoto,
     UserStatusOnline, UserStatusOffline, UserStatusRecently,
     UserStatusLastWeek, UserStatusLastMonth, UserStatusEmpty
 )
+from telethon.errors.rpcerrorlist import (
+    FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError,
+    MediaEmptyError, PhotoInvalidError
+)
 from datetime import datetime
-from security import check_user_is_admin
-from utils import logger
+from security import handle_members_left
+from utils import logger, set_log_context
+from metrics import handler_errors, dedupe_hits
+from profiling import profiled
+from outbox import reply, send_message, send_file, kick_participant, GREETING
+from usercache import user_cache, resolve_username
+from coalesce import forget_participant
+from state import get_state, StateError
+from catchup import catch_up
+from config import (
+    WELCOME_IMAGE, WELCOME_MEDIA_CACHE, DEDUPE_TTL,
+    WELCOME_COALESCE_WINDOW, WELCOME_MAX_MENTIONS, WELCOME_MIN_INTERVAL, CATCH_UP_ACTION_MAX_AGE
+)
+
+# Uploaded welcome photo, reused for every welcome instead of re-uploading
+# Keys: id, access_hash, file_reference (hex), size, mtime_ns, sha256
+welcome_media = None
+_welcome_upload_lock = asyncio.Lock()
 
-# Track recently welcomed and farewelled users to prevent duplicates
-recently_welcomed = set()
-recently_farewelled = set()
+# Join-wave coalescing: chat_id -> pending batch, and last welcome post time per chat
+pending_welcomes = {}
+last_welcome_sent = {}
+
+# Errors meaning the cached photo handle is no longer usable
+STALE_MEDIA_ERRORS = (
+    FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError,
+    MediaEmptyError, PhotoInvalidError
+)
 
 def format_user_status(status):
     """
@@ -51,6 +82,126 @@ def format_user_status(status):
     else:
         return f"❓ Unknown status: {type(status).__name__}"
 
+def _file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_welcome_media():
+    """Load the persisted welcome photo handle, if any."""
+    global welcome_media
+    try:
+        with open(WELCOME_MEDIA_CACHE, 'r', encoding='utf-8') as f:
+            welcome_media = json.load(f)
+    except FileNotFoundError:
+        welcome_media = None
+    except Exception as e:
+        logger.error(f"Could not load welcome media cache: {e}")
+        welcome_media = None
+
+def save_welcome_media():
+    """Persist the welcome photo handle atomically (write temp file, then rename)."""
+    tmp_path = WELCOME_MEDIA_CACHE + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(welcome_media, f)
+        os.replace(tmp_path, WELCOME_MEDIA_CACHE)
+    except Exception as e:
+        logger.error(f"Could not save welcome media cache: {e}")
+
+def forget_welcome_media():
+    """Drop the cached handle so the next welcome re-uploads the image."""
+    global welcome_media
+    welcome_media = None
+    try:
+        os.remove(WELCOME_MEDIA_CACHE)
+    except FileNotFoundError:
+        pass
+
+def get_cached_welcome_photo():
+    """
+    Return the cached InputPhoto for WELCOME_IMAGE if it is still current.
+
+    The image on disk is compared by size and mtime; if those changed, the
+    content hash decides whether the cached upload still matches.
+
+    Returns:
+        InputPhoto: Reusable photo handle, or None if an upload is needed
+    """
+    if welcome_media is None:
+        return None
+
+    try:
+        stat = os.stat(WELCOME_IMAGE)
+    except OSError:
+        return None
+
+    if (stat.st_size, stat.st_mtime_ns) != (welcome_media['size'], welcome_media['mtime_ns']):
+        if _file_sha256(WELCOME_IMAGE) != welcome_media['sha256']:
+            forget_welcome_media()
+            return None
+        # Touched but unchanged - remember the new stat so we don't hash again
+        welcome_media['size'], welcome_media['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+        save_welcome_media()
+
+    return InputPhoto(
+        id=welcome_media['id'],
+        access_hash=welcome_media['access_hash'],
+        file_reference=bytes.fromhex(welcome_media['file_reference'])
+    )
+
+def remember_welcome_photo(message):
+    """Cache the photo from a freshly uploaded welcome message."""
+    global welcome_media
+    photo = getattr(message, 'photo', None)
+    if photo is None:
+        return
+    stat = os.stat(WELCOME_IMAGE)
+    welcome_media = {
+        'id': photo.id,
+        'access_hash': photo.access_hash,
+        'file_reference': photo.file_reference.hex(),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': _file_sha256(WELCOME_IMAGE)
+    }
+    save_welcome_media()
+
+async def send_welcome_photo(client, chat, caption, reply_to=None):
+    """
+    Send the welcome image, uploading it only when no valid handle is cached.
+
+    Concurrent welcomes during a join wave wait for the first upload instead
+    of each uploading their own copy. If Telegram rejects the cached handle
+    (expired file reference, deleted photo), it is dropped and re-uploaded once.
+    """
+    photo = get_cached_welcome_photo()
+    if photo is not None:
+        try:
+            return await send_file(
+                client, chat, photo, caption=caption,
+                reply_to=reply_to, parse_mode="html"
+            )
+        except STALE_MEDIA_ERRORS as e:
+            logger.info(f"Cached welcome photo is stale ({e.__class__.__name__}), re-uploading")
+            forget_welcome_media()
+
+    async with _welcome_upload_lock:
+        # Another welcome may have finished uploading while we waited
+        photo = get_cached_welcome_photo()
+        if photo is not None:
+            return await send_file(
+                client, chat, photo, caption=caption,
+                reply_to=reply_to, parse_mode="html"
+            )
+
+        message = await send_file(
+            client, chat, WELCOME_IMAGE, caption=caption,
+            reply_to=reply_to, parse_mode="html",
+            supports_streaming=True
+        )
+        remember_welcome_photo(message)
+        return message
+
 async def send_fancy_welcome(client, chat, target_user, reply_to=None):
     """Send the fancy welcome message with image and formatted text"""
     greetings = [
@@ -79,20 +230,97 @@ async def send_fancy_welcome(client, chat, target_user, reply_to=None):
         "💬 <i>For queries, type</i> @admins"
     )
 
-    # Update this path to your welcome image
-    file_path = r"Welc.jpeg"
-
     try:
-        await client.send_file(
-            chat, file_path, caption=caption,
-            reply_to=reply_to, parse_mode="html",
-            supports_streaming=True
-        )
+        await send_welcome_photo(client, chat, caption, reply_to)
     except Exception as e:
         # If image fails, send text only
-        await client.send_message(chat, caption, parse_mode="html", reply_to=reply_to)
+        await send_message(client, chat, caption, parse_mode="html", reply_to=reply_to, priority=GREETING)
         logger.error(f"Welcome image failed: {e}")
 
+async def send_group_welcome(client, chat, users, extra_count=0):
+    """Send one aggregated welcome mentioning several new members"""
+    group_name = chat.title if hasattr(chat, 'title') and chat.title else "this group"
+    mentions = ", ".join(
+        f"<a href='tg://user?id={user.id}'>{html.escape((user.first_name or 'member')[:32])}</a>"
+        for user in users
+    )
+    if extra_count:
+        mentions += f" and <b>{extra_count}</b> more"
+
+    caption = (
+        f"{random.choice(['🌸', '✨', '🥳', '💫', '🔥'])} <b>Welcome to</b> <b>{group_name}</b>!\n\n"
+        "━━━━━━━━━━━━━━━━━\n"
+        f"👥 {mentions}\n"
+        "━━━━━━━━━━━━━━━━━\n\n"
+        "💬 <i>For queries, type</i> @admins"
+    )
+
+    try:
+        await send_welcome_photo(client, chat, caption)
+    except Exception as e:
+        await send_message(client, chat, caption, parse_mode="html", priority=GREETING)
+        logger.error(f"Welcome image failed: {e}")
+
+def queue_welcome(client, chat, target_user):
+    """
+    Buffer a join and schedule one welcome post for the chat's current batch.
+
+    Joins arriving within WELCOME_COALESCE_WINDOW seconds are merged into a
+    single message, and a chat never gets more than one welcome post per
+    WELCOME_MIN_INTERVAL seconds; joins that arrive while the cap is in force
+    join the next batch. Only WELCOME_MAX_MENTIONS users are kept per batch,
+    the rest are counted, so memory and latency stay bounded during raids.
+    """
+    batch = pending_welcomes.get(chat.id)
+    if batch is None:
+        batch = {'chat': chat, 'users': {}, 'extra': 0}
+        pending_welcomes[chat.id] = batch
+        now = time.monotonic()
+        delay = max(WELCOME_COALESCE_WINDOW, last_welcome_sent.get(chat.id, 0) + WELCOME_MIN_INTERVAL - now)
+        asyncio.create_task(flush_welcomes(client, chat.id, delay))
+
+    if target_user.id in batch['users']:
+        return
+    if len(batch['users']) < WELCOME_MAX_MENTIONS:
+        batch['users'][target_user.id] = target_user
+    else:
+        batch['extra'] += 1
+
+async def flush_welcomes(client, chat_id, delay):
+    """Wait out the batch window, then send the chat's pending welcome"""
+    await asyncio.sleep(delay)
+    batch = pending_welcomes.pop(chat_id, None)
+    if not batch:
+        return
+    last_welcome_sent[chat_id] = time.monotonic()
+
+    users = list(batch['users'].values())
+    try:
+        if len(users) == 1 and not batch['extra']:
+            await send_fancy_welcome(client, batch['chat'], users[0])
+        else:
+            await send_group_welcome(client, batch['chat'], users, batch['extra'])
+        logger.info(f"Auto-welcomed {len(users) + batch['extra']} user(s) to {chat_id}")
+    except Exception as e:
+        logger.error(f"Error sending welcome batch to {chat_id}: {e}")
+
+async def send_pending_welcomes(client):
+    """Send every batched welcome now instead of at the end of its window (used on shutdown)"""
+    await asyncio.gather(*(flush_welcomes(client, chat_id, 0) for chat_id in list(pending_welcomes)))
+
+def dump_welcome_pacing():
+    """Seconds since each chat's last welcome post, for a snapshot"""
+    now = time.monotonic()
+    return {chat_id: now - sent for chat_id, sent in last_welcome_sent.items()
+            if now - sent < WELCOME_MIN_INTERVAL}
+
+def load_welcome_pacing(ages, elapsed=0.0):
+    """Restore last welcome post times saved by dump_welcome_pacing()"""
+    now = time.monotonic()
+    for chat_id, age in ages.items():
+        if age + elapsed < WELCOME_MIN_INTERVAL:
+            last_welcome_sent.setdefault(chat_id, now - age - elapsed)
+
 async def send_fancy_goodbye(client, chat, target_user):
     """Send the goodbye message when user leaves"""
     name_clickable = f"<a href='tg://user?id={target_user.id}'>{target_user.first_name}</a>"
@@ -104,125 +332,99 @@ async def send_fancy_goodbye(client, chat, target_user):
     )
     
     try:
-        await client.send_message(chat, goodbye_message, parse_mode="html")
+        await send_message(client, chat, goodbye_message, parse_mode="html", priority=GREETING)
         logger.info(f"Sent goodbye message for user {target_user.id}")
     except Exception as e:
         logger.error(f"Goodbye message failed: {e}")
 
-async def remove_from_set(s, key, delay):
-    """Remove key from set after delay"""
-    await asyncio.sleep(delay)
-    s.discard(key)
+async def dedupe_chat_actions(chat_id, user_ids, joined):
+    """
+    Filter out joins/leaves already seen within DEDUPE_TTL.
 
-async def register_userinfo_handler(client):
-    @client.on(events.NewMessage(pattern=r'^/uinfo(?:\s+(@?\w+))?'))
-    async def userinfo_handler(event):
-        args = event.pattern_match.group(1)
-        target_user = None
-        try:
-            if args:
-                arg = args.strip()
-                if arg.startswith('@'):
-                    arg = arg[1:]
-                target_user = await client.get_entity(arg)
-            elif event.is_reply:
-                replied = await event.get_reply_message()
-                target_user = await client.get_entity(replied.sender_id)
-            else:
-                await event.reply("❌ Please reply to a user or provide a username with /uinfo @username")
-                return
-        except Exception as e:
-            await event.reply(f"❌ Could not fetch user info: {str(e)}")
-            logger.error(f"Userinfo fetch error: {e}")
-            return
+    Args:
+        chat_id (int): Chat the users joined or left
+        user_ids (list): Users in the ChatAction event
+        joined (bool): True for joins, False for leaves
+
+    Returns:
+        set: IDs of users whose join/leave is new (all of them if the state backend fails)
+    """
+    kind = 'join' if joined else 'leave'
+    pipeline = get_state().pipeline()
+    for user_id in user_ids:
+        pipeline.set_if_absent(f"chat_action:{chat_id}:{user_id}:{kind}", 1, ttl=DEDUPE_TTL)
+    try:
+        added = await pipeline.execute()
+    except StateError as e:
+        logger.error(f"Join/leave dedupe failed in {chat_id}: {e}")
+        return set(user_ids)
+    return {user_id for user_id, fresh in zip(user_ids, added) if fresh}
+
+
+async def register_welcome_handler(client, router):
+    load_welcome_media()
 
-        entity = target_user
-        text = "<b>📊 User Information:</b>\n\n"
-        text += f"🆔 <b>ID:</b> <code>{entity.id}</code>\n"
-        text += f"👤 <b>Name:</b> {entity.first_name or ''} {entity.last_name or ''}\n"
-        text += f"📛 <b>Username:</b> @{entity.username or 'None'}\n"
-        text += f"📞 <b>Phone:</b> {entity.phone or 'None'}\n"
-        text += f"🤖 <b>Bot:</b> {'Yes' if entity.bot else 'No'}\n"
-        text += f"✅ <b>Verified:</b> {'Yes' if getattr(entity, 'verified', False) else 'No'}\n"
-        text += f"⚠️ <b>Scam:</b> {'Yes' if getattr(entity, 'scam', False) else 'No'}\n"
-        text += f"🚫 <b>Restricted:</b> {'Yes' if getattr(entity, 'restricted', False) else 'No'}\n"
-        text += f"❌ <b>Deleted:</b> {'Yes' if getattr(entity, 'deleted', False) else 'No'}\n"
-        text += f"⭐ <b>Premium:</b> {'Yes' if getattr(entity, 'premium', False) else 'No'}\n"
-        
-        # Additional info if available
-        if hasattr(entity, 'status'):
-            text += f"<b>Status:</b> {format_user_status(entity.status)}\n"
-        
-        if hasattr(entity, 'restriction_reason') and entity.restriction_reason:
-            text += f"🔒 <b>Restriction:</b> {entity.restriction_reason}\n"
-
-        await event.reply(text, parse_mode='html')
-
-async def register_welcome_handler(client):
     @client.on(events.ChatAction)
+    @profiled('chat_action')
     async def auto_welcome_goodbye_handler(event):
-        """Handle both welcome and goodbye events"""
+        """Single pipeline for every join/leave: dedupe, welcome, goodbye"""
+        handler = 'chat_action'
         try:
+            age = catch_up.observe(event)
+            joined = event.user_joined or event.user_added
+            left = event.user_left or event.user_kicked
+            if not (joined or left):
+                return
+            handler = 'auto_welcome' if joined else 'auto_goodbye'
+            set_log_context(chat_id=event.chat_id, command=handler)
+
+            # Keep cached admin rosters correct when an admin leaves,
+            # and cached "not a participant" answers when a user joins
+            if left:
+                handle_members_left(event.chat_id, event.user_ids)
+            else:
+                for user_id in event.user_ids:
+                    forget_participant(event.chat_id, user_id)
+
+            # Joins/leaves from long ago (backlog after downtime): the users are not waiting any more
+            if age > CATCH_UP_ACTION_MAX_AGE:
+                catch_up.discard('join' if joined else 'leave')
+                return
+
+            # Dedupe before fetching anything, in the shared state so a standby
+            # process does not welcome the same join; set_if_absent is False for repeats
+            fresh_ids = await dedupe_chat_actions(event.chat_id, event.user_ids, bool(joined))
+            if len(fresh_ids) < len(event.user_ids):
+                dedupe_hits.inc(handler, amount=len(event.user_ids) - len(fresh_ids))
+            if not fresh_ids:
+                logger.info(f"Skipped duplicate {'welcome' if joined else 'goodbye'} in {event.chat_id}")
+                return
+
             chat = await event.get_chat()
+            users = [user for user in await event.get_users() if user and user.id in fresh_ids]
+            for user in users:
+                user_cache.remember(user)
 
             # --- Welcome logic ---
-            if event.user_joined or event.user_added:
-                if event.user:
-                    target_user = await event.get_user()
-                    key = f"welcome_{target_user.id}_{chat.id}"
-                    if key not in recently_welcomed:
-                        recently_welcomed.add(key)
-                        await send_fancy_welcome(client, chat, target_user)
-                        logger.info(f"Auto-welcomed user {target_user.id} to {chat.id}")
-                        asyncio.create_task(remove_from_set(recently_welcomed, key, 30))
-                    else:
-                        logger.info(f"Skipped duplicate welcome for user {target_user.id}")
-                
-                elif event.users:
-                    users = await event.get_users()
-                    for target_user in users:
-                        key = f"welcome_{target_user.id}_{chat.id}"
-                        if key not in recently_welcomed:
-                            recently_welcomed.add(key)
-                            await send_fancy_welcome(client, chat, target_user)
-                            logger.info(f"Auto-welcomed user {target_user.id} to {chat.id}")
-                            asyncio.create_task(remove_from_set(recently_welcomed, key, 30))
-                            await asyncio.sleep(1)
+            if joined:
+                for target_user in users:
+                    queue_welcome(client, chat, target_user)
 
             # --- Goodbye logic ---
-            if event.user_left or event.user_kicked:
-                if event.user:
-                    target_user = await event.get_user()
-                    key = f"goodbye_{target_user.id}_{chat.id}"
-                    if key not in recently_farewelled:
-                        recently_farewelled.add(key)
-                        await send_fancy_goodbye(client, chat, target_user)
-                        logger.info(f"Said goodbye to user {target_user.id} from {chat.id}")
-                        asyncio.create_task(remove_from_set(recently_farewelled, key, 30))
-                    else:
-                        logger.info(f"Skipped duplicate goodbye for user {target_user.id}")
-                
-                elif event.users:
-                    users = await event.get_users()
-                    for target_user in users:
-                        key = f"goodbye_{target_user.id}_{chat.id}"
-                        if key not in recently_farewelled:
-                            recently_farewelled.add(key)
-                            await send_fancy_goodbye(client, chat, target_user)
-                            logger.info(f"Said goodbye to user {target_user.id} from {chat.id}")
-                            asyncio.create_task(remove_from_set(recently_farewelled, key, 30))
-                            await asyncio.sleep(1)
+            else:
+                # Queued together; the outbox paces them like any other greeting
+                await asyncio.gather(*(send_fancy_goodbye(client, chat, target_user) for target_user in users))
+                for target_user in users:
+                    logger.info(f"Said goodbye to user {target_user.id} from {chat.id}")
 
         except Exception as e:
+            handler_errors.inc(handler)
             logger.error(f"Auto welcome/goodbye error: {e}")
 
     # Manual welcome handler
-    @client.on(events.NewMessage(pattern=r'^/welcome(?:\s+(.*))?$'))
+    @router.command('welcome', pattern=r'^/welcome(?:\s+(.*))?$', admin_only=True)
+    @profiled('welcome')
     async def manual_welcome(event):
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can use this command.")
-            return
-
         chat = await event.get_chat()
         target_user = None
 
@@ -236,7 +438,7 @@ async def register_welcome_handler(client):
             mention_text = event.pattern_match.group(1).strip()
             if mention_text.startswith('@'):
                 try:
-                    target_user = await client.get_entity(mention_text)
+                    target_user = await resolve_username(client, mention_text)
                 except Exception:
                     pass
 
@@ -246,7 +448,7 @@ async def register_welcome_handler(client):
                 try:
                     if isinstance(entity, MessageEntityMention):
                         username = event.message.raw_text[entity.offset:entity.offset + entity.length]
-                        target_user = await client.get_entity(username)
+                        target_user = await resolve_username(client, username)
                     elif isinstance(entity, MessageEntityMentionName):
                         target_user = await client.get_entity(entity.user_id)
                     if target_user:
@@ -260,19 +462,16 @@ async def register_welcome_handler(client):
                 "**Method 1:** `/welcome @username`\n"
                 "**Method 2:** Reply to user's message with `/welcome`\n"
             )
-            await event.reply(usage_msg)
+            await reply(event, usage_msg)
             return
 
         await send_fancy_welcome(client, chat, target_user, event.reply_to_msg_id)
 
     # Manual goodbye handler - FIXED VERSION (no duplicate messages)
-    @client.on(events.NewMessage(pattern=r'^/goodbye(?:\s+(.*))?$'))
+    @router.command('goodbye', pattern=r'^/goodbye(?:\s+(.*))?$', admin_only=True)
+    @profiled('goodbye')
     async def manual_goodbye(event):
         """Remove user from group and send goodbye message"""
-        if not await check_user_is_admin(client, event):
-            await event.reply("❌ Only admins can use this command.")
-            return
-
         chat = await event.get_chat()
         target_user = None
 
@@ -286,7 +485,7 @@ async def register_welcome_handler(client):
             mention_text = event.pattern_match.group(1).strip()
             if mention_text.startswith('@'):
                 try:
-                    target_user = await client.get_entity(mention_text)
+                    target_user = await resolve_username(client, mention_text)
                 except Exception:
                     pass
 
@@ -296,7 +495,7 @@ async def register_welcome_handler(client):
                 try:
                     if isinstance(entity, MessageEntityMention):
                         username = event.message.raw_text[entity.offset:entity.offset + entity.length]
-                        target_user = await client.get_entity(username)
+                        target_user = await resolve_username(client, username)
                     elif isinstance(entity, MessageEntityMentionName):
                         target_user = await client.get_entity(entity.user_id)
                     if target_user:
@@ -311,33 +510,33 @@ async def register_welcome_handler(client):
                 "**Method 2:** Reply to user's message with `/goodbye`\n\n"
                 "⚠️ **Warning:** This will remove the user from the group!"
             )
-            await event.reply(usage_msg)
+            await reply(event, usage_msg)
             return
 
         # Check if trying to remove an admin
         try:
             user_permissions = await client.get_permissions(chat, target_user)
             if user_permissions.is_admin:
-                await event.reply("❌ Cannot remove an admin from the group!")
+                await reply(event, "❌ Cannot remove an admin from the group!")
                 return
         except Exception:
             pass
 
         # Check if trying to remove yourself
         if target_user.id == event.sender_id:
-            await event.reply("❌ You cannot remove yourself using this command!")
+            await reply(event, "❌ You cannot remove yourself using this command!")
             return
 
         try:
             # Remove the user from the group
             # The automatic ChatAction handler will detect this kick and send the goodbye message
-            await client.kick_participant(chat, target_user)
+            await kick_participant(client, chat, target_user)
             
             # Just confirm action to the admin - let automatic handler send goodbye message
-            await event.reply(f"✅ Successfully removed {target_user.first_name} from the group.")
+            await reply(event, f"✅ Successfully removed {target_user.first_name} from the group.")
             
             logger.info(f"Admin {event.sender_id} removed user {target_user.id} from {chat.id}")
             
         except Exception as e:
-            await event.reply(f"❌ Failed to remove user: {str(e)}")
+            await reply(event, f"❌ Failed to remove user: {str(e)}")
             logger.error(f"Failed to remove user {target_user.id}: {e}")